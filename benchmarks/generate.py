@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+生成合成的 ~/.timelog.json，供基准测试使用
+
+同样的条数、种子和结束日期总是生成同样的数据（结束日期是今天时，
+会话只铺到当前时间为止，因此还和生成的时刻有关）。会话按时间先后排列，
+最后一条在结束日期当天，这样"今天"、最近 N 天的统计都有数据；
+条数越多，每天的会话越密。
+
+用法:
+    python benchmarks/generate.py 100k -o ~/.timelog.json
+    python benchmarks/generate.py 1m --seed 7 --end 2026-01-31 -o big.json
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from timelog_engine import STATS_FORMAT, Session, rebuild_daily_stats
+
+DEFAULT_SEED = 20240101
+
+# 最多铺开这么多天（条数少时每天约 8 条）
+MAX_SPAN_DAYS = 20 * 365
+
+_TASKS = {
+    "study": ["学习Python", "阅读论文", "背单词", "刷算法题", "写读书笔记", "Online course", "复习数学"],
+    "game": ["原神", "王者荣耀", "Minecraft", "塞尔达", "象棋"],
+    "other": ["整理房间", "开会", "写周报", "健身", "做饭", "Email"]
+}
+_WEIGHTS = {"study": 5, "game": 2, "other": 3}
+
+def parse_count(text):
+    """解析条数，支持 1k、100k、1m 这样的写法"""
+    text = text.strip().lower()
+    scale = {"k": 1000, "m": 1000000}.get(text[-1:], 1)
+    number = text[:-1] if scale > 1 else text
+    return int(float(number) * scale)
+
+def generate(count, seed=DEFAULT_SEED, end=None, open_last=False):
+    """生成包含 count 条会话的数据 dict（结构同数据文件）
+
+    end 为最后一天（date，默认今天）；open_last 为真时最后一条会话未结束。
+    最后一天是今天时只铺到当前时间，不会生成开始于将来的会话。
+    """
+    rng = random.Random(seed)
+    end = end or date.today()
+    span = max(1, min(count // 8, MAX_SPAN_DAYS))
+    first = datetime.combine(end - timedelta(days=span - 1), datetime.min.time())
+    last = first + timedelta(days=span)
+    if end == date.today():
+        last = min(last, datetime.now().replace(microsecond=0))
+    # 每条会话占一个时间槽，时长为槽的 40%~90%
+    slot = (last - first) / max(count, 1)
+    categories = list(_WEIGHTS)
+    weights = list(_WEIGHTS.values())
+
+    sessions = []
+    for i in range(count):
+        category = rng.choices(categories, weights)[0]
+        start = first + slot * i + slot * rng.uniform(0, 0.1)
+        finish = start + slot * rng.uniform(0.4, 0.9)
+        sessions.append({
+            "id": i + 1,
+            "task": rng.choice(_TASKS[category]),
+            "category": category,
+            "start": start.replace(microsecond=0).isoformat(),
+            "end": finish.replace(microsecond=0).isoformat()
+        })
+    if open_last and sessions:
+        sessions[-1]["end"] = None
+
+    return {
+        "sessions": sessions,
+        "daily_stats": rebuild_daily_stats([Session.from_dict(s) for s in sessions]),
+        "next_id": count + 1,
+        "stats_format": STATS_FORMAT
+    }
+
+def write(data, path):
+    """按程序自己的格式写出数据文件"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+def main():
+    parser = argparse.ArgumentParser(description="生成合成的 TimeLog 数据文件")
+    parser.add_argument("count", help="会话条数，如 1k、100k、1m")
+    parser.add_argument("-o", "--output", default="timelog.json", help="输出文件")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="随机种子")
+    parser.add_argument("--end", type=date.fromisoformat, help="最后一天 (YYYY-MM-DD)，默认今天")
+    parser.add_argument("--open", action="store_true", help="最后一条会话保持进行中")
+    args = parser.parse_args()
+
+    data = generate(parse_count(args.count), args.seed, args.end, args.open)
+    path = os.path.expanduser(args.output)
+    write(data, path)
+    print(f"已生成 {len(data['sessions'])} 条会话: {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+TimeLog 基准测试
+
+在临时用户目录里依次生成各个规模的合成数据（见 generate.py），然后计时：
+- 存储: load_data、save_data
+- 统计: get_recent_stats
+- 网页（Flask 测试客户端）: 首页、统计、历史、分页接口、统计接口、导出 CSV、导出 PDF
+- 命令行（click CliRunner）: status、log、stats、start+stop
+
+每项先预热一次，再计时 --repeat 次（单项累计超过 --max-seconds 秒后提前停止），
+记录最小值、中位数和平均值（毫秒）。结果保存为 JSON；用 --baseline 指定之前
+保存的结果时逐项比较中位数，变慢超过阈值的列为回归，退出码为 1。
+
+用法:
+    python benchmarks/run.py
+    python benchmarks/run.py --sizes 1k,100k,1m --storage sqlite
+    python benchmarks/run.py --output benchmarks/baseline.json
+    python benchmarks/run.py --baseline benchmarks/baseline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+DEFAULT_SIZES = "1k,100k,1m"
+DEFAULT_REPEAT = 5
+DEFAULT_MAX_SECONDS = 10.0
+# 中位数变慢超过这个比例算回归
+DEFAULT_THRESHOLD = 0.25
+# 变慢的绝对值小于这么多毫秒时视为噪声
+NOISE_MS = 1.0
+
+STORAGE_MODES = ("json", "journal", "sqlite", "binary")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="TimeLog 基准测试")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="数据规模，逗号分隔，如 1k,100k,1m")
+    parser.add_argument("--storage", choices=STORAGE_MODES, default="json", help="存储模式")
+    parser.add_argument("--seed", type=int, help="生成数据的随机种子")
+    parser.add_argument("--active", action="store_true", help="最后一条会话保持进行中")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="每项计时次数")
+    parser.add_argument("--max-seconds", type=float, default=DEFAULT_MAX_SECONDS,
+                        help="单项累计计时超过这么多秒后不再重复")
+    parser.add_argument("--only", help="只运行名称包含这些文字的项目，逗号分隔")
+    parser.add_argument("--output", help="结果文件，默认 benchmarks/results/<存储模式>-<时间>.json")
+    parser.add_argument("--baseline", help="与之前保存的结果比较")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="中位数变慢超过这个比例算回归（默认 0.25）")
+    return parser.parse_args()
+
+# ---- 计时 ----
+
+def measure(func, setup=None, repeat=DEFAULT_REPEAT, max_seconds=DEFAULT_MAX_SECONDS):
+    """预热一次后计时 func，返回统计 dict（毫秒）
+
+    setup 在每次调用前执行，不计入时间。
+    """
+    if setup:
+        setup()
+    func()
+
+    timings = []
+    total = 0.0
+    while len(timings) < repeat and (not timings or total < max_seconds):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        timings.append(elapsed * 1000)
+        total += elapsed
+    return {
+        "runs": len(timings),
+        "min_ms": round(min(timings), 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "mean_ms": round(statistics.mean(timings), 3)
+    }
+
+def page(client, path):
+    """用测试客户端请求一个页面或接口，读完整个响应"""
+    def run():
+        response = client.get(path)
+        response.get_data()
+        assert response.status_code == 200, f"{path}: {response.status_code}"
+    return run
+
+def command(runner, cli, args, input=None):
+    """用 CliRunner 执行一个命令"""
+    def run():
+        result = runner.invoke(cli, args, input=input)
+        assert result.exit_code == 0, f"{' '.join(args)}: {result.output}"
+    return run
+
+def build_cases():
+    """返回 [(名称, 函数, 准备函数)]，需要在设置好 HOME 之后调用"""
+    from click.testing import CliRunner
+    import timelog_store
+    import timelog_simple
+    import web_server
+    from timelog_report import missing_libraries
+
+    client = web_server.app.test_client()
+    runner = CliRunner()
+    cli = timelog_simple.cli
+    store = web_server.store
+
+    def new_report():
+        # PDF 报告按数据版本缓存，每次先让版本号变化，测的是生成报告本身
+        with store.lock:
+            store._changed("reload", None)
+
+    def start_stop():
+        command(runner, cli, ["start", "基准测试"], input="y\n")()
+        command(runner, cli, ["stop"])()
+
+    cases = [
+        ("load_data", timelog_store.load_data, None),
+        ("get_recent_stats(7)", lambda: web_server.get_recent_stats(7), None),
+        ("get_recent_stats(90)", lambda: web_server.get_recent_stats(90), None),
+        ("GET /", page(client, "/"), None),
+        ("GET /stats?days=30", page(client, "/stats?days=30"), None),
+        ("GET /stats?days=all", page(client, "/stats?days=all"), None),
+        ("GET /history", page(client, "/history"), None),
+        ("GET /api/sessions", page(client, "/api/sessions?limit=200"), None),
+        ("GET /api/stats_data?days=90", page(client, "/api/stats_data?days=90"), None),
+        ("GET /api/stats_data?days=365", page(client, "/api/stats_data?days=365&group=week"), None),
+        ("GET /api/export_data?all=1", page(client, "/api/export_data?format=csv&all=1"), None),
+    ]
+    if not missing_libraries():
+        cases.append(("GET /api/export_pdf?days=30", page(client, "/api/export_pdf?days=30"), new_report))
+    cases += [
+        ("cli status", command(runner, cli, ["status"]), None),
+        ("cli log", command(runner, cli, ["log"]), None),
+        ("cli stats", command(runner, cli, ["stats"]), None),
+        # 以下会修改数据，放在最后
+        ("save_data", lambda: timelog_store.save_data(store.get()), None),
+        ("cli start+stop", start_stop, None),
+    ]
+    return cases
+
+def prepare(count, seed, storage, active):
+    """生成数据写入临时用户目录，返回 (生成耗时秒数, 数据文件字节数)"""
+    import timelog_store
+    import web_server
+    from generate import generate, write
+
+    started = time.perf_counter()
+    data = generate(count, seed, open_last=active)
+    timelog_store.clear_data()
+    write(data, timelog_store.DATA_FILE)
+    if storage in ("sqlite", "binary"):
+        timelog_store.migrate_json(storage)
+    web_server.store.invalidate()
+    elapsed = time.perf_counter() - started
+
+    size = sum(os.path.getsize(path) for path in timelog_store._data_files() if os.path.exists(path))
+    return elapsed, size
+
+# ---- 结果 ----
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline, threshold):
+    """逐项比较中位数，返回 (回归列表, 变快列表)，每项为 (规模, 名称, 基准, 当前)"""
+    regressions = []
+    improvements = []
+    for label, size in results["sizes"].items():
+        base_cases = baseline.get("sizes", {}).get(label, {}).get("cases", {})
+        for name, current in size["cases"].items():
+            base = base_cases.get(name)
+            if base is None:
+                continue
+            before, after = base["median_ms"], current["median_ms"]
+            if after > before * (1 + threshold) and after - before > NOISE_MS:
+                regressions.append((label, name, before, after))
+            elif before > after * (1 + threshold) and before - after > NOISE_MS:
+                improvements.append((label, name, before, after))
+    return regressions, improvements
+
+def main():
+    args = parse_args()
+
+    # 没有中文字体时 matplotlib 每个字都会警告，不影响计时
+    warnings.filterwarnings("ignore", message="Glyph .* missing from font")
+
+    # 数据文件路径和存储模式在导入时确定，先设置好环境变量
+    home = tempfile.mkdtemp(prefix="timelog-bench-")
+    os.environ["HOME"] = os.environ["USERPROFILE"] = home
+    os.environ["TIMELOG_STORAGE"] = args.storage
+    sys.path.insert(0, ROOT)
+
+    from generate import DEFAULT_SEED, parse_count
+    import web_server
+
+    seed = DEFAULT_SEED if args.seed is None else args.seed
+    only = [word.strip() for word in args.only.split(",")] if args.only else None
+    results = {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "storage": args.storage,
+            "seed": seed,
+            "active": args.active,
+            "repeat": args.repeat
+        },
+        "sizes": {}
+    }
+
+    try:
+        cases = build_cases()
+        for label in [text.strip() for text in args.sizes.split(",") if text.strip()]:
+            count = parse_count(label)
+            generate_seconds, file_bytes = prepare(count, seed, args.storage, args.active)
+            print(f"\n📦 {label}: {count} 条会话，数据文件 {file_bytes / 1024 / 1024:.1f} MB，"
+                  f"生成用时 {generate_seconds:.1f} 秒")
+            size = results["sizes"][label] = {
+                "sessions": count,
+                "file_bytes": file_bytes,
+                "generate_s": round(generate_seconds, 3),
+                "cases": {}
+            }
+            for name, func, setup in cases:
+                if only and not any(word in name for word in only):
+                    continue
+                stats = measure(func, setup, args.repeat, args.max_seconds)
+                size["cases"][name] = stats
+                print(f"  {name:<32} 中位数 {stats['median_ms']:>10.1f} ms   "
+                      f"最小 {stats['min_ms']:>10.1f} ms   ({stats['runs']} 次)")
+    finally:
+        web_server.report_jobs.shutdown()
+        shutil.rmtree(home, ignore_errors=True)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{args.storage}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"\n💾 结果已保存: {output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions, improvements = compare(results, baseline, args.threshold)
+        for label, name, before, after in improvements:
+            print(f"✅ 变快 {label} {name}: {before:.1f} → {after:.1f} ms")
+        for label, name, before, after in regressions:
+            print(f"❌ 回归 {label} {name}: {before:.1f} → {after:.1f} ms (+{(after / before - 1) * 100:.0f}%)")
+        if regressions:
+            sys.exit(1)
+        print(f"✅ 与基准 {args.baseline} 相比没有回归（阈值 {args.threshold:.0%}）")
+
+if __name__ == "__main__":
+    main()
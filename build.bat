@@ -41,12 +41,14 @@ if not exist deploy\timelog mkdir deploy\timelog
 :: 清理旧的部署文件
 echo Cleaning old deployment files...
 if exist deploy\timelog\timelog.exe del deploy\timelog\timelog.exe
+if exist deploy\timelog\_internal rmdir /s /q deploy\timelog\_internal
 if exist deploy\timelog\start_web.bat del deploy\timelog\start_web.bat
 if exist deploy\timelog\timelog-start-web.bat del deploy\timelog\timelog-start-web.bat
 
 :: 复制可执行文件到deploy目录
 echo Creating deployment files...
-copy dist\timelog.exe deploy\timelog\ >nul
+:: 目录模式：timelog.exe 和 _internal 目录需要放在一起
+xcopy /E /I /Y dist\timelog deploy\timelog >nul
 
 :: 复制templates和static文件夹
 echo Copying web assets...
@@ -87,6 +89,7 @@ echo.
 echo Build completed successfully!
 echo Deployment files in deploy\timelog\ directory:
 echo   timelog.exe               - Main executable
+echo   _internal\                - Libraries used by timelog.exe
 echo   timelog-start-web.bat     - Web interface launcher
 echo   timelog-install.bat       - Add to system PATH
 echo   timelog-uninstall.bat     - Remove from PATH
@@ -3,6 +3,9 @@
 // 全局变量
 let currentStatus = null;
 let statusUpdateInterval = null;
+let statusTickInterval = null;
+let statusReceivedAt = null;
+let eventSource = null;
 
 // 页面加载完成后初始化
 document.addEventListener('DOMContentLoaded', function() {
@@ -11,49 +14,104 @@ document.addEventListener('DOMContentLoaded', function() {
 
 // 初始化应用
 function initializeApp() {
-    updateNavbarStatus();
+    // 优先使用服务器推送，不支持时每30秒轮询一次状态
+    if (window.EventSource) {
+        connectEvents();
+    } else {
+        startStatusPolling();
+    }
     
-    // 每30秒更新一次状态
-    statusUpdateInterval = setInterval(updateNavbarStatus, 30000);
+    // 进行中任务的时长在本地每分钟刷新，不再请求服务器
+    statusTickInterval = setInterval(renderNavbarStatus, 60000);
     
     // 设置Toast容器
     initializeToast();
 }
 
+// 连接状态推送，数据变化时立即更新
+function connectEvents() {
+    eventSource = new EventSource('/api/events');
+    
+    eventSource.addEventListener('status', function(event) {
+        const message = JSON.parse(event.data);
+        setNavbarStatus(message.status);
+    });
+    
+    eventSource.addEventListener('change', function(event) {
+        const message = JSON.parse(event.data);
+        setNavbarStatus(message.status);
+        // 通知页面（例如仪表板）数据已变化
+        document.dispatchEvent(new CustomEvent('timelog:change', { detail: message }));
+    });
+    
+    eventSource.onerror = function() {
+        // 浏览器会自动重连；连接被彻底关闭时（包括服务器推送连接已满、
+        // 返回 503）改为轮询
+        if (eventSource.readyState === EventSource.CLOSED) {
+            eventSource = null;
+            startStatusPolling();
+        }
+    };
+}
+
+// 轮询状态（推送不可用时使用）
+function startStatusPolling() {
+    updateNavbarStatus();
+    if (!statusUpdateInterval) {
+        statusUpdateInterval = setInterval(updateNavbarStatus, 30000);
+    }
+}
+
 // 更新导航栏状态显示
 function updateNavbarStatus() {
     fetch('/api/current_status')
         .then(response => response.json())
         .then(data => {
-            currentStatus = data;
-            const statusElement = document.getElementById('navbar-status');
-            
-            if (data.active) {
-                const categoryMap = {
-                    'study': '📚 学习',
-                    'game': '🎮 游戏',
-                    'other': '📋 其他'
-                };
-                
-                statusElement.innerHTML = `
-                    <span class="badge bg-success">
-                        <i class="bi bi-play-circle-fill"></i>
-                        ${categoryMap[data.category]} - ${data.duration}分钟
-                    </span>
-                `;
-            } else {
-                statusElement.innerHTML = `
-                    <span class="badge bg-secondary">
-                        <i class="bi bi-pause-circle"></i> 空闲
-                    </span>
-                `;
-            }
+            setNavbarStatus(data);
         })
         .catch(error => {
             console.error('获取状态失败:', error);
         });
 }
 
+// 保存服务器返回的状态并显示
+function setNavbarStatus(data) {
+    currentStatus = data;
+    statusReceivedAt = Date.now();
+    renderNavbarStatus();
+}
+
+// 显示导航栏状态，时长按收到状态后经过的时间推算
+function renderNavbarStatus() {
+    const data = currentStatus;
+    const statusElement = document.getElementById('navbar-status');
+    if (!data || !statusElement) {
+        return;
+    }
+    
+    if (data.active) {
+        const categoryMap = {
+            'study': '📚 学习',
+            'game': '🎮 游戏',
+            'other': '📋 其他'
+        };
+        const duration = (data.duration + (Date.now() - statusReceivedAt) / 60000).toFixed(1);
+        
+        statusElement.innerHTML = `
+            <span class="badge bg-success">
+                <i class="bi bi-play-circle-fill"></i>
+                ${categoryMap[data.category]} - ${duration}分钟
+            </span>
+        `;
+    } else {
+        statusElement.innerHTML = `
+            <span class="badge bg-secondary">
+                <i class="bi bi-pause-circle"></i> 空闲
+            </span>
+        `;
+    }
+}
+
 // 显示Toast通知
 function showToast(message, type = 'info') {
     const toast = document.getElementById('notification-toast');
@@ -264,6 +322,12 @@ window.addEventListener('beforeunload', function() {
     if (statusUpdateInterval) {
         clearInterval(statusUpdateInterval);
     }
+    if (statusTickInterval) {
+        clearInterval(statusTickInterval);
+    }
+    if (eventSource) {
+        eventSource.close();
+    }
 });
 
 // 错误处理
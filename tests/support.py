@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+测试共用的准备工作
+
+导入本模块时把用户目录换成临时目录（数据文件路径在导入 timelog_store 时
+确定；Windows 下 expanduser 读的是 USERPROFILE），测试不会动到自己的数据。
+测试模块应当在导入 timelog_store、web_server 之前先导入本模块。
+"""
+
+import os
+import sys
+import tempfile
+from unittest import mock
+
+HOME = tempfile.mkdtemp(prefix="timelog-test-")
+os.environ["HOME"] = os.environ["USERPROFILE"] = HOME
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import timelog_store
+
+STORAGE_MODES = ("json", "journal", "sqlite", "binary")
+
+# 数据目录下的各个文件
+PATH_NAMES = ("DATA_FILE", "JOURNAL_FILE", "DB_FILE", "BIN_FILE", "LOCK_FILE", "CURRENT_FILE")
+
+def temp_store(testcase, mode):
+    """本测试中 timelog_store 在新的临时目录里按 mode 存储模式读写，返回该目录
+
+    测试结束时恢复原来的路径和存储模式。
+    """
+    directory = tempfile.mkdtemp(prefix="timelog-test-")
+    patches = [mock.patch.object(timelog_store, "STORAGE_MODE", mode)]
+    for name in PATH_NAMES:
+        path = os.path.join(directory, os.path.basename(getattr(timelog_store, name)))
+        patches.append(mock.patch.object(timelog_store, name, path))
+    for patch in patches:
+        patch.start()
+        testcase.addCleanup(patch.stop)
+    # sqlite 连接按线程缓存，换目录前后都要关掉
+    timelog_store._sqlite_close()
+    testcase.addCleanup(timelog_store._sqlite_close)
+    return directory
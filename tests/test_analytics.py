@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+向量化统计的测试：python -m pytest tests 或 python -m unittest discover tests
+"""
+
+import random
+import unittest
+from datetime import datetime, timedelta
+
+import support
+import timelog_analytics
+import timelog_engine
+import timelog_store
+from timelog_engine import Session, diff_daily_stats
+
+def random_sessions(count, seed=1):
+    """随机会话，包括跨零点、跨多天、恰好在零点结束和长度为 0 的会话"""
+    rng = random.Random(seed)
+    sessions = []
+    start = datetime(2024, 12, 30, 6, 0)
+    for session_id in range(1, count + 1):
+        start += timedelta(minutes=rng.randint(0, 900))
+        length = rng.choice([0, 30, 90, 240, 600, 3000])
+        end = start + timedelta(minutes=length)
+        if rng.random() < 0.05:
+            end = datetime.combine(end.date(), datetime.min.time())
+        sessions.append(Session(session_id, "t", rng.choice(timelog_engine.CATEGORIES),
+                                start.isoformat(), max(start, end).isoformat()))
+    return sessions
+
+@unittest.skipUnless(timelog_analytics.available(), "需要 numpy")
+class RebuildDailyStatsTest(unittest.TestCase):
+
+    def assertSameStats(self, sessions):
+        expected = timelog_engine.rebuild_daily_stats(sessions)
+        actual = timelog_analytics.rebuild_daily_stats(sessions)
+        self.assertEqual(diff_daily_stats(expected, actual), [])
+
+    def test_matches_engine(self):
+        sessions = random_sessions(2000)
+        # 正在进行的会话不计入
+        sessions.append(Session(len(sessions) + 1, "live", "study", datetime.now().isoformat()))
+        self.assertSameStats(sessions)
+
+    def test_other_categories(self):
+        sessions = random_sessions(50)
+        sessions[3]["category"] = "阅读"
+        self.assertSameStats(sessions)
+
+    def test_empty(self):
+        self.assertEqual(timelog_analytics.rebuild_daily_stats([]), {})
+        open_only = [Session(1, "live", "game", "2025-01-01T10:00:00")]
+        self.assertEqual(timelog_analytics.rebuild_daily_stats(open_only), {})
+
+    def test_binary_columns(self):
+        support.temp_store(self, "binary")
+        sessions = random_sessions(500)
+        timelog_store._save_data({"sessions": sessions, "daily_stats": timelog_engine.rebuild_daily_stats(sessions),
+                                  "next_id": len(sessions) + 1, "stats_format": timelog_engine.STATS_FORMAT})
+        loaded = timelog_store.load_data()["sessions"]
+        self.assertIsNotNone(loaded.columns())
+        self.assertSameStats(loaded)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+条件 GET 的测试：python -m pytest tests 或 python -m unittest discover tests
+
+在临时用户目录中运行（见 support），不会动到自己的数据。
+"""
+
+import time
+import unittest
+from datetime import date, timedelta
+from unittest import mock
+
+import support  # noqa: F401  先换掉用户目录
+import web_server
+
+class TomorrowDate(date):
+    """date.today() 返回明天，模拟过了零点"""
+
+    @classmethod
+    def today(cls):
+        return date.today() + timedelta(days=1)
+
+class ConditionalGetTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = web_server.app.test_client()
+        response = cls.client.post("/api/sessions/bulk", json=[
+            {"task": "读书", "category": "study", "start": "2025-01-01T09:00:00", "end": "2025-01-01T10:00:00"}])
+        assert response.json["success"], response.json
+        # Last-Modified 要等数据文件修改满一秒才发送
+        time.sleep(1.1)
+
+    def test_not_modified(self):
+        first = self.client.get("/stats?days=7")
+        self.assertIn("Last-Modified", first.headers)
+        response = self.client.get("/stats?days=7", headers={"If-None-Match": first.headers["ETag"]})
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get("/stats?days=7",
+                                   headers={"If-Modified-Since": first.headers["Last-Modified"]})
+        self.assertEqual(response.status_code, 304)
+
+    def test_midnight_rollover(self):
+        first = self.client.get("/")
+        with mock.patch.object(web_server, "date", TomorrowDate):
+            response = self.client.get("/", headers={"If-Modified-Since": first.headers["Last-Modified"]})
+            self.assertEqual(response.status_code, 200)
+            response = self.client.get("/", headers={"If-None-Match": first.headers["ETag"]})
+            self.assertEqual(response.status_code, 200)
+
+if __name__ == "__main__":
+    unittest.main()
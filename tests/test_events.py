@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+状态推送（/api/events）的测试：python -m pytest tests 或 python -m unittest discover tests
+"""
+
+import unittest
+from unittest import mock
+
+import support  # noqa: F401  先换掉用户目录
+import web_server
+
+class EventStreamLimitTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = web_server.app.test_client()
+        patch = mock.patch.object(web_server, "event_slots", None)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def open_stream(self):
+        response = self.client.get("/api/events", buffered=False)
+        self.addCleanup(response.close)
+        return response
+
+    def test_limit(self):
+        web_server.limit_event_streams(1)
+        first = self.open_stream()
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(next(first.response).strip(), b"retry: 5000")
+
+        second = self.open_stream()
+        self.assertEqual(second.status_code, 503)
+        self.assertFalse(second.json["success"])
+
+        # 关闭后名额归还
+        first.close()
+        self.assertEqual(self.open_stream().status_code, 200)
+
+    def test_disabled(self):
+        web_server.limit_event_streams(0)
+        self.assertEqual(self.open_stream().status_code, 503)
+        # 普通请求不受影响
+        self.assertEqual(self.client.get("/api/current_status").status_code, 200)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+批量导入的测试：python -m pytest tests 或 python -m unittest discover tests
+
+在临时用户目录中运行（见 support），不会动到自己的数据。
+"""
+
+import unittest
+
+import support  # noqa: F401  先换掉用户目录
+import web_server
+from timelog_import import InvalidImport, decode
+
+# 既不是 UTF-8 也不是 GBK 的字节
+UNDECODABLE = b"\xff\xfe\xfa"
+
+class DecodeTest(unittest.TestCase):
+
+    def test_utf8_and_gbk(self):
+        text = "开始日期,任务"
+        self.assertEqual(decode(("\ufeff" + text).encode("utf-8")), text)
+        self.assertEqual(decode(text.encode("gbk")), text)
+
+    def test_undecodable(self):
+        with self.assertRaises(InvalidImport) as cm:
+            decode(UNDECODABLE)
+        self.assertIn("文件编码无法识别", str(cm.exception))
+
+class BulkImportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = web_server.app.test_client()
+
+    def test_undecodable_body(self):
+        response = self.client.post("/api/sessions/bulk?format=csv", data=UNDECODABLE,
+                                    content_type="text/csv")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.json["success"])
+        self.assertIn("文件编码无法识别", response.json["message"])
+
+    def test_invalid_records_not_imported(self):
+        before = len(web_server.store.get()["sessions"])
+        response = self.client.post("/api/sessions/bulk", json=[{"task": "x", "category": "study"}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json["error_count"], 1)
+        self.assertEqual(len(web_server.store.get()["sessions"]), before)
+
+    def test_import(self):
+        response = self.client.post("/api/sessions/bulk", json=[
+            {"task": "读书", "category": "study", "start": "2025-01-01T09:00:00", "end": "2025-01-01T10:30:00"}])
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json["success"])
+        self.assertEqual(response.json["imported"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+日志存储（journal、binary 模式）的测试：python -m pytest tests 或 python -m unittest discover tests
+"""
+
+import json
+import unittest
+from unittest import mock
+
+import support
+import timelog_store
+from timelog_engine import Session, merge_delta, session_delta, update_daily_stats
+from timelog_import import add_sessions
+
+def dump(data):
+    """会话和每日统计的普通 dict 形式，便于比较"""
+    return [session.to_dict() for session in data["sessions"]], data["daily_stats"]
+
+class JournalTest(unittest.TestCase):
+
+    mode = "journal"
+
+    def setUp(self):
+        support.temp_store(self, self.mode)
+
+    def start(self, task, start):
+        with timelog_store.transaction() as data:
+            session = Session(timelog_store.new_session_id(data), task, "study", start)
+            data["sessions"].append(session)
+            timelog_store.record_change(data, "start", session)
+        return session["id"]
+
+    def stop(self, end):
+        with timelog_store.transaction() as data:
+            session = timelog_store.find_open_session(data["sessions"])
+            session["end"] = end
+            delta = update_daily_stats(data, session)
+            timelog_store.record_change(data, "stop", session, delta=delta)
+
+    def journal_lines(self):
+        with open(timelog_store.JOURNAL_FILE, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def test_replay(self):
+        self.start("a", "2025-03-01T09:00:00")
+        self.stop("2025-03-01T10:30:00")
+        with timelog_store.transaction() as data:
+            added, delta = add_sessions(data, [
+                {"task": f"导入{i}", "category": "game", "start": f"2025-02-{i:02d}T20:00:00",
+                 "end": f"2025-02-{i:02d}T21:00:00"} for i in range(1, 6)])
+            timelog_store.record_import(data, added, delta)
+        with timelog_store.transaction() as data:
+            # 改成跨零点的会话
+            index = 2
+            old = data["sessions"][index]
+            new = Session(old["id"], "改过", "other", "2025-02-02T23:00:00", "2025-02-03T01:00:00")
+            data["sessions"][index] = new
+            delta = merge_delta(session_delta(old, -1), session_delta(new))
+            timelog_store.apply_delta(data, delta)
+            timelog_store.record_change(data, "edit", new, index=index, delta=delta)
+        with timelog_store.transaction() as data:
+            session = data["sessions"].pop(1)
+            delta = session_delta(session, -1)
+            timelog_store.apply_delta(data, delta)
+            timelog_store.record_change(data, "delete", session, index=1, delta=delta)
+        with timelog_store.transaction() as data:
+            session = Session(timelog_store.new_session_id(data), "b", "study", "2025-03-02T08:00:00")
+            data["sessions"].append(session)
+            timelog_store.record_change(data, "start", session)
+        expected = dump(data)
+
+        # 快照里还什么都没有，全部来自日志回放
+        self.assertEqual(timelog_store._read_snapshot()["sessions"], [])
+        self.assertEqual([line.get("op") for line in self.journal_lines()],
+                         [None, "start", "stop", "import", "edit", "delete", "start"])
+        data = timelog_store.load_data()
+        self.assertEqual(dump(data), expected)
+        self.assertEqual(data["daily_stats"]["2025-02-03"]["other"], 60)
+        self.assertEqual(timelog_store.find_open_session(data["sessions"])["task"], "b")
+        self.assertEqual(timelog_store.new_session_id(data), 8)
+
+    def test_torn_tail_then_append(self):
+        self.start("a", "2025-03-01T09:00:00")
+        # 模拟写入中途崩溃：最后一行只写了一半，没有换行
+        with open(timelog_store.JOURNAL_FILE, "a", encoding="utf-8") as f:
+            f.write('{"op":"stop","end":"2025-03-01T09:')
+        self.stop("2025-03-01T10:00:00")
+        self.start("b", "2025-03-01T11:00:00")
+
+        data = timelog_store.load_data()
+        a, b = data["sessions"]
+        self.assertEqual((a["task"], a["end"]), ("a", "2025-03-01T10:00:00"))
+        self.assertEqual((b["task"], b["end"]), ("b", None))
+        self.assertEqual(data["daily_stats"]["2025-03-01"]["study"], 60)
+
+    def test_torn_tail_only(self):
+        self.start("a", "2025-03-01T09:00:00")
+        with open(timelog_store.JOURNAL_FILE, "a", encoding="utf-8") as f:
+            f.write('{"op":"start","s":{"id":2,"task":"b')
+        data = timelog_store.load_data()
+        self.assertEqual([session["task"] for session in data["sessions"]], ["a"])
+
+    def test_compaction(self):
+        with mock.patch.object(timelog_store, "JOURNAL_COMPACT_BYTES", 1024):
+            for day in range(1, 21):
+                self.start(f"任务{day}", f"2025-03-{day:02d}T09:00:00")
+                self.stop(f"2025-03-{day:02d}T10:00:00")
+        lines = self.journal_lines()
+        generation = lines[0]["gen"]
+        # 压缩过至少一次，日志只剩上次压缩之后的记录
+        self.assertGreater(generation, 0)
+        self.assertLess(len(lines), 41)
+        snapshot = timelog_store._read_snapshot()
+        self.assertEqual(snapshot["journal_gen"], generation)
+        self.assertEqual(len(snapshot["sessions"]) + [line.get("op") for line in lines].count("start"), 20)
+
+        data = timelog_store.load_data()
+        self.assertEqual([session["task"] for session in data["sessions"]], [f"任务{day}" for day in range(1, 21)])
+        self.assertEqual(sum(day["study"] for day in data["daily_stats"].values()), 20 * 60)
+
+        # 手动压缩后日志只剩文件头，代号和快照一致
+        timelog_store.compact(data)
+        self.assertEqual(self.journal_lines(), [{"gen": generation + 1}])
+        self.assertEqual(dump(timelog_store.load_data()), dump(data))
+
+    def test_stale_journal_ignored(self):
+        self.start("a", "2025-03-01T09:00:00")
+        self.stop("2025-03-01T10:00:00")
+        with open(timelog_store.JOURNAL_FILE, "rb") as f:
+            stale = f.read()
+        timelog_store.compact(timelog_store.load_data())
+        # 模拟快照写完、旧日志还没换掉时崩溃：旧日志的记录已经在快照里了
+        with open(timelog_store.JOURNAL_FILE, "wb") as f:
+            f.write(stale)
+        data = timelog_store.load_data()
+        self.assertEqual(len(data["sessions"]), 1)
+        self.assertEqual(data["daily_stats"]["2025-03-01"]["study"], 60)
+
+        # 之后的追加按快照的代号开始新日志
+        self.start("b", "2025-03-01T11:00:00")
+        self.assertEqual([session["task"] for session in timelog_store.load_data()["sessions"]], ["a", "b"])
+
+class BinaryJournalTest(JournalTest):
+    """binary 模式：列式快照 + 同样的日志"""
+
+    mode = "binary"
+
+if __name__ == "__main__":
+    unittest.main()
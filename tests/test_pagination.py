@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+按 (开始时间, id) 游标分页的测试：python -m pytest tests 或 python -m unittest discover tests
+"""
+
+import random
+import unittest
+from unittest import mock
+
+import support
+import timelog_store
+import web_server
+from timelog_engine import Session, merge_delta, session_delta, session_key
+from timelog_import import add_sessions
+
+def random_sessions(count, seed=1):
+    """开始时间只取少数几个值，大量会话的开始时间相同，要靠 id 区分先后"""
+    rng = random.Random(seed)
+    sessions = []
+    for _ in range(count):
+        start = f"2025-03-{rng.randint(1, 6):02d}T{rng.choice([8, 12, 20]):02d}:00:00"
+        sessions.append({"task": rng.choice(["Read", "read book", "代码", "Game"]),
+                         "category": rng.choice(["study", "game", "other"]),
+                         "start": start, "end": start[:11] + "23:00:00"})
+    return sessions
+
+def walk(page, limit=7, **filters):
+    """按上一页最后一条翻页，返回依次得到的会话 id"""
+    ids = []
+    before = None
+    while True:
+        sessions = page(before=before, limit=limit, **filters)
+        ids += [session["id"] for session in sessions]
+        if len(sessions) < limit:
+            return ids
+        before = (sessions[-1]["start"], sessions[-1]["id"])
+
+class PaginationTest(unittest.TestCase):
+
+    FILTERS = ({}, {"category": "game"}, {"q": "READ"}, {"category": "study", "q": "代码"})
+
+    def build(self, mode):
+        """导入、删除、压缩之后再修改和追加，返回缓存了修改的 DataStore"""
+        support.temp_store(self, mode)
+        store = timelog_store.DataStore()
+        with store.transaction() as data:
+            added, delta = add_sessions(data, random_sessions(300))
+            store.record_import(added, delta)
+        with store.transaction() as data:
+            session = store.find_session(10)
+            delta = session_delta(session, -1)
+            timelog_store.apply_delta(data, delta)
+            index = store.position(session)
+            data["sessions"].pop(index)
+            store.record_change("delete", session, index=index, delta=delta)
+        if mode in ("journal", "binary"):
+            timelog_store.compact(store.get())
+            store.invalidate()
+
+        # binary 模式下这些修改落在快照之外：改过的行和追加的会话
+        with store.transaction() as data:
+            for session_id, start in ((3, "2025-03-04T12:00:00"), (150, "2025-02-28T08:00:00"),
+                                      (299, "2025-03-07T20:00:00")):
+                old = store.find_session(session_id)
+                new = Session(session_id, "edited", old["category"], start, start[:11] + "23:00:00")
+                index = store.position(old)
+                data["sessions"][index] = new
+                delta = merge_delta(session_delta(old, -1), session_delta(new))
+                timelog_store.apply_delta(data, delta)
+                store.record_change("edit", new, index=index, delta=delta)
+            for start in ("2025-03-02T12:00:00", "2025-03-06T20:00:00", "2025-03-09T08:00:00"):
+                session = Session(timelog_store.new_session_id(data), "read more", "study", start)
+                session["end"] = start[:11] + "22:00:00"
+                data["sessions"].append(session)
+                delta = session_delta(session)
+                timelog_store.apply_delta(data, delta)
+                store.record_change("create", session, delta=delta)
+            session = Session(timelog_store.new_session_id(data), "game", "game", "2025-03-05T08:00:00")
+            data["sessions"].append(session)
+            store.record_change("start", session)
+
+        if mode == "binary":
+            sessions = store.get()["sessions"]
+            self.assertIsNotNone(sessions.before(None))
+            self.assertIsNone(sessions.columns())
+        return store
+
+    def expected(self, category=None, q=None):
+        match = timelog_store.session_filter(category, q)
+        sessions = timelog_store.load_data()["sessions"]
+        return [session["id"] for session in sorted(filter(match, sessions), key=session_key, reverse=True)]
+
+    def test_walk(self):
+        for mode in support.STORAGE_MODES:
+            with self.subTest(mode=mode):
+                store = self.build(mode)
+                self.assertEqual(len(self.expected()), 303)
+                for filters in self.FILTERS:
+                    expected = self.expected(**filters)
+                    # 缓存了修改的进程、重新加载（回放日志）的进程、不经缓存的查询
+                    self.assertEqual(walk(store.page_sessions, **filters), expected)
+                    self.assertEqual(walk(timelog_store.DataStore().page_sessions, **filters), expected)
+                    self.assertEqual(walk(timelog_store.page_sessions, **filters), expected)
+                self.assertEqual(walk(store.page_sessions, limit=1000), self.expected())
+                self.assertEqual(walk(store.page_sessions, limit=1), self.expected())
+
+    def test_api(self):
+        for mode in support.STORAGE_MODES:
+            with self.subTest(mode=mode):
+                store = self.build(mode)
+                client = web_server.app.test_client()
+                with mock.patch.object(web_server, "store", store):
+                    for filters in self.FILTERS:
+                        ids = []
+                        cursor = None
+                        while True:
+                            query = dict(filters, limit=37)
+                            if cursor:
+                                query["cursor"] = cursor
+                            response = client.get("/api/sessions", query_string=query).json
+                            self.assertTrue(response["success"])
+                            ids += [session["id"] for session in response["sessions"]]
+                            cursor = response["next_cursor"]
+                            if not cursor:
+                                break
+                        self.assertEqual(ids, self.expected(**filters))
+
+if __name__ == "__main__":
+    unittest.main()
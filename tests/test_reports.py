@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+PDF报告任务的测试：python -m pytest tests 或 python -m unittest discover tests
+"""
+
+import threading
+import unittest
+from unittest import mock
+
+import support  # noqa: F401  先换掉用户目录
+import web_server
+from timelog_report import ReportJobs, missing_libraries
+
+class ReportJobsShutdownTest(unittest.TestCase):
+
+    def test_cancelled_jobs_fail(self):
+        jobs = ReportJobs()
+        release = threading.Event()
+        running = jobs.submit("a", "a.pdf", lambda progress: release.wait(5) and b"%PDF")
+        queued = jobs.submit("b", "b.pdf", lambda progress: b"%PDF")
+
+        stopper = threading.Thread(target=jobs.shutdown)
+        stopper.start()
+        # 排队的任务被取消，等待它的请求不会一直挂着
+        self.assertTrue(jobs.wait(queued, 5)["done"].is_set())
+        self.assertEqual(queued["status"], "error")
+
+        release.set()
+        stopper.join(5)
+        self.assertEqual(running["status"], "done")
+
+        late = jobs.submit("c", "c.pdf", lambda progress: b"%PDF")
+        self.assertEqual(late["status"], "error")
+        self.assertTrue(late["done"].is_set())
+
+@unittest.skipIf(missing_libraries(), "需要 reportlab 和 matplotlib")
+class ExportTimeoutTest(unittest.TestCase):
+
+    def test_timeout(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        with mock.patch.object(web_server, "report_jobs", ReportJobs()), \
+                mock.patch.object(web_server, "REPORT_WAIT_SECONDS", 0.05), \
+                mock.patch.object(web_server, "render_pdf", lambda *args: release.wait(5) and b"%PDF"):
+            response = web_server.app.test_client().get("/api/export_pdf?days=7")
+        self.assertFalse(response.json["success"])
+        self.assertIn("超时", response.json["message"])
+
+class ReportJobsDisabledTest(unittest.TestCase):
+
+    def test_multiple_workers_fall_back_to_export(self):
+        client = web_server.app.test_client()
+        with mock.patch.object(web_server, "report_jobs_enabled", False):
+            response = client.post("/api/reports?days=7")
+        self.assertFalse(response.json["success"])
+        self.assertEqual(response.json["export_url"], "/api/export_pdf?days=7")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+分层汇总（StatsRollup）的测试：python -m pytest tests 或 python -m unittest discover tests
+"""
+
+import random
+import unittest
+from datetime import date, timedelta
+
+import support  # noqa: F401  把仓库目录加入 sys.path
+from timelog_engine import GROUPS, StatsRollup, bucket_key, empty_stats
+
+def random_daily_stats(seed=1, days=900):
+    rng = random.Random(seed)
+    start = date(2023, 11, 20)
+    stats = {}
+    for offset in range(days):
+        if rng.random() < 0.7:
+            day = start + timedelta(days=offset)
+            stats[day.isoformat()] = {category: rng.choice([0, 15, 60, 130.5]) for category in empty_stats()}
+    return stats
+
+class StatsRollupTest(unittest.TestCase):
+
+    def test_grouped_matches_brute_force(self):
+        daily = random_daily_stats()
+        rollup = StatsRollup(daily)
+        rng = random.Random(2)
+        for _ in range(300):
+            start = date(2023, 11, 1) + timedelta(days=rng.randint(0, 950))
+            end = start + timedelta(days=rng.randint(0, 400))
+            group = rng.choice(GROUPS)
+            expected = {}
+            day = start
+            while day <= end:
+                bucket = expected.setdefault(bucket_key(day, group), empty_stats())
+                for category, value in daily.get(day.isoformat(), {}).items():
+                    bucket[category] += value
+                day += timedelta(days=1)
+            actual = rollup.grouped(start, end, group)
+            self.assertEqual(list(actual), list(expected))
+            for key in expected:
+                for category in expected[key]:
+                    self.assertAlmostEqual(actual[key][category], expected[key][category])
+
+    def test_apply(self):
+        daily = {}
+        rollup = StatsRollup(daily)
+        delta = {"2025-03-01": {"study": 60}, "2025-03-02": {"study": 120}}
+        for day, minutes in delta.items():
+            daily.setdefault(day, empty_stats())["study"] += minutes["study"]
+        rollup.apply(delta)
+        self.assertEqual(rollup.totals(date(2025, 1, 1), date(2025, 12, 31))["study"], 180)
+        self.assertEqual(rollup.first_day(), date(2025, 3, 1))
+
+    def test_first_day_skips_residue_only_year(self):
+        # 2024 年每天只有残留的零头，合计却超过 tolerance
+        daily = {f"2024-01-{day:02d}": {"study": 0.0005, "game": 0, "other": 0} for day in range(1, 11)}
+        daily["2025-06-01"] = {"study": 30, "game": 0, "other": 0}
+        self.assertEqual(StatsRollup(daily).first_day(), date(2025, 6, 1))
+        self.assertIsNone(StatsRollup({"2024-01-01": {"study": 0.0005}}).first_day())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+旧格式每日统计升级的测试：python -m pytest tests 或 python -m unittest discover tests
+"""
+
+import unittest
+from unittest import mock
+
+import support
+import timelog_analytics
+import timelog_store
+from timelog_engine import STATS_FORMAT, Session, session_delta
+
+class StatsFormatUpgradeTest(unittest.TestCase):
+
+    def legacy_data(self):
+        """旧格式：跨零点的 23:00–02:00 整个计在开始那天，没有 stats_format"""
+        return {
+            "sessions": [Session(1, "熬夜", "study", "2025-03-01T23:00:00", "2025-03-02T02:00:00")],
+            "daily_stats": {"2025-03-01": {"study": 180, "game": 0, "other": 0}},
+            "next_id": 2
+        }
+
+    def test_upgrade_then_delete(self):
+        for mode in support.STORAGE_MODES:
+            with self.subTest(mode=mode):
+                support.temp_store(self, mode)
+                timelog_store._save_data(self.legacy_data())
+
+                data = timelog_store.load_data()
+                self.assertEqual(data["stats_format"], STATS_FORMAT)
+                self.assertEqual(data["daily_stats"]["2025-03-01"]["study"], 60)
+                self.assertEqual(data["daily_stats"]["2025-03-02"]["study"], 120)
+
+                # 升级结果已保存，之后加载不再重建
+                with mock.patch.object(timelog_analytics, "rebuild_daily_stats") as rebuild:
+                    timelog_store.load_data()
+                rebuild.assert_not_called()
+
+                with timelog_store.transaction() as data:
+                    session = data["sessions"].pop(0)
+                    delta = session_delta(session, -1)
+                    timelog_store.apply_delta(data, delta)
+                    timelog_store.record_change(data, "delete", session, index=0, delta=delta)
+                stats = timelog_store.load_data()["daily_stats"]
+                for day in ("2025-03-01", "2025-03-02"):
+                    self.assertAlmostEqual(stats[day]["study"], 0)
+
+    def test_new_data_not_rebuilt(self):
+        for mode in support.STORAGE_MODES:
+            with self.subTest(mode=mode):
+                support.temp_store(self, mode)
+                with mock.patch.object(timelog_analytics, "rebuild_daily_stats") as rebuild:
+                    with timelog_store.transaction() as data:
+                        session = Session(timelog_store.new_session_id(data), "a", "game",
+                                          "2025-03-01T09:00:00", "2025-03-01T10:00:00")
+                        data["sessions"].append(session)
+                        delta = session_delta(session)
+                        timelog_store.apply_delta(data, delta)
+                        timelog_store.record_change(data, "create", session, delta=delta)
+                    data = timelog_store.load_data()
+                rebuild.assert_not_called()
+                self.assertEqual(data["daily_stats"]["2025-03-01"]["game"], 60)
+
+if __name__ == "__main__":
+    unittest.main()
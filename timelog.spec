@@ -1,11 +1,14 @@
 # -*- mode: python ; coding: utf-8 -*-
 
+# 目录模式（onedir）：单文件模式每次运行都要先把所有库解压到临时目录，
+# 命令行启动会慢很多。templates 和 static 由 build.bat 复制到可执行文件旁边，
+# 不打进程序里。
 
 a = Analysis(
     ['timelog_simple.py'],
     pathex=[],
     binaries=[],
-    datas=[('templates', 'templates'), ('static', 'static')],
+    datas=[],
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
@@ -19,16 +22,14 @@ pyz = PYZ(a.pure)
 exe = EXE(
     pyz,
     a.scripts,
-    a.binaries,
-    a.datas,
     [],
+    exclude_binaries=True,
     name='timelog',
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
     upx=True,
     upx_exclude=[],
-    runtime_tmpdir=None,
     console=True,
     disable_windowed_traceback=False,
     argv_emulation=False,
@@ -36,3 +37,13 @@ exe = EXE(
     codesign_identity=None,
     entitlements_file=None,
 )
+
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.datas,
+    strip=False,
+    upx=True,
+    upx_exclude=[],
+    name='timelog',
+)
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+TimeLog 向量化统计（可选，需要 numpy）
+
+把会话的开始/结束时间和类别装进数组，按天的偏移量一次 bincount
+得到每天各类别的分钟数。用于从全部会话重建每日统计（verify、reindex、
+旧格式数据的升级），这是唯一需要遍历全部会话的统计。网页上的范围统计
+用每日统计的分层汇总（见 timelog_engine.StatsRollup），不需要这里。
+未安装 numpy 时 rebuild_daily_stats 逐个会话计算，结果相同。
+"""
+
+from datetime import date, datetime
+
+import timelog_engine
+from timelog_engine import CATEGORIES
+from timelog_columnar import OPEN_END, datetime_micros
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_DAY_MICROS = 86400 * 1000000
+_EPOCH_DAY = date(1970, 1, 1)
+
+def available():
+    """是否可以使用向量化统计"""
+    return np is not None
+
+class SessionArrays:
+    """会话的开始、结束时间（微秒）和类别编号数组，未结束的结束时间为 OPEN_END"""
+
+    def __init__(self, starts, ends, codes):
+        self.starts = starts
+        self.ends = ends
+        # 编号即 CATEGORIES 中的位置，其他类别为 len(CATEGORIES)
+        self.codes = codes
+
+    def __len__(self):
+        return len(self.starts)
+
+def session_arrays(sessions):
+    """从会话列表构造数组
+
+    binary 模式下直接使用映射的列，不复制、不生成 dict。
+    """
+    columns = sessions.columns() if hasattr(sessions, "columns") else None
+    if columns is not None:
+        starts, ends, codes, categories = columns
+        # 快照的类别表以 CATEGORIES 开头，后面的其他类别统一归为一个编号
+        codes = np.minimum(np.frombuffer(codes, dtype=np.uint8), len(CATEGORIES))
+        return SessionArrays(np.frombuffer(starts, dtype=np.int64),
+                             np.frombuffer(ends, dtype=np.int64), codes)
+
+    count = len(sessions)
+    code_of = {category: code for code, category in enumerate(CATEGORIES)}
+    starts = np.fromiter((datetime_micros(s.start_time) for s in sessions), dtype=np.int64, count=count)
+    ends = np.fromiter((OPEN_END if s.get("end") is None else datetime_micros(s.end_time) for s in sessions),
+                       dtype=np.int64, count=count)
+    codes = np.fromiter((code_of.get(s["category"], len(CATEGORIES)) for s in sessions),
+                        dtype=np.uint8, count=count)
+    return SessionArrays(starts, ends, codes)
+
+def daily_matrix(arrays, start_day, end_day, now=None):
+    """[start_day, end_day] 内每天各类别的分钟数，形状为 (类别数, 天数)
+
+    和 daily_stats 一致，跨过零点的会话按天切开；正在进行的会话算到 now。
+    """
+    if now is None:
+        now = datetime.now()
+    first = (start_day - _EPOCH_DAY).days
+    count = (end_day - start_day).days + 1
+
+    starts = arrays.starts
+    ends = np.where(arrays.ends == OPEN_END, datetime_micros(now), arrays.ends)
+    start_days = starts // _DAY_MICROS
+    # 恰好在零点结束的会话不占用下一天
+    end_days = np.maximum((ends - 1) // _DAY_MICROS, start_days)
+    mask = (end_days >= first) & (start_days < first + count) & (arrays.codes < len(CATEGORIES))
+    starts, ends, start_days, end_days = starts[mask], ends[mask], start_days[mask], end_days[mask]
+    codes = arrays.codes[mask].astype(np.int64)
+
+    # 每个会话覆盖几天就展开成几段（绝大多数只有一段）
+    spans = end_days - start_days + 1
+    owner = np.repeat(np.arange(len(spans)), spans)
+    days = start_days[owner] + (np.arange(len(owner)) - np.repeat(np.cumsum(spans) - spans, spans))
+    segment_starts = np.maximum(starts[owner], days * _DAY_MICROS)
+    segment_ends = np.minimum(ends[owner], (days + 1) * _DAY_MICROS)
+    minutes = (segment_ends - segment_starts) / 60e6
+
+    inside = (days >= first) & (days < first + count)
+    # 每个 (类别, 天) 一个桶，一次 bincount 完成
+    bins = codes[owner][inside] * count + (days[inside] - first)
+    totals = np.bincount(bins, weights=minutes[inside], minlength=len(CATEGORIES) * count)
+    return totals.reshape(len(CATEGORIES), count)
+
+def rebuild_daily_stats(sessions):
+    """从会话重新计算每日统计（只计已结束的会话），同 timelog_engine.rebuild_daily_stats
+
+    安装了 numpy 时整个历史一次算出，只列出有时长的日期。没有 numpy、
+    或有 CATEGORIES 以外的类别（数组里这些类别共用一个编号）时逐个会话计算。
+    """
+    if np is None or not len(sessions):
+        return timelog_engine.rebuild_daily_stats(sessions)
+    arrays = session_arrays(sessions)
+    if (arrays.codes >= len(CATEGORIES)).any():
+        return timelog_engine.rebuild_daily_stats(sessions)
+
+    # 未结束和结束时间不晚于开始时间的会话不计入
+    closed = (arrays.ends != OPEN_END) & (arrays.ends > arrays.starts)
+    if not closed.any():
+        return {}
+    arrays = SessionArrays(arrays.starts[closed], arrays.ends[closed], arrays.codes[closed])
+    first = int(arrays.starts.min() // _DAY_MICROS)
+    last = int((arrays.ends.max() - 1) // _DAY_MICROS)
+    start_day = date.fromordinal(_EPOCH_DAY.toordinal() + first)
+    matrix = daily_matrix(arrays, start_day, date.fromordinal(_EPOCH_DAY.toordinal() + last))
+
+    daily_stats = {}
+    for column in np.flatnonzero(matrix.any(axis=0)):
+        day = date.fromordinal(start_day.toordinal() + int(column))
+        daily_stats[day.isoformat()] = {
+            category: float(matrix[code, column]) for code, category in enumerate(CATEGORIES)
+        }
+    return daily_stats
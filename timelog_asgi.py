@@ -0,0 +1,440 @@
+# -*- coding: utf-8 -*-
+"""
+TimeLog 异步 JSON 接口（ASGI）
+`timelog web --async` 时使用，需要安装 uvicorn；也可以直接
+`uvicorn timelog_asgi:app` 运行
+
+状态、统计、任务增删改查和状态推送由 asyncio 处理：
+- 读数据的接口放到线程池里执行，不阻塞事件循环
+- 修改数据的请求排进队列，由唯一的写入任务逐个执行，每个一次事务
+- 所有推送连接共用一个监视任务，每个连接只是一个协程，不占用线程
+其他页面和接口（导出、报告等）转交给 Flask 应用，在线程池中执行。
+"""
+
+import asyncio
+import importlib.util
+import io
+import json
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from werkzeug.http import is_resource_modified
+
+import web_server
+from web_server import (store, current_status_info, sse_message, stop_event_streams, shutting_down,
+                        do_start_task, do_stop_task, do_stats_data, do_list_sessions, do_get_session,
+                        do_update_session, do_delete_session, do_create_session,
+                        cache_validators, cache_headers, metrics,
+                        EVENTS_CHECK_SECONDS, EVENTS_HEARTBEAT_SECONDS)
+from timelog_wsgi import DEFAULT_THREADS, KEEPALIVE_SECONDS
+
+# 排队等待写入的请求最多这么多个，超过后新请求等待入队
+WRITE_QUEUE_SIZE = 256
+
+_SESSION_PATH = re.compile(r"/api/(get_session|update_session|delete_session)/(\d+)$")
+
+def uvicorn_available():
+    """是否安装了 uvicorn"""
+    return importlib.util.find_spec("uvicorn") is not None
+
+def _in_transaction(func, args):
+    """在写入线程中执行修改"""
+    with store.transaction():
+        return func(*args)
+
+def _current():
+    """当前 (数据版本, 状态)"""
+    with store.lock:
+        store.get()
+        return store.version, current_status_info()
+
+def _wait_for_change(version):
+    """等待数据变化，返回 (版本, 操作, 会话 id, 状态)，没有变化时返回 None"""
+    with store.lock:
+        new_version = store.wait_for_change(version, EVENTS_CHECK_SECONDS)
+        if new_version == version:
+            return None
+        op, session_id = store.last_change
+        return new_version, op, session_id, current_status_info()
+
+class BadRequest(Exception):
+    """请求参数无效，返回 400"""
+
+async def _read_body(receive):
+    body = bytearray()
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return bytes(body)
+
+async def _read_json(receive):
+    try:
+        payload = json.loads(await _read_body(receive) or b"null")
+    except ValueError:
+        payload = None
+    if not isinstance(payload, dict):
+        raise BadRequest("请求内容不是有效的 JSON")
+    return payload
+
+def _encode_headers(headers):
+    return [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+
+async def _send_json(send, payload, status=200, headers=()):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json; charset=utf-8"),
+                    (b"content-length", str(len(body)).encode())] + _encode_headers(headers)
+    })
+    await send({"type": "http.response.body", "body": body})
+
+async def _wait_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+def _wsgi_environ(scope, body):
+    """把 ASGI 请求转换成 WSGI environ"""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "REMOTE_ADDR": client[0],
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False
+    }
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1")
+        value = value.decode("latin-1")
+        if name == "content-type":
+            environ["CONTENT_TYPE"] = value
+        elif name != "content-length":
+            key = "HTTP_" + name.upper().replace("-", "_")
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+class AsyncAPI:
+    """ASGI 应用：异步处理 JSON 接口，其余请求交给 wsgi_app
+
+    on_shutdown 在关闭时（排队的修改执行完之后）在线程中调用。
+    """
+
+    def __init__(self, wsgi_app, threads=DEFAULT_THREADS, on_shutdown=None):
+        self.wsgi_app = wsgi_app
+        self.threads = threads
+        self.on_shutdown = on_shutdown
+        self.loop = None
+        # 每个推送连接一个队列，监视任务把变化放进所有队列
+        self.subscribers = set()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        # 服务器不支持 lifespan 时在第一个请求到来时启动
+        self.startup()
+
+        handler, args = self._route(scope["method"], scope["path"])
+        if handler is None:
+            # 由 Flask 应用外层的中间件记录耗时
+            await self._call_wsgi(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def timed_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await handler(scope, receive, timed_send, *args)
+        except BadRequest as e:
+            await _send_json(timed_send, {"success": False, "message": str(e)}, status=400)
+        except Exception as e:
+            await _send_json(timed_send, {"success": False, "message": f"服务器错误: {str(e)}"}, status=500)
+        finally:
+            # 推送连接一直保持打开，持续时间不是请求耗时
+            if handler != self.events:
+                self._observe(scope, status, time.perf_counter() - started)
+
+    def _observe(self, scope, status, seconds):
+        """记录异步接口的请求耗时，route 标签同 Flask 的 URL 规则"""
+        path = scope["path"]
+        if scope["query_string"]:
+            path += "?" + scope["query_string"].decode("latin-1")
+        metrics.observe_request(_SESSION_PATH.sub(r"/api/\1/<int:session_id>", scope["path"]),
+                                scope["method"], status, seconds, path)
+
+    def _route(self, method, path):
+        """返回 (处理函数, 参数)，不是异步接口时处理函数为 None"""
+        routes = {
+            ("GET", "/api/current_status"): self.current_status,
+            ("GET", "/api/events"): self.events,
+            ("GET", "/api/stats_data"): self.stats_data,
+            ("GET", "/api/sessions"): self.list_sessions,
+            ("POST", "/api/start_task"): self.start_task,
+            ("POST", "/api/stop_task"): self.stop_task,
+            ("POST", "/api/create_session"): self.create_session
+        }
+        handler = routes.get((method, path))
+        if handler is not None:
+            return handler, ()
+        match = _SESSION_PATH.match(path)
+        if match:
+            handler = {
+                ("GET", "get_session"): self.get_session,
+                ("POST", "update_session"): self.update_session,
+                ("DELETE", "delete_session"): self.delete_session
+            }.get((method, match.group(1)))
+            if handler is not None:
+                return handler, (int(match.group(2)),)
+        return None, ()
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self.startup()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def startup(self):
+        """创建线程池、写入任务和监视任务（只执行一次）"""
+        if self.loop is not None:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.executor = ThreadPoolExecutor(self.threads, thread_name_prefix="timelog-async")
+        # 写入和监视各用一个线程，不占用读取的线程池
+        self.write_executor = ThreadPoolExecutor(1, thread_name_prefix="timelog-writer")
+        self.watch_executor = ThreadPoolExecutor(1, thread_name_prefix="timelog-watch")
+        self.writes = asyncio.Queue(WRITE_QUEUE_SIZE)
+        self.writer = self.loop.create_task(self._write_loop())
+        self.watcher = self.loop.create_task(self._watch_loop())
+
+    def close_streams(self):
+        """结束所有推送连接（在事件循环线程中调用）"""
+        stop_event_streams()
+        for queue in self.subscribers:
+            queue.put_nowait(None)
+
+    async def shutdown(self):
+        """结束推送，执行完已排队的修改后停止"""
+        if self.loop is None:
+            return
+        self.close_streams()
+        await self.writes.put(None)
+        await self.writer
+        await self.watcher
+        if self.on_shutdown is not None:
+            await self.read(self.on_shutdown)
+        self.executor.shutdown(wait=False)
+        self.write_executor.shutdown(wait=False)
+        self.watch_executor.shutdown(wait=False)
+
+    async def read(self, func, *args):
+        """在线程池中执行读取"""
+        return await self.loop.run_in_executor(self.executor, func, *args)
+
+    async def write(self, func, *args):
+        """把修改交给写入任务，等待执行结果"""
+        if shutting_down.is_set():
+            raise RuntimeError("服务器正在关闭")
+        future = self.loop.create_future()
+        await self.writes.put((func, args, future))
+        return await future
+
+    async def _write_loop(self):
+        """逐个执行排队的修改，同一时间只有一个事务"""
+        while True:
+            item = await self.writes.get()
+            if item is None:
+                return
+            func, args, future = item
+            try:
+                result = await self.loop.run_in_executor(self.write_executor, _in_transaction, func, args)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                # 请求方已断开时结果直接丢弃，修改照常生效
+                if not future.done():
+                    future.set_result(result)
+
+    async def _watch_loop(self):
+        """等待数据变化并广播给所有推送连接"""
+        version, _ = await self.loop.run_in_executor(self.watch_executor, _current)
+        while not shutting_down.is_set():
+            change = await self.loop.run_in_executor(self.watch_executor, _wait_for_change, version)
+            if change is None or shutting_down.is_set():
+                continue
+            version, op, session_id, status = change
+            message = sse_message("change", {
+                "version": version,
+                "op": op,
+                "id": session_id,
+                "status": status
+            })
+            for queue in self.subscribers:
+                queue.put_nowait((version, message))
+
+    async def cached_read(self, scope, send, live, func, *args):
+        """带条件请求的读接口，同 web_server.conditional：数据没变时返回 304，不执行 func"""
+        etag, last_modified = await self.read(cache_validators, live)
+        headers = cache_headers(etag, last_modified)
+        if not is_resource_modified(_wsgi_environ(scope, b""), etag=etag, last_modified=last_modified):
+            await send({"type": "http.response.start", "status": 304, "headers": _encode_headers(headers)})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await _send_json(send, await self.read(func, *args), headers=headers)
+
+    async def current_status(self, scope, receive, send):
+        await _send_json(send, await self.read(current_status_info))
+
+    async def stats_data(self, scope, receive, send):
+        query = parse_qs(scope["query_string"].decode("latin-1"))
+        days = query.get("days", ["today"])[0]
+        group = query.get("group", ["day"])[0]
+        if days not in ("today", "all") and not days.isdigit():
+            raise BadRequest("days 只能是天数、today 或 all")
+        await self.cached_read(scope, send, True, do_stats_data, days, group)
+
+    async def list_sessions(self, scope, receive, send):
+        query = parse_qs(scope["query_string"].decode("latin-1"))
+        args = [query.get(name, [None])[0] for name in ("cursor", "limit", "category", "q")]
+        await self.cached_read(scope, send, True, do_list_sessions, *args)
+
+    async def get_session(self, scope, receive, send, session_id):
+        await self.cached_read(scope, send, False, do_get_session, session_id)
+
+    async def start_task(self, scope, receive, send):
+        payload = await _read_json(receive)
+        await _send_json(send, await self.write(do_start_task, payload))
+
+    async def stop_task(self, scope, receive, send):
+        await _send_json(send, await self.write(do_stop_task))
+
+    async def update_session(self, scope, receive, send, session_id):
+        payload = await _read_json(receive)
+        await _send_json(send, await self.write(do_update_session, session_id, payload))
+
+    async def delete_session(self, scope, receive, send, session_id):
+        await _send_json(send, await self.write(do_delete_session, session_id))
+
+    async def create_session(self, scope, receive, send):
+        payload = await _read_json(receive)
+        await _send_json(send, await self.write(do_create_session, payload))
+
+    async def events(self, scope, receive, send):
+        """状态推送（格式同 /api/events）"""
+        queue = asyncio.Queue()
+        # 先订阅再读取当前版本，期间发生的变化不会丢失
+        self.subscribers.add(queue)
+        disconnect = asyncio.ensure_future(_wait_disconnect(receive))
+        try:
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"text/event-stream; charset=utf-8"),
+                            (b"cache-control", b"no-cache"),
+                            (b"x-accel-buffering", b"no")]
+            })
+            version, status = await self.read(_current)
+            first = "retry: 5000\n\n" + sse_message("status", {"version": version, "status": status})
+            await send({"type": "http.response.body", "body": first.encode("utf-8"), "more_body": True})
+
+            while not shutting_down.is_set():
+                get = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({get, disconnect}, timeout=EVENTS_HEARTBEAT_SECONDS,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if get not in done:
+                    get.cancel()
+                    if disconnect in done:
+                        return
+                    # 心跳注释，保持连接并及时发现客户端断开
+                    await send({"type": "http.response.body", "body": b": ping\n\n", "more_body": True})
+                    continue
+                item = get.result()
+                if item is None:
+                    break
+                new_version, message = item
+                if new_version <= version:
+                    continue
+                version = new_version
+                await send({"type": "http.response.body", "body": message.encode("utf-8"), "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            self.subscribers.discard(queue)
+            disconnect.cancel()
+
+    async def _call_wsgi(self, scope, receive, send):
+        """在线程池中运行 Flask 应用，逐块转发响应（导出等流式响应不会整体缓存）"""
+        environ = _wsgi_environ(scope, await _read_body(receive))
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response["status"] = int(status.split(" ", 1)[0])
+            response["headers"] = _encode_headers(headers)
+
+        def begin():
+            result = self.wsgi_app(environ, start_response)
+            return result, iter(result)
+
+        result, chunks = await self.read(begin)
+        try:
+            await send({"type": "http.response.start", "status": response["status"],
+                        "headers": response["headers"]})
+            done = object()
+            while True:
+                chunk = await self.read(next, chunks, done)
+                if chunk is done:
+                    break
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            if hasattr(result, "close"):
+                await self.read(result.close)
+
+def serve(app, host="localhost", port=5000):
+    """用 uvicorn 运行异步应用，直到收到停止信号
+
+    uvicorn 关闭后会重新触发收到的信号，清理工作应放在 app 的 on_shutdown 中。
+    """
+    import uvicorn
+
+    class Server(uvicorn.Server):
+        def handle_exit(self, sig, frame):
+            # 先结束推送连接，否则服务器会一直等待它们断开
+            if app.loop is not None:
+                app.loop.call_soon_threadsafe(app.close_streams)
+            super().handle_exit(sig, frame)
+
+    config = uvicorn.Config(app, host=host, port=port, lifespan="on", log_level="warning",
+                            timeout_keep_alive=KEEPALIVE_SECONDS)
+    Server(config).run()
+
+app = AsyncAPI(web_server.app, on_shutdown=web_server.report_jobs.shutdown)
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""
+TimeLog 列式二进制快照
+TIMELOG_STORAGE=binary 时代替 ~/.timelog.json 作为快照
+
+文件布局（小端）:
+- 文件头: 魔数 TLC1，会话数，元数据长度
+- 按 (开始时间, id) 排序的定长列: id、开始、结束（int64 微秒，
+  未结束为 OPEN_END）、任务名编号（uint32）、类别编号（uint8）
+- 元数据 JSON: 任务名表、类别表、daily_stats、next_id 等
+
+读取时用 mmap 映射文件，按列访问；只有真正用到的会话才生成 Session。
+"""
+
+import heapq
+import json
+import mmap
+import sys
+from array import array
+from bisect import bisect_left
+from collections.abc import MutableSequence
+from datetime import datetime, timedelta
+from operator import itemgetter
+import struct
+
+from timelog_engine import CATEGORIES, Session
+
+MAGIC = b"TLC1"
+_HEADER = struct.Struct("<4s4xQQ")
+OPEN_END = -(2 ** 63)
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+def datetime_micros(value):
+    """datetime 转换为微秒整数（本地时间，不做时区换算）"""
+    return (value - _EPOCH) // _MICROSECOND
+
+def to_micros(iso_time):
+    """ISO 时间字符串转换为微秒整数"""
+    return datetime_micros(datetime.fromisoformat(iso_time))
+
+def from_micros(micros):
+    """微秒整数转换回 ISO 时间字符串"""
+    return (_EPOCH + timedelta(microseconds=micros)).isoformat()
+
+def _pad(size):
+    return -size % 8
+
+def write_columns(f, data):
+    """把数据写成列式快照，f 为二进制文件对象"""
+    rows = sorted(((datetime_micros(s.start_time), s["id"], s) for s in data.get("sessions", [])),
+                  key=lambda row: row[:2])
+
+    categories = list(CATEGORIES)
+    category_codes = {name: code for code, name in enumerate(categories)}
+    tasks = []
+    task_codes = {}
+
+    ids = array("q")
+    starts = array("q")
+    ends = array("q")
+    task_column = array("I")
+    category_column = array("B")
+    for start, session_id, session in rows:
+        ids.append(session_id)
+        starts.append(start)
+        ends.append(OPEN_END if session.get("end") is None else datetime_micros(session.end_time))
+        task = session["task"]
+        if task not in task_codes:
+            task_codes[task] = len(tasks)
+            tasks.append(task)
+        task_column.append(task_codes[task])
+        category = session["category"]
+        if category not in category_codes:
+            category_codes[category] = len(categories)
+            categories.append(category)
+        category_column.append(category_codes[category])
+
+    meta = {key: value for key, value in data.items() if key != "sessions"}
+    meta["tasks"] = tasks
+    meta["categories"] = categories
+    meta_bytes = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+
+    f.write(_HEADER.pack(MAGIC, len(rows), len(meta_bytes)))
+    for column in (ids, starts, ends, task_column, category_column):
+        if sys.byteorder != "little":
+            column.byteswap()
+        raw = column.tobytes()
+        f.write(raw)
+        f.write(b"\0" * _pad(len(raw)))
+    f.write(meta_bytes)
+
+def _column(buffer, offset, count, typecode):
+    """从缓冲区取一列，返回 (列, 下一列的偏移)"""
+    size = array(typecode).itemsize * count
+    raw = buffer[offset:offset + size]
+    if sys.byteorder == "little":
+        column = raw.cast(typecode)
+    else:
+        column = array(typecode, raw.tobytes())
+        column.byteswap()
+    return column, offset + size + _pad(size)
+
+class ColumnarSnapshot:
+    """只读的列式快照"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            if sys.platform == "win32":
+                # Windows 下被映射的文件无法被替换，直接读进内存
+                buffer = memoryview(f.read())
+            else:
+                buffer = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+        magic, count, meta_size = _HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise ValueError(f"不是 TimeLog 列式快照: {path}")
+        offset = _HEADER.size
+        self.ids, offset = _column(buffer, offset, count, "q")
+        self.starts, offset = _column(buffer, offset, count, "q")
+        self.ends, offset = _column(buffer, offset, count, "q")
+        self.task_codes, offset = _column(buffer, offset, count, "I")
+        self.category_codes, offset = _column(buffer, offset, count, "B")
+        self.meta = json.loads(bytes(buffer[offset:offset + meta_size]).decode("utf-8"))
+        self.tasks = [sys.intern(task) for task in self.meta.pop("tasks")]
+        self.categories = [sys.intern(name) for name in self.meta.pop("categories")]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def session(self, row):
+        """生成第 row 行的会话，开始、结束时间直接由列换算，不用再解析"""
+        start = _EPOCH + timedelta(microseconds=self.starts[row])
+        end = self.ends[row]
+        end = None if end == OPEN_END else _EPOCH + timedelta(microseconds=end)
+        session = Session(self.ids[row], self.tasks[self.task_codes[row]],
+                          self.categories[self.category_codes[row]],
+                          start.isoformat(), end.isoformat() if end else None)
+        session._start_time = start
+        session._end_time = end
+        return session
+
+    def bounds(self, since=None, until=None):
+        """开始时间在 [since, until) 内的行号范围"""
+        lo = 0 if since is None else bisect_left(self.starts, to_micros(since))
+        hi = len(self) if until is None else bisect_left(self.starts, to_micros(until))
+        return lo, hi
+
+class ColumnarSessions(MutableSequence):
+    """以列式快照为底的会话列表
+
+    按行号访问时才生成 Session 并缓存，之后返回同一个对象。追加和按位置
+    替换只记在内存里；删除等需要移动位置的操作会先生成全部会话，
+    之后退化为普通列表。
+    """
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+        self._rows = {}
+        # 被整体替换过的快照行（开始时间可能已经变化）
+        self._replaced = set()
+        self._tail = []
+        self._list = None
+
+    def _materialize(self):
+        if self._list is None:
+            self._list = [self[i] for i in range(len(self))]
+            self._rows = self._tail = None
+        return self._list
+
+    def __len__(self):
+        if self._list is not None:
+            return len(self._list)
+        return len(self._snapshot) + len(self._tail)
+
+    def _row(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("session index out of range")
+        return i
+
+    def __getitem__(self, i):
+        if self._list is not None:
+            return self._list[i]
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = self._row(i)
+        base = len(self._snapshot)
+        if i >= base:
+            return self._tail[i - base]
+        session = self._rows.get(i)
+        if session is None:
+            session = self._rows[i] = self._snapshot.session(i)
+        return session
+
+    def __setitem__(self, i, session):
+        if self._list is not None or isinstance(i, slice):
+            self._materialize()[i] = session
+            return
+        i = self._row(i)
+        base = len(self._snapshot)
+        if i >= base:
+            self._tail[i - base] = session
+        else:
+            self._rows[i] = session
+            self._replaced.add(i)
+
+    def __delitem__(self, i):
+        del self._materialize()[i]
+
+    def insert(self, i, session):
+        if self._list is None and i >= len(self):
+            self._tail.append(session)
+        else:
+            self._materialize().insert(i, session)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __reversed__(self):
+        for i in range(len(self) - 1, -1, -1):
+            yield self[i]
+
+    def find_open(self):
+        """查找未结束的会话，快照部分只扫描结束时间列"""
+        if self._list is not None:
+            return next((s for s in reversed(self._list) if s.get("end") is None), None)
+        for session in reversed(self._tail):
+            if session.get("end") is None:
+                return session
+        ends = self._snapshot.ends
+        for i in range(len(ends) - 1, -1, -1):
+            session = self._rows.get(i)
+            if session is not None:
+                if session.get("end") is None:
+                    return session
+            elif ends[i] == OPEN_END:
+                return self[i]
+        return None
+
+    def columns(self):
+        """快照列 (开始, 结束, 类别编号, 类别表)
+
+        只有加载后没有增删改过时才能直接使用列，否则返回 None。
+        """
+        if self._list is not None or self._tail or self._replaced:
+            return None
+        ends = self._snapshot.ends
+        for i, session in self._rows.items():
+            # 结束任务会直接修改已生成的会话
+            if (session.get("end") is None) != (ends[i] == OPEN_END):
+                return None
+        snapshot = self._snapshot
+        return snapshot.starts, snapshot.ends, snapshot.category_codes, snapshot.categories
+
+    def range(self, since=None, until=None):
+        """开始时间在 [since, until) 内的会话，最新的在前
+
+        快照部分在开始时间列上二分查找，只为命中的行生成会话。
+        已退化为普通列表时返回 None，由调用方改用其他索引。
+        """
+        if self._list is not None:
+            return None
+        lo, hi = self._snapshot.bounds(since, until)
+        result = [self[i] for i in range(lo, hi) if i not in self._replaced]
+        # 被替换的行和追加的会话数量很少，逐条检查
+        extra = [self._rows[i] for i in self._replaced] + self._tail
+        extra = [s for s in extra
+                 if (since is None or s["start"] >= since)
+                 and (until is None or s["start"] < until)]
+        if extra:
+            result.extend(extra)
+            result.sort(key=lambda s: (datetime_micros(s.start_time), s["id"]))
+        return result[::-1]
+
+    def before(self, key=None):
+        """按 (开始时间, id) 从新到旧遍历排在 key 之前的会话
+
+        key 为 (ISO 开始时间, id)，None 表示从最新的开始。快照部分从二分
+        查找的位置往前逐行生成会话，翻一页只生成这一页用到的会话。
+        已退化为普通列表时返回 None，由调用方改用其他索引。
+        """
+        if self._list is not None:
+            return None
+        snapshot = self._snapshot
+        hi = len(snapshot)
+        if key is not None:
+            key = (to_micros(key[0]), key[1])
+            hi = bisect_left(snapshot.starts, key[0])
+            while hi < len(snapshot) and snapshot.starts[hi] == key[0] and snapshot.ids[hi] < key[1]:
+                hi += 1
+
+        def rows():
+            for i in range(hi - 1, -1, -1):
+                if i not in self._replaced:
+                    yield (snapshot.starts[i], snapshot.ids[i]), i
+
+        # 被替换的行和追加的会话数量很少，排好序后和快照合并
+        extra = [((datetime_micros(s.start_time), s["id"]), s)
+                 for s in [self._rows[i] for i in self._replaced] + self._tail]
+        extra = sorted((entry for entry in extra if key is None or entry[0] < key),
+                       key=itemgetter(0), reverse=True)
+        merged = heapq.merge(rows(), extra, key=itemgetter(0), reverse=True)
+        return (self[item] if isinstance(item, int) else item for _, item in merged)
+
+def load_columns(path):
+    """读取列式快照，返回数据 dict（sessions 为 ColumnarSessions）"""
+    snapshot = ColumnarSnapshot(path)
+    data = dict(snapshot.meta)
+    data["sessions"] = ColumnarSessions(snapshot)
+    return data
@@ -0,0 +1,562 @@
+# -*- coding: utf-8 -*-
+"""
+TimeLog 统计引擎
+命令行和网页服务器共用的统计计算：时长、每日统计的增量维护、
+按日期范围汇总。数据的读写在 timelog_store 中。
+"""
+
+import sys
+from bisect import bisect_left
+from datetime import datetime, date, time, timedelta
+
+CATEGORIES = ("study", "game", "other")
+
+_EPOCH = datetime(1970, 1, 1)
+
+def to_epoch(iso_time):
+    """把 ISO 时间字符串转换为秒数（本地时间，不做时区换算）"""
+    return (datetime.fromisoformat(iso_time) - _EPOCH).total_seconds()
+
+class Session:
+    """一条会话记录
+
+    字段同数据文件中的会话（id、task、category、start、end），存在 __slots__
+    里，比 dict 省内存；任务名和类别字符串驻留，相同的只存一份。开始、
+    结束时间第一次用到时解析并缓存，修改 start/end 时失效。
+
+    支持 session["start"]、get、in 等 dict 写法，存储和模板代码不用区分；
+    写成 JSON 时用 to_dict() 或 json_default。数据文件里的其他字段原样保留。
+    """
+
+    __slots__ = ("id", "task", "category", "_start", "_end", "_start_time", "_end_time", "_extra")
+
+    def __init__(self, id=None, task="", category="other", start=None, end=None, extra=None):
+        self.id = id
+        self.task = _intern(task)
+        self.category = _intern(category)
+        self._start = start
+        self._end = end
+        self._start_time = None
+        self._end_time = None
+        self._extra = extra
+
+    @classmethod
+    def from_dict(cls, session):
+        """从 dict 生成会话，已经是 Session 时原样返回
+
+        加载数据时每条会话都要调用一次，直接填各个槽，不经过 __init__。
+        """
+        if isinstance(session, cls):
+            return session
+        result = object.__new__(cls)
+        task = session["task"]
+        category = session["category"]
+        result.id = session.get("id")
+        result.task = sys.intern(task) if type(task) is str else task
+        result.category = sys.intern(category) if type(category) is str else category
+        result._start = session["start"]
+        result._end = session.get("end")
+        result._start_time = result._end_time = result._extra = None
+        if not session.keys() <= _FIELD_SET:
+            result._extra = {key: value for key, value in session.items() if key not in _FIELD_SET}
+        return result
+
+    @property
+    def start(self):
+        return self._start
+
+    @start.setter
+    def start(self, value):
+        self._start = value
+        self._start_time = None
+
+    @property
+    def end(self):
+        return self._end
+
+    @end.setter
+    def end(self, value):
+        self._end = value
+        self._end_time = None
+
+    @property
+    def start_time(self):
+        """开始时间（datetime）"""
+        if self._start_time is None:
+            self._start_time = datetime.fromisoformat(self._start)
+        return self._start_time
+
+    @property
+    def end_time(self):
+        """结束时间（datetime），未结束时为 None"""
+        if self._end_time is None and self._end is not None:
+            self._end_time = datetime.fromisoformat(self._end)
+        return self._end_time
+
+    def duration(self, now=None):
+        """时长（分钟），未结束的会话算到 now（默认现在）"""
+        end = self.end_time or now or datetime.now()
+        return (end - self.start_time).total_seconds() / 60
+
+    def to_dict(self):
+        """数据文件和 JSON 接口中的 dict 形式"""
+        result = {"id": self.id, "task": self.task, "category": self.category,
+                  "start": self._start, "end": self._end}
+        if self.id is None:
+            del result["id"]
+        if self._extra:
+            result.update(self._extra)
+        return result
+
+    def copy(self):
+        session = Session(self.id, self.task, self.category, self._start, self._end,
+                          dict(self._extra) if self._extra else None)
+        session._start_time = self._start_time
+        session._end_time = self._end_time
+        return session
+
+    # ---- dict 写法 ----
+
+    def __getitem__(self, key):
+        if key in _FIELD_SET:
+            return getattr(self, key)
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in _FIELD_SET:
+            setattr(self, key, _intern(value) if key in ("task", "category") else value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __contains__(self, key):
+        if key in _FIELD_SET:
+            return getattr(self, key) is not None
+        return bool(self._extra) and key in self._extra
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def pop(self, key, default=None):
+        """取出并清空一个字段（start/end/id 置为 None）"""
+        if key in _FIELD_SET:
+            value = getattr(self, key)
+            setattr(self, key, None)
+            return default if value is None else value
+        return self._extra.pop(key, default) if self._extra else default
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def items(self):
+        return self.to_dict().items()
+
+    def __iter__(self):
+        return iter(self.to_dict())
+
+    def __len__(self):
+        return len(self.to_dict())
+
+    def __bool__(self):
+        return True
+
+    def __repr__(self):
+        return f"Session({self.to_dict()!r})"
+
+_FIELD_SET = frozenset(("id", "task", "category", "start", "end"))
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+def to_sessions(dicts):
+    """批量把 dict 转换为 Session（加载数据时用，同 Session.from_dict）"""
+    new = object.__new__
+    intern = sys.intern
+    result = []
+    append = result.append
+    for session in dicts:
+        if not session.keys() <= _FIELD_SET:
+            append(Session.from_dict(session))
+            continue
+        # 常见情况展开写，省掉每条一次的函数调用
+        item = new(Session)
+        task = session["task"]
+        category = session["category"]
+        item.id = session.get("id")
+        item.task = intern(task) if type(task) is str else task
+        item.category = intern(category) if type(category) is str else category
+        item._start = session["start"]
+        item._end = session.get("end")
+        item._start_time = item._end_time = item._extra = None
+        append(item)
+    return result
+
+def json_default(value):
+    """json.dump 的 default 参数：把 Session 写成 dict"""
+    if isinstance(value, Session):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def session_key(session):
+    """会话的排序键 (开始时间秒数, id)，同 to_epoch"""
+    return (session.start_time - _EPOCH).total_seconds(), session["id"]
+
+def empty_stats():
+    """空的单日统计"""
+    return {"study": 0, "game": 0, "other": 0}
+
+def split_by_day(start, end):
+    """把 [start, end) 在每天零点处切开，返回 {日期字符串: 分钟}
+
+    start/end 为 datetime。跨过零点的任务分别计入各自的日期。
+    """
+    result = {}
+    while start < end:
+        midnight = datetime.combine(start.date() + timedelta(days=1), time())
+        segment_end = min(end, midnight)
+        result[start.date().isoformat()] = (segment_end - start).total_seconds() / 60
+        start = segment_end
+    return result
+
+# 每日统计的格式版本，保存在数据的 stats_format 中。没有该字段的旧数据
+# 把跨零点的会话整个计入开始那天，加载时要按现在的算法重建一次
+STATS_FORMAT = 2
+
+def session_delta(session, sign=1):
+    """已结束的会话对每日统计的增量 {日期: {类别: 分钟}}
+
+    按零点切开，只涉及会话覆盖的那几天；sign=-1 得到撤销该会话的增量。
+    未结束的会话返回空字典。
+    """
+    if session.get("end") is None:
+        return {}
+    category = session["category"]
+    minutes = split_by_day(session.start_time, session.end_time)
+    return {day: {category: sign * value} for day, value in minutes.items()}
+
+def apply_delta(data, delta):
+    """把每日统计增量加到数据上"""
+    daily_stats = data.setdefault("daily_stats", {})
+    for day, minutes in (delta or {}).items():
+        if day not in daily_stats:
+            daily_stats[day] = empty_stats()
+        for category, value in minutes.items():
+            daily_stats[day][category] += value
+
+def merge_delta(delta, other):
+    """把另一份每日统计增量合并进 delta"""
+    for day, minutes in (other or {}).items():
+        day_delta = delta.setdefault(day, {})
+        for category, value in minutes.items():
+            day_delta[category] = day_delta.get(category, 0) + value
+    return delta
+
+def update_daily_stats(data, session):
+    """把刚结束的会话计入每日统计，返回增量 {日期: {类别: 分钟}}
+
+    跨过零点的任务按天切开，分别计入各自的日期；未结束的会话返回 None。
+    """
+    if session.get("end") is None:
+        return None
+    delta = session_delta(session)
+    apply_delta(data, delta)
+    return delta
+
+def rebuild_daily_stats(sessions):
+    """一次遍历 sessions 重新计算每日统计（只计已结束的会话）"""
+    daily_stats = {}
+    for session in sessions:
+        for day, minutes in session_delta(session).items():
+            stats = daily_stats.get(day)
+            if stats is None:
+                stats = daily_stats[day] = empty_stats()
+            for category, value in minutes.items():
+                stats[category] = stats.get(category, 0) + value
+    return dict(sorted(daily_stats.items()))
+
+def diff_daily_stats(expected, actual, tolerance=0.001):
+    """比较两份每日统计，返回不一致的 [(日期, 类别, 应为, 实际)]
+
+    缺少的日期或类别按 0 计；差值不超过 tolerance 分钟的视为一致
+    （反复加减会留下浮点误差）。
+    """
+    mismatches = []
+    for day in sorted(set(expected) | set(actual)):
+        want = expected.get(day, {})
+        have = actual.get(day, {})
+        for category in sorted(set(want) | set(have)):
+            a, b = want.get(category, 0), have.get(category, 0)
+            if abs(a - b) > tolerance:
+                mismatches.append((day, category, a, b))
+    return mismatches
+
+def get_current_stats_with_active(data, current_session, target_date=None, now=None):
+    """某一天（默认今天）各类别的分钟数，包含正在进行的任务
+
+    current_session 由调用方查找后传入（可为 None）：命令行读当前会话指针，
+    网页服务器取缓存。跨过零点的任务只计入落在目标日期的部分。
+    返回 (统计, current_session)。
+    """
+    if target_date is None:
+        target_date = date.today().isoformat()
+
+    stats = data.get("daily_stats", {}).get(target_date)
+    current_stats = stats.copy() if stats else empty_stats()
+
+    if current_session:
+        session_start = current_session.start_time
+        minutes = split_by_day(session_start, now or datetime.now()).get(target_date, 0)
+        current_stats[current_session["category"]] += minutes
+
+    return current_stats, current_session
+
+def aggregate_range(data, start_day, end_day, current_session, now=None):
+    """一次遍历计算日期范围内每天各类别的分钟数
+
+    start_day/end_day 为 date，包含两端。已完成的任务取自 daily_stats，
+    正在进行的任务（由调用方查找一次后传入，可为 None）算到 now，
+    跨过零点的部分计入各自的日期。
+    返回按日期升序的 {日期字符串: {类别: 分钟}}。
+    """
+    daily_stats = data.get("daily_stats", {})
+    result = {}
+
+    day = start_day
+    while day <= end_day:
+        key = day.isoformat()
+        stats = daily_stats.get(key)
+        result[key] = stats.copy() if stats else empty_stats()
+        day += timedelta(days=1)
+
+    if current_session:
+        if now is None:
+            now = datetime.now()
+        session_start = current_session.start_time
+        category = current_session["category"]
+        for key, minutes in split_by_day(session_start, now).items():
+            if key in result:
+                result[key][category] += minutes
+
+    return result
+
+def aggregate_recent(data, days, current_session, today=None):
+    """最近 days 天（含今天）的每日统计，参数和返回值同 aggregate_range"""
+    if today is None:
+        today = date.today()
+    return aggregate_range(data, today - timedelta(days=days - 1), today, current_session)
+
+# ---- 分层汇总 ----
+
+GROUPS = ("day", "week", "month", "year")
+
+_ONE_DAY = timedelta(days=1)
+
+def bucket_key(day, group):
+    """日期所在的统计桶：YYYY-MM-DD、ISO 周 YYYY-Www、YYYY-MM 或 YYYY"""
+    if group == "week":
+        year, week, _ = day.isocalendar()
+        return f"{year}-W{week:02d}"
+    if group == "month":
+        return day.strftime("%Y-%m")
+    if group == "year":
+        return str(day.year)
+    return day.isoformat()
+
+def bucket_start(day, group):
+    """日期所在统计桶的第一天"""
+    if group == "week":
+        return day - timedelta(days=day.weekday())
+    if group == "month":
+        return day.replace(day=1)
+    if group == "year":
+        return day.replace(month=1, day=1)
+    return day
+
+def next_bucket(day, group):
+    """下一个统计桶的第一天（day 为某个桶的第一天）"""
+    if group == "week":
+        return day + timedelta(days=7)
+    if group == "month":
+        return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+    if group == "year":
+        return date(day.year + 1, 1, 1)
+    return day + _ONE_DAY
+
+def _add_stats(target, minutes):
+    for category, value in minutes.items():
+        target[category] = target.get(category, 0) + value
+
+class StatsRollup:
+    """每日统计的分层汇总：ISO 周、月、年
+
+    从 daily_stats 建一次，之后每次修改把同一份每日统计增量加到涉及的
+    周、月、年上（apply），不再重新汇总。按天的一层直接用 daily_stats
+    本身（同一个 dict，由 apply_delta 维护）。
+    任意日期范围的合计由范围内的整年、整月、整周加上两端零散的天拼成，
+    一年或全部历史和最近 7 天的查找次数相差无几。
+    只包含已结束的会话，正在进行的任务由调用方另外加上。
+    """
+
+    # 由粗到细，拼范围时先用粗的
+    LEVELS = ("year", "month", "week")
+
+    def __init__(self, daily_stats):
+        self.days = daily_stats
+        self.tables = {group: {} for group in self.LEVELS}
+        self.apply(daily_stats)
+
+    def apply(self, delta):
+        """把每日统计增量 {日期: {类别: 分钟}} 加到各层汇总上"""
+        for key, minutes in (delta or {}).items():
+            day = date.fromisoformat(key)
+            for group, table in self.tables.items():
+                bucket = table.get(bucket_start(day, group))
+                if bucket is None:
+                    bucket = table[bucket_start(day, group)] = empty_stats()
+                _add_stats(bucket, minutes)
+
+    def first_day(self, tolerance=0.001):
+        """最早有记录的日期，没有记录时返回 None
+
+        删除会话后汇总里会留下接近 0 的桶，不超过 tolerance 分钟的视为没有记录。
+        一年的合计超过 tolerance 而其中每一天都不超过（正负抵消或残留）时，
+        继续看下一年。
+        """
+        years = self.tables["year"]
+        for year in sorted(years):
+            if sum(years[year].values()) > tolerance:
+                prefix = str(year.year)
+                first = min((date.fromisoformat(key) for key, stats in self.days.items()
+                             if key.startswith(prefix) and sum(stats.values()) > tolerance), default=None)
+                if first is not None:
+                    return first
+        return None
+
+    def _bucket(self, group, start):
+        if group == "day":
+            return self.days.get(start.isoformat())
+        return self.tables[group].get(start)
+
+    def totals(self, start_day, end_day):
+        """[start_day, end_day] 内各类别的分钟数合计"""
+        result = empty_stats()
+        self._collect(start_day, end_day, 0, result)
+        return result
+
+    def _collect(self, start, end, level, result):
+        """把 [start, end] 拆成尽量少的桶累加到 result
+
+        这一层的整桶是连续的一段，两端不满一桶的部分交给更细的一层。
+        """
+        if start > end:
+            return
+        group = self.LEVELS[level] if level < len(self.LEVELS) else "day"
+        first = bucket_start(start, group)
+        if first < start:
+            first = next_bucket(first, group)
+        day = first
+        while next_bucket(day, group) <= end + _ONE_DAY:
+            stats = self._bucket(group, day)
+            if stats:
+                _add_stats(result, stats)
+            day = next_bucket(day, group)
+        if day == first:
+            # 这一层没有完整的桶
+            if group != "day":
+                self._collect(start, end, level + 1, result)
+            return
+        self._collect(start, first - _ONE_DAY, level + 1, result)
+        self._collect(day, end, level + 1, result)
+
+    def grouped(self, start_day, end_day, group):
+        """[start_day, end_day] 内按天、周、月或年的统计，返回按时间升序的 {桶: {类别: 分钟}}
+
+        完整的桶直接取汇总表，两端被范围截断的桶用 totals 拼出。
+        """
+        result = {}
+        day = bucket_start(start_day, group)
+        while day <= end_day:
+            following = next_bucket(day, group)
+            if day >= start_day and following <= end_day + _ONE_DAY:
+                stats = empty_stats()
+                _add_stats(stats, self._bucket(group, day) or {})
+            else:
+                stats = self.totals(max(day, start_day), min(following - _ONE_DAY, end_day))
+            result[bucket_key(day, group)] = stats
+            day = following
+        return result
+
+def add_active(range_stats, start_day, end_day, group, current_session, now=None):
+    """把正在进行的任务到 now 为止的时长加进 grouped 的结果"""
+    if not current_session:
+        return range_stats
+    category = current_session["category"]
+    for key, minutes in split_by_day(current_session.start_time, now or datetime.now()).items():
+        day = date.fromisoformat(key)
+        if start_day <= day <= end_day:
+            stats = range_stats.setdefault(bucket_key(day, group), empty_stats())
+            stats[category] = stats.get(category, 0) + minutes
+    return range_stats
+
+class SessionIndex:
+    """按开始时间排序的会话索引
+
+    保存每个会话预先算好的开始时间戳，按 (时间戳, id) 排序。
+    按时间范围查询只需二分查找再切片，新增、修改、删除会话时增量更新。
+    """
+
+    def __init__(self, sessions=()):
+        entries = sorted(((session_key(s), s) for s in sessions),
+                         key=lambda entry: entry[0])
+        self._keys = [key for key, _ in entries]
+        self._sessions = [session for _, session in entries]
+        self._key_by_id = {key[1]: key for key in self._keys}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, session):
+        """加入一个会话"""
+        key = session_key(session)
+        i = bisect_left(self._keys, key)
+        self._keys.insert(i, key)
+        self._sessions.insert(i, session)
+        self._key_by_id[session["id"]] = key
+
+    def remove(self, session_id):
+        """按 id 移除一个会话"""
+        key = self._key_by_id.pop(session_id, None)
+        if key is None:
+            return
+        i = bisect_left(self._keys, key)
+        del self._keys[i]
+        del self._sessions[i]
+
+    def replace(self, session):
+        """会话内容变化（可能改了开始时间）后更新索引"""
+        self.remove(session["id"])
+        self.add(session)
+
+    def range(self, since=None, until=None):
+        """开始时间在 [since, until) 内的会话，最新的在前
+
+        since/until 为 ISO 时间字符串，None 表示不限。
+        """
+        lo = 0 if since is None else bisect_left(self._keys, (to_epoch(since),))
+        hi = len(self._keys) if until is None else bisect_left(self._keys, (to_epoch(until),))
+        return self._sessions[lo:hi][::-1]
+
+    def before(self, key=None):
+        """按 (开始时间, id) 从新到旧遍历排在 key 之前的会话
+
+        key 为 (ISO 开始时间, id)，None 表示从最新的开始。
+        """
+        hi = len(self._keys) if key is None else bisect_left(self._keys, (to_epoch(key[0]), key[1]))
+        for i in range(hi - 1, -1, -1):
+            yield self._sessions[i]
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+TimeLog 命令行快速路径
+start/stop/status 常在 shell 提示符和快捷键里调用，这里只依赖数据存储，
+不导入 click、Flask、reportlab 等。timelog_simple.py 启动时先交给 main()，
+参数不是简单形式（--help、未知选项等）时再由完整的 click 命令处理；
+click 命令也调用这里的函数，两条路径输出一致。
+
+STARTUP_BUDGET_MS 是这几个命令的启动时间预算，用 `timelog startup-time` 测量。
+"""
+
+import sys
+from datetime import datetime
+
+from timelog_store import (transaction, record_change, new_session_id,
+                           find_open_session, read_current_session)
+from timelog_engine import CATEGORIES, Session, update_daily_stats
+
+# 从启动解释器到输出结果的时间预算（毫秒）
+STARTUP_BUDGET_MS = 80
+
+CATEGORY_NAMES = {"study": "学习", "game": "游戏", "other": "其他"}
+
+def _confirm(text):
+    """同 click.confirm，默认为否"""
+    while True:
+        try:
+            answer = input(f"{text} [y/N]: ").strip().lower()
+        except EOFError:
+            print("Aborted!", file=sys.stderr)
+            sys.exit(1)
+        if answer in ("y", "yes"):
+            return True
+        if answer in ("n", "no", ""):
+            return False
+        print("Error: invalid input")
+
+def _stop_current(data):
+    """结束 data 中正在进行的会话，返回该会话（没有时返回 None）"""
+    current_session = find_open_session(data.get("sessions", []))
+    if current_session:
+        current_session["end"] = datetime.now().isoformat()
+        delta = update_daily_stats(data, current_session)
+        record_change(data, "stop", current_session, delta=delta)
+    return current_session
+
+def start(task, category, echo=print, confirm=_confirm):
+    """开始一个任务，已有正在进行的任务时先确认再结束它"""
+    # 先确认再加锁，等待用户输入时不阻塞网页端
+    current_session = read_current_session()
+    if current_session:
+        echo(f"警告：当前有正在进行的任务 '{current_session['task']}'")
+        if not confirm("是否结束当前任务并开始新任务？"):
+            return
+
+    with transaction() as data:
+        _stop_current(data)
+
+        session = Session(new_session_id(data), task, category, datetime.now().isoformat())
+        data.setdefault("sessions", []).append(session)
+        record_change(data, "start", session)
+
+    echo(f"🎯 开始{CATEGORY_NAMES[category]}任务: {task}")
+    echo(f"⏰ 开始时间: {datetime.now().strftime('%H:%M:%S')}")
+
+def stop(echo=print):
+    """结束当前任务"""
+    with transaction() as data:
+        current_session = _stop_current(data)
+
+    if not current_session:
+        echo("❌ 没有正在进行的任务！")
+        return
+
+    duration = current_session.duration()
+    echo(f"✅ 结束{CATEGORY_NAMES[current_session['category']]}任务: {current_session['task']}")
+    echo(f"⏱️  持续时间: {duration:.1f} 分钟 ({duration/60:.1f} 小时)")
+
+def status(echo=print):
+    """查看当前状态"""
+    current_session = read_current_session()
+
+    if current_session:
+        duration = current_session.duration()
+        category_name = CATEGORY_NAMES[current_session["category"]]
+
+        echo(f"🔄 当前正在进行: {current_session['task']} ({category_name})")
+        echo(f"⏰ 已进行: {duration:.1f} 分钟 ({duration/60:.1f} 小时)")
+    else:
+        echo("😴 当前没有正在进行的任务")
+
+def _parse_start(args):
+    """解析 start 的参数，返回 (任务, 类别)；不是简单形式时返回 None"""
+    task = None
+    category = "study"
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg in ("-c", "--category"):
+            if i + 1 >= len(args):
+                return None
+            category = args[i + 1]
+            i += 2
+            continue
+        if arg.startswith("--category="):
+            category = arg[len("--category="):]
+        elif arg.startswith("-c") and len(arg) > 2:
+            category = arg[2:]
+        elif arg.startswith("-") or task is not None:
+            return None
+        else:
+            task = arg
+        i += 1
+    if task is None or category not in CATEGORIES:
+        return None
+    return task, category
+
+def main(args):
+    """处理 start/stop/status，已处理返回 True，否则返回 False"""
+    if not args:
+        return False
+    command, rest = args[0], args[1:]
+    if command == "start":
+        parsed = _parse_start(rest)
+        if parsed is None:
+            return False
+        action = lambda: start(*parsed)
+    elif command in ("stop", "status") and not rest:
+        action = stop if command == "stop" else status
+    else:
+        return False
+
+    try:
+        action()
+    except KeyboardInterrupt:
+        print("\nAborted!", file=sys.stderr)
+        sys.exit(1)
+    return True
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+TimeLog 批量导入
+`timelog import FILE` 和 /api/sessions/bulk 共用
+
+支持的格式:
+- csv: 本程序导出的 CSV（开始日期,开始时间,结束日期,结束时间,任务,类别,...），
+  或表头为 task,category,start,end（也可用 start_date/start_time 等）的 CSV
+- json: 会话数组，或带 sessions 字段的对象（导出文件、数据文件均可）
+- ndjson: 每行一条会话
+
+整批先全部校验，有任何错误都不导入；通过后分配 id、一次写入，
+每日统计的增量合并成一份，只更新一次。
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+
+from timelog_engine import CATEGORIES, Session, apply_delta, merge_delta, session_delta
+from timelog_store import new_session_id
+
+FORMATS = ("csv", "json", "ndjson")
+
+# 最多报告这么多条错误
+MAX_ERRORS = 20
+
+# 导出 CSV 的中文表头
+_CSV_COLUMNS = {
+    "开始日期": "start_date",
+    "开始时间": "start_time",
+    "结束日期": "end_date",
+    "结束时间": "end_time",
+    "任务": "task",
+    "类别": "category"
+}
+
+# 导出文件和界面上使用的类别名称
+_CATEGORY_ALIASES = {
+    "📚 学习": "study", "学习": "study",
+    "🎮 游戏": "game", "游戏": "game",
+    "📋 其他": "other", "其他": "other"
+}
+
+class InvalidImport(ValueError):
+    """导入内容无效，errors 为 [(第几条, 原因)]"""
+
+    def __init__(self, errors, total=None):
+        self.errors = errors
+        # 出错的总条数（errors 最多只保留 MAX_ERRORS 条）
+        self.total = total or len(errors)
+        row, reason = errors[0]
+        super().__init__(f"第 {row} 条: {reason}" if row else reason)
+
+def detect_format(filename):
+    """按扩展名判断格式，无法判断时返回 None"""
+    name = filename.lower()
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    if name.endswith(".json"):
+        return "json"
+    return None
+
+def decode(raw):
+    """解码文件内容：UTF-8（可带 BOM），失败时按 GBK（导出 CSV 的另一种编码）"""
+    try:
+        return raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        pass
+    try:
+        return raw.decode("gbk")
+    except UnicodeDecodeError:
+        raise InvalidImport([(0, "文件编码无法识别，应为 UTF-8 或 GBK")]) from None
+
+def parse_records(text, fmt):
+    """把文本解析成原始记录 dict 的列表"""
+    if fmt == "csv":
+        reader = csv.DictReader(io.StringIO(text))
+        return [{_CSV_COLUMNS.get(key.strip(), key.strip()): (value or "").strip()
+                 for key, value in row.items() if key is not None}
+                for row in reader]
+    if fmt == "ndjson":
+        records = []
+        for number, line in enumerate(text.splitlines(), 1):
+            if line.strip():
+                try:
+                    records.append(json.loads(line))
+                except ValueError as e:
+                    raise InvalidImport([(number, f"不是有效的 JSON: {e}")])
+        return records
+    if fmt == "json":
+        try:
+            content = json.loads(text)
+        except ValueError as e:
+            raise InvalidImport([(0, f"不是有效的 JSON: {e}")])
+        if isinstance(content, dict):
+            content = content.get("sessions")
+        if not isinstance(content, list):
+            raise InvalidImport([(0, "JSON 应为会话数组或带 sessions 字段的对象")])
+        return content
+    raise InvalidImport([(0, f"不支持的格式: {fmt}")])
+
+def _parse_time(value):
+    """ISO 时间转换为本地时间（不带时区）的 datetime"""
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is not None:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return dt
+
+def _time_field(record, name):
+    """读取 start/end：ISO 时间，或 *_date 加 *_time"""
+    value = record.get(name)
+    if value:
+        return _parse_time(str(value))
+    day = record.get(f"{name}_date")
+    clock = record.get(f"{name}_time")
+    if not clock:
+        return None
+    if not day and name == "end":
+        # 和新建任务一样，没有结束日期时使用开始日期
+        day = record.get("start_date") or str(record.get("start", ""))[:10]
+    if not day:
+        return None
+    return _parse_time(f"{day}T{clock}")
+
+def normalize(record):
+    """校验一条记录并转换为会话 dict（不含 id），无效时抛出 ValueError"""
+    if not isinstance(record, dict):
+        raise ValueError("记录应为对象")
+    task = str(record.get("task") or "").strip()
+    if not task:
+        raise ValueError("缺少任务名")
+    category = str(record.get("category") or "").strip()
+    category = _CATEGORY_ALIASES.get(category, category)
+    if category not in CATEGORIES:
+        raise ValueError(f"无效的任务类别: {category}")
+
+    start = _time_field(record, "start")
+    if start is None:
+        raise ValueError("缺少开始时间")
+    end = _time_field(record, "end")
+    if end is None:
+        raise ValueError("缺少结束时间（只能导入已结束的任务）")
+    if end <= start:
+        raise ValueError("结束时间必须晚于开始时间")
+
+    return {
+        "task": task,
+        "category": category,
+        "start": start.isoformat(),
+        "end": end.isoformat()
+    }
+
+def validate(records):
+    """校验整批记录，返回会话列表；有错误时抛出 InvalidImport"""
+    sessions = []
+    errors = []
+    error_count = 0
+    for number, record in enumerate(records, 1):
+        try:
+            sessions.append(normalize(record))
+        except (ValueError, TypeError) as e:
+            error_count += 1
+            if len(errors) < MAX_ERRORS:
+                errors.append((number, str(e)))
+    if error_count:
+        raise InvalidImport(errors, error_count)
+    if not sessions:
+        raise InvalidImport([(0, "没有可导入的记录")])
+    return sessions
+
+def load_file(path, fmt=None):
+    """读取并校验导入文件，返回会话列表"""
+    fmt = fmt or detect_format(path)
+    if fmt is None:
+        raise InvalidImport([(0, "无法从扩展名判断格式，请用 --format 指定")])
+    with open(path, "rb") as f:
+        text = decode(f.read())
+    return validate(parse_records(text, fmt))
+
+def add_sessions(data, sessions):
+    """把校验过的会话加入 data，分配 id 并更新每日统计
+
+    返回 (加入的会话, 整批合并后的每日统计增量)，调用方随后用
+    record_import 保存。
+    """
+    added = [Session(new_session_id(data), s["task"], s["category"], s["start"], s["end"]) for s in sessions]
+    delta = {}
+    for session in added:
+        merge_delta(delta, session_delta(session))
+    data.setdefault("sessions", []).extend(added)
+    apply_delta(data, delta)
+    return added, delta
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+TimeLog 运行指标
+网页服务器的 /metrics 接口，输出 Prometheus 文本格式:
+- timelog_http_request_duration_seconds: 请求耗时直方图（按路由、方法、状态码）
+- timelog_storage_operation_duration_seconds: 数据加载、整体保存、增量保存的耗时直方图
+- timelog_storage_bytes_total: 读取、写入数据文件的字节数
+- timelog_data_file_bytes、timelog_sessions: 数据文件大小和会话条数
+
+请求耗时从收到请求算到响应体发送完，流式导出也包含在内；推送连接
+（/api/events）一直保持打开，不计入。
+设置了慢请求阈值（`timelog web --slow-ms` 或环境变量 TIMELOG_SLOW_REQUEST_MS）时，
+超过阈值的请求输出到标准错误。多进程（--workers）时每个进程各自统计。
+"""
+
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime
+
+from werkzeug.wsgi import ClosingIterator
+
+# 直方图的桶上限（秒），同 Prometheus 客户端的默认值
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 应用在 environ 中填入的路由（URL 规则），作为请求耗时的 route 标签
+ROUTE_KEY = "timelog.route"
+
+def slow_ms_from_env():
+    """环境变量 TIMELOG_SLOW_REQUEST_MS 设置的慢请求阈值（毫秒），没有时返回 None"""
+    value = os.environ.get("TIMELOG_SLOW_REQUEST_MS")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(value) if value != int(value) else f"{value:.1f}"
+    return str(value)
+
+class Histogram:
+    """按标签分组的直方图
+
+    每组保存各桶的计数（不累计，输出时再累加）、总和和次数。调用方负责加锁。
+    """
+
+    def __init__(self, name, help_text, label_names, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, label_values, value):
+        series = self._series.get(label_values)
+        if series is None:
+            # 各桶计数（最后一个为 +Inf），然后是总和
+            series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values in sorted(self._series):
+            series = self._series[label_values]
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                le = bound if bound == "+Inf" else _number(bound)
+                labels = _labels(self.label_names, label_values, [("le", le)])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {series[-1]!r}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class Metrics:
+    """进程内的运行指标
+
+    slow_ms 为慢请求阈值（毫秒），None 表示不记录慢请求。
+    """
+
+    def __init__(self, slow_ms=None):
+        self.lock = threading.Lock()
+        self.slow_ms = slow_ms
+        self.requests = Histogram("timelog_http_request_duration_seconds",
+                                  "HTTP 请求耗时（秒）", ("route", "method", "status"))
+        self.storage = Histogram("timelog_storage_operation_duration_seconds",
+                                 "数据读写耗时（秒）：load 加载，save 整体保存，record 增量保存", ("op",))
+        self.bytes = {"read": 0, "written": 0}
+
+    def observe_request(self, route, method, status, seconds, path=None):
+        """记录一个请求，超过慢请求阈值时输出日志"""
+        with self.lock:
+            self.requests.observe((route, method, str(status)), seconds)
+        if self.slow_ms is not None and seconds * 1000 >= self.slow_ms:
+            print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] 🐢 慢请求 {method} {path or route} "
+                  f"{status} {seconds * 1000:.1f} ms", file=sys.stderr, flush=True)
+
+    def observe_io(self, op, seconds, size):
+        """记录一次数据读写（timelog_store.add_io_listener 的监听函数）"""
+        with self.lock:
+            self.storage.observe((op,), seconds)
+            self.bytes["read" if op == "load" else "written"] += size
+
+    def render(self, gauges=()):
+        """输出 Prometheus 文本格式，gauges 为 [(名称, 说明, 值)]"""
+        with self.lock:
+            lines = self.requests.render() + self.storage.render()
+            lines += ["# HELP timelog_storage_bytes_total 读写数据文件的字节数",
+                      "# TYPE timelog_storage_bytes_total counter"]
+            for direction in ("read", "written"):
+                lines.append(f'timelog_storage_bytes_total{{direction="{direction}"}} {self.bytes[direction]}')
+        for name, help_text, value in gauges:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {_number(value)}"]
+        return "\n".join(lines) + "\n"
+
+class MetricsMiddleware:
+    """WSGI 中间件：记录每个请求的耗时
+
+    route 标签取应用填入 environ[ROUTE_KEY] 的 URL 规则（如
+    /api/get_session/<int:session_id>），没有匹配的路由时记为 other，
+    不按原始路径产生无数个序列。
+    """
+
+    def __init__(self, wsgi_app, metrics):
+        self.wsgi_app = wsgi_app
+        self.metrics = metrics
+
+    def __call__(self, environ, start_response):
+        started = time.perf_counter()
+        state = {"status": 500, "stream": False}
+
+        def timed_start_response(status, headers, exc_info=None):
+            state["status"] = int(status.split(" ", 1)[0])
+            state["stream"] = any(name.lower() == "content-type" and value.startswith("text/event-stream")
+                                  for name, value in headers)
+            return start_response(status, headers, exc_info)
+
+        def finish():
+            if state["stream"]:
+                return
+            path = environ.get("PATH_INFO", "")
+            if environ.get("QUERY_STRING"):
+                path += "?" + environ["QUERY_STRING"]
+            self.metrics.observe_request(environ.get(ROUTE_KEY, "other"), environ["REQUEST_METHOD"],
+                                         state["status"], time.perf_counter() - started, path)
+
+        try:
+            body = self.wsgi_app(environ, timed_start_response)
+        except BaseException:
+            finish()
+            raise
+        # 响应体发送完（close）时才算结束
+        return ClosingIterator(body, finish)
@@ -0,0 +1,470 @@
+# -*- coding: utf-8 -*-
+"""
+TimeLog PDF 报告
+在后台线程池中生成统计报告，生成结果按统计周期和数据版本缓存，
+同一周期的数据没有变化时重复下载直接返回缓存
+"""
+
+import os
+import uuid
+import threading
+import importlib.util
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from io import BytesIO
+
+# 缓存的报告份数
+REPORT_CACHE_SIZE = 8
+
+# 最多保留的任务记录数（包括失败的任务）
+MAX_JOBS = 32
+
+def missing_libraries():
+    """生成 PDF 所需但未安装的库"""
+    return [name for name in ("reportlab", "matplotlib")
+            if importlib.util.find_spec(name) is None]
+
+def render_pdf(period_name, recent_stats, trend_stats, detailed_sessions,
+               total_sessions=None, progress=None):
+    """生成 PDF 统计报告，返回 PDF 字节内容
+
+    detailed_sessions 只需包含要列出的最近任务，total_sessions 为周期内的任务总数。
+    progress(百分比) 用于汇报进度。
+    """
+    if total_sessions is None:
+        total_sessions = len(detailed_sessions)
+    if progress is None:
+        progress = lambda percent: None
+    
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import inch, mm
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak, Image as ReportLabImage
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib import colors
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.graphics.shapes import Drawing, Circle, Rect, String
+    from reportlab.graphics.charts.piecharts import Pie
+    from reportlab.graphics.charts.barcharts import VerticalBarChart
+    from reportlab.graphics import renderPDF
+    import matplotlib
+    matplotlib.use('Agg')  # 使用非交互式后端
+    import matplotlib.pyplot as plt
+    import matplotlib.font_manager as fm
+    
+    # 注册中文字体
+    try:
+        # Windows 系统字体路径
+        font_paths = [
+            "C:/Windows/Fonts/msyh.ttc",  # 微软雅黑
+            "C:/Windows/Fonts/simhei.ttf",  # 黑体
+            "C:/Windows/Fonts/simsun.ttc"   # 宋体
+        ]
+    
+        chinese_font = 'Helvetica'  # 默认字体
+        for font_path in font_paths:
+            if os.path.exists(font_path):
+                try:
+                    pdfmetrics.registerFont(TTFont('ChineseFont', font_path))
+                    chinese_font = 'ChineseFont'
+                    break
+                except:
+                    continue
+    except:
+        chinese_font = 'Helvetica'
+    
+    # 设置matplotlib中文字体
+    try:
+        plt.rcParams['font.sans-serif'] = ['Microsoft YaHei', 'SimHei', 'DejaVu Sans']
+        plt.rcParams['axes.unicode_minus'] = False
+    except:
+        pass
+    
+    progress(10)
+    
+    # 创建PDF
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(
+        buffer, 
+        pagesize=A4, 
+        rightMargin=50, 
+        leftMargin=50, 
+        topMargin=50, 
+        bottomMargin=50
+    )
+    
+    # 自定义样式
+    styles = getSampleStyleSheet()
+    
+    # 标题样式
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Title'],
+        fontName=chinese_font,
+        fontSize=28,
+        spaceAfter=30,
+        alignment=1,  # 居中
+        textColor=colors.HexColor('#2C3E50'),
+        borderWidth=1,
+        borderColor=colors.HexColor('#3498DB'),
+        borderRadius=5,
+        backColor=colors.HexColor('#ECF0F1'),
+        borderPadding=20
+    )
+    
+    # 副标题样式
+    subtitle_style = ParagraphStyle(
+        'CustomSubtitle',
+        parent=styles['Normal'],
+        fontName=chinese_font,
+        fontSize=14,
+        spaceAfter=20,
+        alignment=1,
+        textColor=colors.HexColor('#7F8C8D')
+    )
+    
+    # 章节标题样式
+    heading_style = ParagraphStyle(
+        'CustomHeading',
+        parent=styles['Heading1'],
+        fontName=chinese_font,
+        fontSize=18,
+        spaceAfter=15,
+        spaceBefore=20,
+        textColor=colors.HexColor('#2980B9'),
+        borderWidth=0,
+        borderColor=colors.HexColor('#3498DB'),
+        backColor=colors.HexColor('#F8F9FA'),
+        leftIndent=10,
+        borderPadding=8
+    )
+    
+    # 正文样式
+    normal_style = ParagraphStyle(
+        'CustomNormal',
+        parent=styles['Normal'],
+        fontName=chinese_font,
+        fontSize=11,
+        spaceAfter=8,
+        leading=16
+    )
+    
+    # 重点文本样式
+    highlight_style = ParagraphStyle(
+        'Highlight',
+        parent=styles['Normal'],
+        fontName=chinese_font,
+        fontSize=12,
+        textColor=colors.HexColor('#E74C3C'),
+        spaceAfter=6
+    )
+    
+    # 构建PDF内容
+    story = []
+    
+    # 封面
+    story.append(Spacer(1, 50))
+    story.append(Paragraph("TimeLog 统计报告", title_style))
+    story.append(Spacer(1, 20))
+    story.append(Paragraph(f"统计周期：{period_name} | 生成时间：{datetime.now().strftime('%Y年%m月%d日 %H:%M:%S')}", subtitle_style))
+    story.append(Spacer(1, 60))
+    
+    # 创建时间分布饼图
+    total_time = recent_stats['total_study'] + recent_stats['total_game'] + recent_stats['total_other']
+    if total_time > 0:
+        # 添加饼图标题
+        story.append(Paragraph("时间分布统计", heading_style))
+        story.append(Spacer(1, 15))
+        
+        fig, ax = plt.subplots(figsize=(10, 10))  # 增大figure尺寸
+        # 调整子图位置，为标题留更多空间
+        plt.subplots_adjust(top=0.85, bottom=0.15, left=0.15, right=0.85)
+        
+        sizes = [recent_stats['total_study'], recent_stats['total_game'], recent_stats['total_other']]
+        labels = ['学习', '游戏', '其他']
+        colors_pie = ['#3498DB', '#E74C3C', '#F39C12']
+        
+        # 只显示非零的部分
+        non_zero_data = [(size, label, color) for size, label, color in zip(sizes, labels, colors_pie) if size > 0]
+        if non_zero_data:
+            sizes_nz, labels_nz, colors_nz = zip(*non_zero_data)
+            
+            wedges, texts, autotexts = ax.pie(sizes_nz, labels=labels_nz, colors=colors_nz, 
+                                             autopct='%1.1f%%', startangle=90,
+                                             textprops={'fontsize': 28})  # 进一步增大标签字体
+            ax.set_title(f'{period_name}时间分布', fontsize=32, fontweight='bold', pad=40)  # 进一步增大标题字体
+            ax.set_aspect('equal')  # 确保饼图为正圆
+            
+            # 美化饼图 - 进一步增大所有字体
+            for text in texts:
+                text.set_fontsize(26)  # 进一步增大标签字体
+                text.set_fontweight('bold')
+                
+            for autotext in autotexts:
+                autotext.set_color('white')
+                autotext.set_fontweight('bold')
+                autotext.set_fontsize(24)  # 进一步增大百分比字体
+        
+        # 不使用tight_layout，手动控制布局
+        img_buffer = BytesIO()
+        plt.savefig(img_buffer, format='png', dpi=150, bbox_inches=None,  # 使用None而不是tight
+                   facecolor='white', edgecolor='none')  # 确保背景和边缘设置
+        img_buffer.seek(0)
+        plt.close()
+        
+        # 将图片添加到PDF，调整合适尺寸
+        img_size = 400  # 稍微缩小饼图尺寸
+        story.append(ReportLabImage(img_buffer, width=img_size, height=img_size))
+        story.append(Spacer(1, 30))
+    
+    progress(40)
+    
+    # 每日统计图表
+    if trend_stats['daily_stats']:
+        story.append(Paragraph("每日时间趋势", heading_style))
+        story.append(Spacer(1, 15))
+        
+        # 创建每日统计柱状图
+        fig, ax = plt.subplots(figsize=(12, 8))  # 增大纵向尺寸从6到8
+        
+        # 准备数据 - 使用trend_stats
+        dates = list(trend_stats['daily_stats'].keys())
+        study_hours = [trend_stats['daily_stats'][date]['study'] for date in dates]
+        game_hours = [trend_stats['daily_stats'][date]['game'] for date in dates]
+        other_hours = [trend_stats['daily_stats'][date]['other'] for date in dates]
+        
+        # 设置柱状图
+        x = range(len(dates))
+        width = 0.6
+        
+        # 堆叠柱状图
+        bars1 = ax.bar(x, study_hours, width, label='学习', color='#3498DB', alpha=0.8)
+        bars2 = ax.bar(x, game_hours, width, bottom=study_hours, label='游戏', color='#E74C3C', alpha=0.8)
+        bars3 = ax.bar(x, other_hours, width, bottom=[i+j for i,j in zip(study_hours, game_hours)], 
+                      label='其他', color='#F39C12', alpha=0.8)
+        
+        # 设置标签和标题
+        ax.set_xlabel('日期', fontsize=18, fontweight='bold')  # 增大X轴标签字体
+        ax.set_ylabel('时间(小时)', fontsize=18, fontweight='bold')  # 增大Y轴标签字体
+        ax.set_title('每日时间分布趋势', fontsize=22, fontweight='bold', pad=25)  # 增大标题字体
+        ax.set_xticks(x)
+        ax.set_xticklabels(dates, rotation=45 if len(dates) > 7 else 0, fontsize=16)  # 增大X轴刻度字体
+        ax.legend(fontsize=16)  # 增大图例字体
+        
+        # 设置Y轴刻度字体
+        ax.tick_params(axis='y', labelsize=14)
+        
+        # 添加数值标签
+        for i, (study, game, other) in enumerate(zip(study_hours, game_hours, other_hours)):
+            total = study + game + other
+            if total > 0:
+                ax.text(i, total + 0.1, f'{total:.1f}h', ha='center', va='bottom', 
+                       fontweight='bold', fontsize=14)  # 增大数值标签字体
+        
+        # 美化图表
+        ax.grid(True, alpha=0.3, axis='y')
+        ax.set_ylim(0, max([sum([s, g, o]) for s, g, o in zip(study_hours, game_hours, other_hours)]) * 1.1)
+        
+        plt.tight_layout()
+        img_buffer = BytesIO()
+        plt.savefig(img_buffer, format='png', dpi=150, bbox_inches='tight')
+        img_buffer.seek(0)
+        plt.close()
+        
+        # 将图片添加到PDF，增大纵向尺寸
+        story.append(ReportLabImage(img_buffer, width=500, height=333))  # 增大高度，保持12:8的比例
+        story.append(Spacer(1, 20))
+    
+    progress(70)
+    
+    # 详细任务记录
+    if detailed_sessions:
+        story.append(Paragraph("详细任务记录", heading_style))
+        story.append(Spacer(1, 15))
+        
+        task_data = [['开始时间', '结束时间', '任务名称', '类别', '时长', '状态']]
+        
+        for session in detailed_sessions[:20]:  # 只显示最近20个任务
+            start_time = session.start_time
+            category_map = {'study': '学习', 'game': '游戏', 'other': '其他'}
+            category_display = category_map.get(session["category"], session["category"])
+            
+            if session.get("end"):
+                end_time = session.end_time
+                duration = session.duration()
+                status = "已完成"
+                end_time_str = end_time.strftime("%H:%M")
+                duration_str = f"{duration:.0f}分钟"
+            else:
+                duration = (datetime.now() - start_time).total_seconds() / 60
+                status = "进行中"
+                end_time_str = "-"
+                duration_str = f"{duration:.0f}分钟"
+            
+            # 任务名称截取（避免过长）
+            task_name = session["task"]
+            if len(task_name) > 15:
+                task_name = task_name[:12] + "..."
+            
+            task_data.append([
+                start_time.strftime("%m-%d %H:%M"),
+                end_time_str,
+                task_name,
+                category_display,
+                duration_str,
+                status
+            ])
+        
+        task_table = Table(task_data, colWidths=[80, 70, 110, 70, 70, 80])  # 稍微增大列宽
+        task_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#D35400')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, -1), chinese_font),
+            ('FONTSIZE', (0, 0), (-1, 0), 14),  # 增大表头字体
+            ('FONTSIZE', (0, 1), (-1, -1), 12),  # 增大内容字体
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 15),  # 增大表头底部间距
+            ('TOPPADDING', (0, 0), (-1, 0), 12),  # 增加表头顶部间距
+            ('BOTTOMPADDING', (0, 1), (-1, -1), 10),  # 增加内容行底部间距
+            ('TOPPADDING', (0, 1), (-1, -1), 10),  # 增加内容行顶部间距
+            ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#FDF2E9')),
+            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#BDC3C7')),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#FDF2E9')])
+        ]))
+        
+        story.append(task_table)
+        
+        if total_sessions > 20:
+            story.append(Spacer(1, 10))
+            story.append(Paragraph(f"... 还有 {total_sessions - 20} 个任务记录", normal_style))
+    
+    # 页脚信息
+    story.append(Spacer(1, 30))
+    story.append(Paragraph("───────────────────────────────────────", subtitle_style))
+    story.append(Paragraph("本报告由 TimeLog 自动生成 | 持续改进，追求卓越", subtitle_style))
+    
+    progress(90)
+    
+    # 生成PDF
+    doc.build(story)
+    return buffer.getvalue()
+
+class ReportJobs:
+    """报告生成任务队列
+
+    提交的任务在后台线程中执行（matplotlib 的 pyplot 不是线程安全的，
+    默认只用一个工作线程）。生成结果按 key 缓存，key 相同的请求
+    直接复用已完成或正在进行的任务。
+    """
+
+    def __init__(self, max_workers=1):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="timelog-report")
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        # key -> 任务 id，包括正在进行和已完成的任务
+        self._by_key = OrderedDict()
+
+    def find(self, key):
+        """按 key 查找可复用的任务"""
+        with self._lock:
+            job_id = self._by_key.get(key)
+            if job_id is None:
+                return None
+            self._by_key.move_to_end(key)
+            return self._jobs[job_id]
+
+    def submit(self, key, filename, render):
+        """提交任务，render(progress) 返回 PDF 字节内容"""
+        with self._lock:
+            job_id = self._by_key.get(key)
+            if job_id is not None:
+                return self._jobs[job_id]
+
+            job = {
+                "id": uuid.uuid4().hex,
+                "key": key,
+                "status": "queued",
+                "progress": 0,
+                "message": "",
+                "filename": filename,
+                "created": datetime.now().isoformat(),
+                "pdf": None,
+                "done": threading.Event()
+            }
+            self._jobs[job["id"]] = job
+            self._by_key[key] = job["id"]
+            self._trim()
+
+        try:
+            job["future"] = self._executor.submit(self._run, job, render)
+        except RuntimeError:
+            # 已经 shutdown
+            self._fail(job, "服务器正在关闭，报告未生成")
+        return job
+
+    def _run(self, job, render):
+        def progress(percent):
+            job["progress"] = percent
+
+        job["status"] = "running"
+        try:
+            job["pdf"] = render(progress)
+            job["progress"] = 100
+            job["status"] = "done"
+        except Exception as e:
+            self._fail(job, f"生成PDF失败: {str(e)}")
+        finally:
+            job["done"].set()
+
+    def _fail(self, job, message):
+        """把任务标为失败并结束等待"""
+        job["status"] = "error"
+        job["message"] = message
+        with self._lock:
+            # 失败的结果不缓存，下次重新生成
+            if self._by_key.get(job["key"]) == job["id"]:
+                del self._by_key[job["key"]]
+        job["done"].set()
+
+    def _trim(self):
+        """淘汰最久未使用的缓存和多余的任务记录"""
+        while len(self._by_key) > REPORT_CACHE_SIZE:
+            key, job_id = next(iter(self._by_key.items()))
+            if not self._jobs[job_id]["done"].is_set():
+                break
+            del self._by_key[key]
+            del self._jobs[job_id]
+
+        cached = set(self._by_key.values())
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= MAX_JOBS:
+                break
+            if job_id not in cached:
+                del self._jobs[job_id]
+
+    def get(self, job_id):
+        """按 id 获取任务，不存在时返回 None"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wait(self, job, timeout=None):
+        """等待任务完成，超时后返回时任务可能仍在进行"""
+        job["done"].wait(timeout)
+        return job
+
+    def shutdown(self):
+        """不再接受新任务，取消排队的任务，等待正在生成的报告完成
+
+        被取消的任务标为失败，等待它们的请求随之返回。
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            future = job.get("future")
+            if future is not None and future.cancelled():
+                self._fail(job, "服务器正在关闭，报告未生成")
+        self._executor.shutdown(wait=True)
@@ -4,10 +4,9 @@ TimeLog - 时间记录工具
 简化版本，无需复杂模块结构
 """
 
-import click
-import json
 import os
 import sys
+import time
 from datetime import datetime, date, timedelta
 from collections import defaultdict
 
@@ -19,78 +18,17 @@ if sys.platform == "win32":
     if hasattr(sys.stderr, 'buffer'):
         sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
-DATA_FILE = os.path.expanduser("~/.timelog.json")
-
-def load_data():
-    """加载时间日志数据"""
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {"sessions": [], "daily_stats": {}}
-
-def save_data(data):
-    """保存时间日志数据"""
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-
-def get_current_session(data):
-    """获取当前正在进行的会话"""
-    for session in reversed(data.get("sessions", [])):
-        if session.get("end") is None:
-            return session
-    return None
-
-def calculate_duration(start_time, end_time):
-    """计算时长（分钟）"""
-    start = datetime.fromisoformat(start_time)
-    end = datetime.fromisoformat(end_time)
-    return (end - start).total_seconds() / 60
+if __name__ == "__main__":
+    # start/stop/status 走快速路径，不导入 click
+    import timelog_fast
+    if timelog_fast.main(sys.argv[1:]):
+        sys.exit(0)
 
-def update_daily_stats(data, session):
-    """更新每日统计"""
-    if session.get("end") is None:
-        return
-    
-    session_date = datetime.fromisoformat(session["start"]).date().isoformat()
-    category = session["category"]
-    duration = calculate_duration(session["start"], session["end"])
-    
-    if "daily_stats" not in data:
-        data["daily_stats"] = {}
-    
-    if session_date not in data["daily_stats"]:
-        data["daily_stats"][session_date] = {"study": 0, "game": 0, "other": 0}
-    
-    data["daily_stats"][session_date][category] += duration
+import click
 
-def get_current_stats_with_active(data, target_date=None):
-    """获取包含当前正在进行任务的统计数据"""
-    if target_date is None:
-        target_date = date.today().isoformat()
-    
-    # 获取已完成任务的统计
-    daily_stats = data.get("daily_stats", {})
-    current_stats = daily_stats.get(target_date, {"study": 0, "game": 0, "other": 0}).copy()
-    
-    # 检查是否有正在进行的任务
-    current_session = None
-    for session in data.get("sessions", []):
-        if session.get("end") is None:
-            current_session = session
-            break
-    
-    # 如果有正在进行的任务，计算其到当前时间的时长
-    if current_session:
-        session_start = datetime.fromisoformat(current_session["start"])
-        session_date = session_start.date().isoformat()
-        
-        # 只有当任务是在目标日期开始的才计入该日期
-        if session_date == target_date:
-            current_duration = (datetime.now() - session_start).total_seconds() / 60
-            category = current_session["category"]
-            current_stats[category] += current_duration
-    
-    return current_stats, current_session
+import timelog_fast
+from timelog_store import load_data, save_data, record_import, transaction, clear_data, query_sessions, migrate_json, read_current_session
+from timelog_engine import aggregate_recent, get_current_stats_with_active, diff_daily_stats
 
 @click.group()
 def cli():
@@ -108,70 +46,17 @@ def start(task, category):
     timelog start "数学作业" -c study
     timelog start "三角洲行动" -c game
     """
-    data = load_data()
-    
-    # 检查是否有正在进行的任务
-    current_session = get_current_session(data)
-    if current_session:
-        click.echo(f"警告：当前有正在进行的任务 '{current_session['task']}'")
-        if click.confirm("是否结束当前任务并开始新任务？"):
-            current_session["end"] = datetime.now().isoformat()
-            update_daily_stats(data, current_session)
-        else:
-            return
-    
-    # 开始新任务
-    session = {
-        "task": task,
-        "category": category,
-        "start": datetime.now().isoformat(),
-        "end": None
-    }
-    
-    if "sessions" not in data:
-        data["sessions"] = []
-    
-    data["sessions"].append(session)
-    save_data(data)
-    
-    category_name = {"study": "学习", "game": "游戏", "other": "其他"}[category]
-    click.echo(f"🎯 开始{category_name}任务: {task}")
-    click.echo(f"⏰ 开始时间: {datetime.now().strftime('%H:%M:%S')}")
+    timelog_fast.start(task, category, echo=click.echo, confirm=click.confirm)
 
 @cli.command()
 def stop():
     """结束当前任务"""
-    data = load_data()
-    current_session = get_current_session(data)
-    
-    if not current_session:
-        click.echo("❌ 没有正在进行的任务！")
-        return
-    
-    current_session["end"] = datetime.now().isoformat()
-    duration = calculate_duration(current_session["start"], current_session["end"])
-    update_daily_stats(data, current_session)
-    save_data(data)
-    
-    category_name = {"study": "学习", "game": "游戏", "other": "其他"}[current_session["category"]]
-    click.echo(f"✅ 结束{category_name}任务: {current_session['task']}")
-    click.echo(f"⏱️  持续时间: {duration:.1f} 分钟 ({duration/60:.1f} 小时)")
+    timelog_fast.stop(echo=click.echo)
 
 @cli.command()
 def status():
     """查看当前状态"""
-    data = load_data()
-    current_session = get_current_session(data)
-    
-    if current_session:
-        start_time = datetime.fromisoformat(current_session["start"])
-        duration = (datetime.now() - start_time).total_seconds() / 60
-        category_name = {"study": "学习", "game": "游戏", "other": "其他"}[current_session["category"]]
-        
-        click.echo(f"🔄 当前正在进行: {current_session['task']} ({category_name})")
-        click.echo(f"⏰ 已进行: {duration:.1f} 分钟 ({duration/60:.1f} 小时)")
-    else:
-        click.echo("😴 当前没有正在进行的任务")
+    timelog_fast.status(echo=click.echo)
 
 @cli.command()
 @click.option("--date", "-d", "date_param", help="查看指定日期 (YYYY-MM-DD)")
@@ -183,7 +68,7 @@ def stats(date_param, days):
     if date_param:
         # 查看指定日期
         target_date = date_param
-        stats_data, current_session = get_current_stats_with_active(data, target_date)
+        stats_data, current_session = get_current_stats_with_active(data, read_current_session(data), target_date)
         
         if stats_data["study"] > 0 or stats_data["game"] > 0 or stats_data["other"] > 0:
             click.echo(f"\n📅 {target_date} 的时间统计:")
@@ -201,6 +86,9 @@ def stats(date_param, days):
     else:
         # 查看最近N天
         today = date.today()
+        current_session = read_current_session(data)
+        range_stats = aggregate_recent(data, days, current_session, today)
+        
         click.echo(f"\n📊 最近 {days} 天的时间统计:")
         click.echo("=" * 50)
         
@@ -210,7 +98,7 @@ def stats(date_param, days):
         
         for i in range(days):
             day = (today - timedelta(days=i)).isoformat()
-            stats_data, current_session = get_current_stats_with_active(data, day)
+            stats_data = range_stats[day]
             
             study_hours = stats_data["study"] / 60
             game_hours = stats_data["game"] / 60
@@ -238,30 +126,24 @@ def stats(date_param, days):
 @click.option("--days", "-n", default=30, help="查看最近N天")
 def log(days):
     """查看详细的任务记录"""
-    data = load_data()
-    sessions = data.get("sessions", [])
-    
     click.echo(f"\n📝 最近 {days} 天的任务记录:")
     click.echo("=" * 80)
     
     cutoff_date = datetime.now() - timedelta(days=days)
-    recent_sessions = [s for s in sessions 
-                      if datetime.fromisoformat(s["start"]) >= cutoff_date]
+    recent_sessions = query_sessions(since=cutoff_date.isoformat())
     
     if not recent_sessions:
         click.echo("📭 没有找到记录")
         return
     
-    for session in sorted(recent_sessions, key=lambda x: x["start"], reverse=True):
-        start_time = datetime.fromisoformat(session["start"])
+    for session in recent_sessions:
+        start_time = session.start_time
         category_emoji = {"study": "📚", "game": "🎮", "other": "📋"}[session["category"]]
+        duration = session.duration()
         
         if session.get("end"):
-            end_time = datetime.fromisoformat(session["end"])
-            duration = calculate_duration(session["start"], session["end"])
             status = f"✅ {duration:.1f}分钟"
         else:
-            duration = (datetime.now() - start_time).total_seconds() / 60
             status = f"🔄 进行中 {duration:.1f}分钟"
         
         click.echo(f"{category_emoji} {session['task']}")
@@ -272,30 +154,153 @@ def log(days):
 def clear():
     """清除所有数据"""
     if click.confirm("⚠️  确定要清除所有时间记录数据吗？此操作不可恢复！"):
-        if os.path.exists(DATA_FILE):
-            os.remove(DATA_FILE)
+        clear_data()
         click.echo("🗑️  所有数据已清除")
     else:
         click.echo("❌ 操作已取消")
 
+@cli.command()
+@click.option("--to", "target", type=click.Choice(['sqlite', 'binary']), default='sqlite',
+              help="目标存储：sqlite(数据库), binary(列式二进制快照)")
+def migrate(target):
+    """把 JSON 数据导入 SQLite 数据库或列式二进制快照"""
+    count = migrate_json(target)
+    target_name = {"sqlite": "SQLite 数据库", "binary": "列式二进制快照"}[target]
+    click.echo(f"✅ 已导入 {count} 条记录到{target_name}")
+    click.echo(f"设置环境变量 TIMELOG_STORAGE={target} 后即可使用")
+
+def check_daily_stats(repair, rebuild=False):
+    """从任务记录重新计算每日统计并和已保存的比较
+
+    repair 时发现不一致就覆盖保存；rebuild 时无论是否一致都覆盖保存。
+    """
+    # 安装了 numpy 时向量化计算，导入较慢，只在这里用到
+    from timelog_analytics import rebuild_daily_stats
+    
+    category_name = {"study": "学习", "game": "游戏", "other": "其他"}
+    started = time.perf_counter()
+    with transaction() as data:
+        loaded = time.perf_counter()
+        expected = rebuild_daily_stats(data.get("sessions", []))
+        rebuilt = time.perf_counter()
+        mismatches = diff_daily_stats(expected, data.get("daily_stats", {}))
+        compared = time.perf_counter()
+        
+        click.echo(f"🔍 检查了 {len(data.get('sessions', []))} 条记录，{len(expected)} 天的统计")
+        if mismatches:
+            click.echo(f"❌ 发现 {len(mismatches)} 处不一致:")
+            for day, category, want, have in mismatches[:20]:
+                click.echo(f"   {day} {category_name.get(category, category)}: 应为 {want:.1f} 分钟，实际 {have:.1f} 分钟")
+            if len(mismatches) > 20:
+                click.echo(f"   ……还有 {len(mismatches) - 20} 处")
+        else:
+            click.echo("✅ 每日统计和任务记录一致")
+        
+        saved = None
+        if rebuild or (repair and mismatches):
+            data["daily_stats"] = expected
+            save_data(data)
+            saved = time.perf_counter()
+    
+    timing = f"读取 {(loaded - started) * 1000:.1f}ms，重新计算 {(rebuilt - loaded) * 1000:.1f}ms，比较 {(compared - rebuilt) * 1000:.1f}ms"
+    if saved is not None:
+        timing += f"，保存 {(saved - compared) * 1000:.1f}ms"
+    click.echo(f"⏱️  {timing}")
+    if saved is not None:
+        click.echo("🛠️  已用重新计算的结果覆盖每日统计")
+    elif mismatches:
+        click.echo("使用 timelog verify --repair 或 timelog reindex 修复")
+
+@cli.command()
+@click.option("--repair", is_flag=True, help="发现不一致时用重新计算的结果覆盖")
+def verify(repair):
+    """检查每日统计是否和任务记录一致"""
+    check_daily_stats(repair)
+
+@cli.command()
+def reindex():
+    """从任务记录重建每日统计"""
+    check_daily_stats(repair=True, rebuild=True)
+
+@cli.command(name="import")
+@click.argument("file", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "-f", "fmt", type=click.Choice(['csv', 'json', 'ndjson']),
+              help="文件格式，默认按扩展名判断")
+@click.option("--dry-run", is_flag=True, help="只检查，不导入")
+def import_file(file, fmt, dry_run):
+    """从 CSV/JSON/NDJSON 文件批量导入任务记录"""
+    from timelog_import import InvalidImport, load_file, add_sessions
+    
+    started = time.perf_counter()
+    try:
+        sessions = load_file(file, fmt)
+    except InvalidImport as e:
+        click.echo(f"❌ 有 {e.total} 条记录无效，未导入任何记录:")
+        for row, reason in e.errors:
+            click.echo(f"   第 {row} 条: {reason}" if row else f"   {reason}")
+        if e.total > len(e.errors):
+            click.echo(f"   ……还有 {e.total - len(e.errors)} 条")
+        return
+    parsed = time.perf_counter()
+    
+    if dry_run:
+        click.echo(f"✅ {len(sessions)} 条记录检查通过（未导入）")
+        return
+    
+    with transaction() as data:
+        added, delta = add_sessions(data, sessions)
+        record_import(data, added, delta)
+    
+    click.echo(f"✅ 已导入 {len(added)} 条记录（id {added[0]['id']}-{added[-1]['id']}），"
+               f"涉及 {len(delta)} 天的统计")
+    click.echo(f"⏱️  解析 {(parsed - started) * 1000:.0f} ms，写入 {(time.perf_counter() - parsed) * 1000:.0f} ms")
+
+@cli.command(name="startup-time")
+@click.option("--runs", "-n", default=20, type=click.IntRange(min=1), help="测量次数")
+def startup_time(runs):
+    """测量 status 命令的启动时间，超出预算时返回非零退出码"""
+    import subprocess
+    
+    if getattr(sys, 'frozen', False):
+        command = [sys.executable, "status"]
+    else:
+        command = [sys.executable, os.path.abspath(__file__), "status"]
+    
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    median = timings[len(timings) // 2]
+    budget = timelog_fast.STARTUP_BUDGET_MS
+    
+    click.echo(f"⏱️  timelog status 启动时间（{runs} 次）: 最快 {timings[0]:.0f} ms，"
+               f"中位数 {median:.0f} ms，最慢 {timings[-1]:.0f} ms")
+    if median <= budget:
+        click.echo(f"✅ 在预算 {budget} ms 以内")
+    else:
+        click.echo(f"❌ 超出预算 {budget} ms")
+        sys.exit(1)
+
 @cli.command()
 @click.option("--days", "-n", default=7, help="显示最近N天")
 def chart(days):
     """生成简单的文本图表"""
     data = load_data()
-    daily_stats = data.get("daily_stats", {})
     
     click.echo(f"\n📈 最近 {days} 天的时间图表:")
     click.echo("=" * 60)
     
     today = date.today()
+    range_stats = aggregate_recent(data, days, read_current_session(data), today)
     max_hours = 0
     
     # 收集数据并找出最大值
     chart_data = []
     for i in range(days-1, -1, -1):
         day = (today - timedelta(days=i)).isoformat()
-        stats = daily_stats.get(day, {"study": 0, "game": 0, "other": 0})
+        stats = range_stats[day]
         
         study_hours = stats["study"] / 60
         game_hours = stats["game"] / 60
@@ -352,8 +357,18 @@ def chart(days):
 @cli.command()
 @click.option("--port", "-p", default=5000, help="Web服务器端口")
 @click.option("--no-browser", is_flag=True, help="不自动打开浏览器")
-def web(port, no_browser):
-    """启动Web界面服务器"""
+@click.option("--host", default="localhost", help="监听地址，0.0.0.0 表示允许其他设备访问")
+@click.option("--threads", "-t", type=click.IntRange(min=1), help="生产模式：每个进程的工作线程数")
+@click.option("--workers", "-w", type=click.IntRange(min=1), help="生产模式：进程数（仅 Linux/macOS）")
+@click.option("--async", "async_mode", is_flag=True, help="异步模式：用 uvicorn 运行异步接口")
+@click.option("--slow-ms", type=click.FloatRange(min=0), help="把超过这么多毫秒的请求输出到标准错误")
+def web(port, no_browser, host, threads, workers, async_mode, slow_ms):
+    """启动Web界面服务器
+    
+    指定 --threads 或 --workers 时使用生产模式服务器（安装了 waitress
+    时使用 waitress）；--async 时用 uvicorn 运行异步接口，推送连接
+    不占用线程；否则使用开发服务器。
+    """
     try:
         # 检查Flask是否已安装
         import flask
@@ -393,7 +408,9 @@ def web(port, no_browser):
         
         # 启动服务器
         click.echo("🚀 启动TimeLog Web界面...")
-        web_server.run_server(port=port, debug=False, open_browser_flag=not no_browser)
+        web_server.run_server(port=port, debug=False, open_browser_flag=not no_browser,
+                              host=host, threads=threads, workers=workers, async_mode=async_mode,
+                              slow_ms=slow_ms)
         
     except KeyboardInterrupt:
         click.echo("\n👋 Web服务器已停止")
@@ -0,0 +1,1058 @@
+# -*- coding: utf-8 -*-
+"""
+TimeLog 数据存储
+命令行和网页服务器共用的读写逻辑
+
+存储模式（环境变量 TIMELOG_STORAGE）:
+- json: 每次修改整体重写 ~/.timelog.json（默认）
+- journal: 每次修改只向 ~/.timelog.journal 追加一行记录，
+  日志过大时再压缩进 ~/.timelog.json 快照
+- sqlite: 存入 ~/.timelog.db，按开始时间和类别建索引，
+  用 `timelog migrate` 从 JSON 文件导入
+- binary: 列式二进制快照 ~/.timelog.bin（见 timelog_columnar）加上
+  同 journal 模式的日志，用 `timelog migrate --to binary` 导入
+
+每个会话都有稳定的整数 id，删除其他会话后也不会改变。
+
+命令行和网页服务器可以同时运行：所有修改都在 ~/.timelog.lock
+文件锁内完成，整体写入时先写临时文件再替换，读取方只会看到
+完整的旧文件或新文件。
+
+~/.timelog.current 记录当前正在进行的会话，每次修改时按操作更新，
+查看状态时不需要加载会话列表。
+"""
+
+import contextlib
+import errno
+import functools
+import gc
+from itertools import islice
+import json
+import os
+import sys
+import threading
+import time
+
+from timelog_engine import (STATS_FORMAT, Session, SessionIndex, StatsRollup, apply_delta, json_default,
+                            session_key, to_epoch, to_sessions)
+# timelog_columnar 只在 binary 模式下用到时才导入，命令行启动时少加载一个模块
+
+DATA_FILE = os.path.expanduser("~/.timelog.json")
+JOURNAL_FILE = os.path.expanduser("~/.timelog.journal")
+DB_FILE = os.path.expanduser("~/.timelog.db")
+BIN_FILE = os.path.expanduser("~/.timelog.bin")
+LOCK_FILE = os.path.expanduser("~/.timelog.lock")
+CURRENT_FILE = os.path.expanduser("~/.timelog.current")
+
+STORAGE_MODE = os.environ.get("TIMELOG_STORAGE", "json")
+
+# 日志文件超过该大小（字节）时压缩进快照
+JOURNAL_COMPACT_BYTES = 256 * 1024
+
+# ---- 文件锁和原子写入 ----
+
+if sys.platform == "win32":
+    import msvcrt
+
+    # 其他进程持有锁时 LockFile 返回的 ERROR_LOCK_VIOLATION
+    _ERROR_LOCK_VIOLATION = 33
+
+    def _lock_file(f):
+        f.seek(0)
+        while True:
+            try:
+                # LK_LOCK 自己会重试约 10 秒，仍未拿到时抛出 EDEADLOCK
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError as e:
+                # 只有锁被占用时才继续等；EBADF、EACCES 等其他错误直接抛出
+                if e.errno != errno.EDEADLOCK and getattr(e, "winerror", None) != _ERROR_LOCK_VIOLATION:
+                    raise
+
+    def _unlock_file(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _lock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def _unlock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+_lock_guard = threading.RLock()
+_lock_depth = 0
+_lock_handle = None
+
+@contextlib.contextmanager
+def locked():
+    """持有跨进程的数据锁（排他、可重入）
+
+    同一进程的线程之间用 _lock_guard 互斥，进程之间对
+    ~/.timelog.lock 加建议锁互斥。
+    """
+    global _lock_depth, _lock_handle
+    with _lock_guard:
+        if _lock_depth == 0:
+            handle = open(LOCK_FILE, "a+")
+            try:
+                _lock_file(handle)
+            except BaseException:
+                handle.close()
+                raise
+            _lock_handle = handle
+        _lock_depth += 1
+        try:
+            yield
+        finally:
+            _lock_depth -= 1
+            if _lock_depth == 0:
+                _unlock_file(_lock_handle)
+                _lock_handle.close()
+                _lock_handle = None
+
+def _replace(src, dst):
+    """用 src 替换 dst"""
+    for attempt in range(20):
+        try:
+            os.replace(src, dst)
+            return
+        except PermissionError:
+            # Windows 下其他进程正打开 dst 读取时无法替换，稍等重试
+            if sys.platform != "win32" or attempt == 19:
+                raise
+            time.sleep(0.05)
+
+def _fsync_dir(path):
+    """把目录项（重命名）刷到磁盘，Windows 下不需要也不支持"""
+    if sys.platform == "win32":
+        return
+    fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _atomic_write(path, write, binary=False):
+    """原子地重写文件：write(f) 写入临时文件，fsync 后替换 path"""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with (open(tmp, "wb") if binary else open(tmp, "w", encoding="utf-8")) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+            _count_written(os.fstat(f.fileno()).st_size)
+        _replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    _fsync_dir(path)
+
+# ---- I/O 统计 ----
+# 监听函数 func(操作, 秒数, 字节数)，操作为 load/save/record：load 的字节数
+# 为读取的数据文件大小，save/record 为写入的字节数（sqlite 模式不计写入）。
+# 网页服务器用它输出 /metrics；没有注册监听函数时不做任何统计。
+_io_listeners = []
+_io_state = threading.local()
+
+def add_io_listener(func):
+    """注册 I/O 监听函数"""
+    _io_listeners.append(func)
+
+def _count_written(size):
+    if _io_listeners:
+        _io_state.written = getattr(_io_state, "written", 0) + size
+
+def _timed_io(op):
+    """统计被装饰函数的耗时和读写字节数，通知监听函数"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _io_listeners:
+                return func(*args, **kwargs)
+            _io_state.written = 0
+            started = time.perf_counter()
+            result = func(*args, **kwargs)
+            seconds = time.perf_counter() - started
+            size = data_file_size() if op == "load" else _io_state.written
+            for listener in _io_listeners:
+                listener(op, seconds, size)
+            return result
+        return wrapper
+    return decorator
+
+# ---- 当前会话指针 ----
+
+def _data_files():
+    """当前存储模式下的数据文件"""
+    if STORAGE_MODE == "sqlite":
+        return (DB_FILE, DB_FILE + "-wal")
+    if STORAGE_MODE == "binary":
+        return (BIN_FILE, JOURNAL_FILE)
+    return (DATA_FILE, JOURNAL_FILE)
+
+def data_file_size():
+    """当前存储模式下数据文件的总字节数"""
+    return sum(os.path.getsize(path) for path in _data_files() if os.path.exists(path))
+
+def file_signature():
+    """数据文件的 (修改时间, 大小, inode) 签名
+
+    原子写入会换成新文件，所以也比较 inode。
+    """
+    signature = []
+    for path in _data_files():
+        try:
+            st = os.stat(path)
+            signature.append((st.st_mtime_ns, st.st_size, st.st_ino))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+def _pointer_signature():
+    return [list(entry) if entry else None for entry in file_signature()]
+
+def _read_pointer():
+    """读取当前会话指针，返回 (是否有效, 会话)
+
+    指针里记着写入时数据文件的签名，数据文件之后被改过（旧版本程序、
+    手工编辑、写指针前崩溃等）时签名对不上，视为失效。
+    """
+    try:
+        with open(CURRENT_FILE, "r", encoding="utf-8") as f:
+            pointer = json.load(f)
+        if pointer["mode"] == STORAGE_MODE and pointer["signature"] == _pointer_signature():
+            session = pointer["session"]
+            return True, Session.from_dict(session) if session else None
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return False, None
+
+def _write_pointer(session):
+    """写入当前会话指针，调用方持有锁且数据文件已经写完
+
+    失效的指针只会让读取方退回到加载数据，所以不需要 fsync。
+    """
+    pointer = {"mode": STORAGE_MODE, "signature": _pointer_signature(), "session": session}
+    tmp = f"{CURRENT_FILE}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(pointer, f, ensure_ascii=False, default=json_default)
+        _replace(tmp, CURRENT_FILE)
+    except OSError:
+        # 写不了指针不影响数据，旧指针的签名已经对不上
+        pass
+
+def _next_current(current, op, session):
+    """按这次修改推算新的当前会话"""
+    if op == "import":
+        # 导入的会话都已结束
+        return current
+    if op in ("start", "create", "edit") and session.get("end") is None:
+        return session
+    if current is not None and op in ("stop", "edit", "delete") and current["id"] == session["id"]:
+        return None
+    return current
+
+def read_current_session(data=None):
+    """当前正在进行的会话（只供读取）
+
+    先读当前会话指针，不加载会话列表。指针失效时在 data 中查找；
+    没有传入 data 时加锁重新计算（sqlite 模式走未结束会话的部分索引，
+    其他模式加载数据）并重写指针。
+    """
+    valid, session = _read_pointer()
+    if valid:
+        return session
+    if data is not None:
+        return find_open_session(data.get("sessions", []))
+    with locked():
+        if STORAGE_MODE == "sqlite":
+            row = _sqlite_connect().execute(
+                'SELECT id, task, category, start, "end" FROM sessions '
+                'WHERE "end" IS NULL ORDER BY id DESC LIMIT 1').fetchone()
+            session = _row_to_session(row) if row else None
+        else:
+            session = find_open_session(load_data().get("sessions", []))
+        _write_pointer(session)
+    return session
+
+@contextlib.contextmanager
+def _gc_paused():
+    """批量生成会话时暂停分代垃圾回收
+
+    加载时生成的几十万个对象都会一直使用，期间反复触发的回收只是白白
+    扫描它们。
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def empty_data():
+    """空数据结构"""
+    return {"sessions": [], "daily_stats": {}, "next_id": 1, "stats_format": STATS_FORMAT}
+
+def _ensure_ids(data):
+    """给没有 id 的旧数据按顺序分配 id"""
+    sessions = data.setdefault("sessions", [])
+    next_id = max(data.get("next_id", 1),
+                  max((session.id + 1 for session in sessions if session.id is not None), default=1))
+    for session in sessions:
+        if session.id is None:
+            session.id = next_id
+            next_id += 1
+    data["next_id"] = next_id
+
+def new_session_id(data):
+    """分配一个新的会话 id"""
+    session_id = data.get("next_id", 1)
+    data["next_id"] = session_id + 1
+    return session_id
+
+def _read_snapshot():
+    """读取快照文件"""
+    if STORAGE_MODE == "binary":
+        # 列式快照里的会话都有 id，不需要逐条检查
+        from timelog_columnar import load_columns
+        return load_columns(BIN_FILE) if os.path.exists(BIN_FILE) else empty_data()
+    if not os.path.exists(DATA_FILE):
+        return empty_data()
+    with _gc_paused():
+        with open(DATA_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        data["sessions"] = to_sessions(data.get("sessions", []))
+        _ensure_ids(data)
+    return data
+
+def _read_journal():
+    """读取日志：返回 (代号, 记录列表)，日志不存在时代号为 None"""
+    if not os.path.exists(JOURNAL_FILE):
+        return None, []
+
+    generation = None
+    records = []
+    with open(JOURNAL_FILE, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 写入中途崩溃可能留下半行，跳过即可（下一次追加前会先补上
+                # 换行，见 _persist_change，半行不会和后面的记录连在一起）
+                continue
+            if "gen" in record and "op" not in record:
+                generation = record["gen"]
+            else:
+                records.append(record)
+    return generation, records
+
+def find_open_session(sessions):
+    """从后往前查找未结束的会话"""
+    if hasattr(sessions, "find_open"):
+        # 列式快照只扫描结束时间列
+        return sessions.find_open()
+    for session in reversed(sessions):
+        if session.get("end") is None:
+            return session
+    return None
+
+def _locate(sessions, record):
+    """找到记录对应会话的位置，"i" 只是提示，以 "id" 为准"""
+    index = record.get("i")
+    if "id" not in record:
+        return index
+    if index is not None and 0 <= index < len(sessions) and sessions[index].get("id") == record["id"]:
+        return index
+    for i, session in enumerate(sessions):
+        if session.get("id") == record["id"]:
+            return i
+    return None
+
+def apply_record(data, record):
+    """把一条日志记录应用到内存数据上"""
+    sessions = data.setdefault("sessions", [])
+    op = record["op"]
+
+    if op in ("start", "create", "import"):
+        # import 一次追加一批会话
+        batch = record["s"] if op == "import" else [record["s"]]
+        batch = [Session.from_dict(session) for session in batch]
+        for session in batch:
+            if "id" not in session:
+                session["id"] = new_session_id(data)
+            else:
+                data["next_id"] = max(data.get("next_id", 1), session["id"] + 1)
+        sessions.extend(batch)
+    elif op == "stop":
+        index = _locate(sessions, record)
+        session = sessions[index] if index is not None else find_open_session(sessions)
+        if session is not None:
+            session["end"] = record["end"]
+    elif op in ("edit", "delete"):
+        index = _locate(sessions, record)
+        if index is not None:
+            if op == "edit":
+                sessions[index] = Session.from_dict(record["s"])
+            else:
+                sessions.pop(index)
+
+    # 每日统计的增量
+    apply_delta(data, record.get("d"))
+
+@_timed_io("load")
+def load_data():
+    """加载时间日志数据
+
+    每日统计是旧格式时（见 timelog_engine.STATS_FORMAT）先重建并保存。
+    """
+    data = _load_data()
+    if data.get("stats_format") != STATS_FORMAT:
+        data = _upgrade_stats()
+    return data
+
+def _upgrade_stats():
+    """按现在的算法重建旧格式的每日统计并保存，只做一次"""
+    with locked():
+        # 锁内重新读取，其他进程可能刚刚升级过
+        data = _load_data()
+        if data.get("stats_format") != STATS_FORMAT:
+            # 只升级一次，用到时再导入（可能加载 numpy）
+            from timelog_analytics import rebuild_daily_stats
+            data["daily_stats"] = rebuild_daily_stats(data.get("sessions", []))
+            data["stats_format"] = STATS_FORMAT
+            _save_data(data)
+    return data
+
+def _load_data():
+    if STORAGE_MODE == "sqlite":
+        return _sqlite_load()
+
+    # 快照 + 日志回放
+    data = _read_snapshot()
+
+    generation, records = _read_journal()
+    # 代号不一致说明日志已经压缩进快照，只是旧日志还没来得及清掉
+    if generation is not None and generation == data.get("journal_gen", 0):
+        for record in records:
+            apply_record(data, record)
+
+    return data
+
+@contextlib.contextmanager
+def transaction():
+    """加锁的读-改-写
+
+    在锁内读取最新数据，调用方修改后在同一个 with 块内用
+    record_change 或 save_data 保存，期间其他进程不能写入。
+    """
+    with locked():
+        yield load_data()
+
+def _journal_generation():
+    """日志文件头中的代号"""
+    with open(JOURNAL_FILE, "r", encoding="utf-8") as f:
+        try:
+            return json.loads(f.readline()).get("gen")
+        except ValueError:
+            return None
+
+def _write_journal_header(generation):
+    """新建只有文件头的日志"""
+    _atomic_write(JOURNAL_FILE, lambda f: f.write(json.dumps({"gen": generation}) + "\n"))
+
+@_timed_io("save")
+def save_data(data):
+    """保存时间日志数据（整体写入）"""
+    with locked():
+        _save_data(data)
+        _write_pointer(find_open_session(data.get("sessions", [])))
+
+def _save_data(data):
+    if STORAGE_MODE == "sqlite":
+        _sqlite_save(data)
+        return
+
+    has_journal = os.path.exists(JOURNAL_FILE)
+    if has_journal:
+        # 快照已包含日志中的全部修改，换一个代号让旧日志失效
+        data["journal_gen"] = data.get("journal_gen", 0) + 1
+
+    if STORAGE_MODE == "binary":
+        from timelog_columnar import write_columns
+        _atomic_write(BIN_FILE, lambda f: write_columns(f, data), binary=True)
+    else:
+        # 先整体转换成 dict，比逐条经过 default 快
+        snapshot = dict(data, sessions=[session.to_dict() for session in data.get("sessions", [])])
+        _atomic_write(DATA_FILE, lambda f: json.dump(snapshot, f, indent=2, ensure_ascii=False))
+
+    if has_journal:
+        _write_journal_header(data["journal_gen"])
+
+def compact(data):
+    """把日志压缩进快照"""
+    _save_data(data)
+
+@_timed_io("record")
+def record_change(data, op, session=None, index=None, delta=None):
+    """持久化一次修改
+
+    data 应当已经包含这次修改。journal 和 binary 模式下只追加一行记录，
+    sqlite 模式下只改动对应的行，json 模式下整体保存。
+
+    op: start/stop/edit/delete/create
+    session: 修改后的会话（delete 时为被删除的会话）
+    index: 会话修改前在列表中的位置（可选，加快日志回放）
+    delta: 每日统计的增量 {日期: {类别: 分钟}}
+
+    data 需要是在同一把锁内读到的（见 transaction），否则可能覆盖
+    其他进程刚写入的修改。
+    """
+    with locked():
+        _record_change(data, op, session, index, delta)
+
+@_timed_io("record")
+def record_import(data, sessions, delta):
+    """持久化批量导入的一批会话
+
+    data 应当已经包含这些会话和每日统计增量（见 timelog_import）。
+    整批只写一次：journal 和 binary 模式下追加一行记录（日志会因此
+    超过上限时直接压缩进快照），sqlite 模式下一个事务内批量插入，
+    json 模式下整体保存一次。
+    """
+    with locked():
+        _record_change(data, "import", sessions, None, delta)
+
+def _record_change(data, op, session, index, delta):
+    # 写入前读指针：data 是在同一把锁内读到的，指针有效就说明它和 data 一致
+    valid, current = _read_pointer()
+    _persist_change(data, op, session, index, delta)
+    if valid:
+        current = _next_current(current, op, session)
+    else:
+        current = find_open_session(data.get("sessions", []))
+    _write_pointer(current)
+
+def _persist_change(data, op, session, index, delta):
+    if STORAGE_MODE == "sqlite":
+        _sqlite_record(op, session, delta)
+        return
+    if STORAGE_MODE not in ("journal", "binary"):
+        _save_data(data)
+        return
+
+    record = {"op": op}
+    if op == "stop":
+        record["end"] = session["end"]
+    elif op != "delete":
+        record["s"] = session
+    if op in ("stop", "edit", "delete"):
+        record["id"] = session["id"]
+        if index is not None:
+            record["i"] = index
+    if delta:
+        record["d"] = delta
+
+    line = json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=json_default) + "\n"
+    size = os.path.getsize(JOURNAL_FILE) if os.path.exists(JOURNAL_FILE) else 0
+    if size + len(line) > JOURNAL_COMPACT_BYTES:
+        # 追加后就要压缩，直接写快照（data 已包含这次修改），省掉一次写入
+        compact(data)
+        return
+
+    if size and _journal_generation() != data.get("journal_gen", 0):
+        # 快照写完、旧日志还没换掉时崩溃留下的旧日志，回放时整个被忽略，
+        # 不能接着往里追加
+        size = 0
+    if not size:
+        _write_journal_header(data.get("journal_gen", 0))
+
+    encoded = line.encode("utf-8")
+    with open(JOURNAL_FILE, "a+b") as f:
+        if size:
+            # 上次写入中途崩溃时文件不以换行结尾，先补上换行，
+            # 否则这条记录会接在半行后面，回放时一起被跳过
+            f.seek(size - 1)
+            if f.read(1) != b"\n":
+                encoded = b"\n" + encoded
+        f.write(encoded)
+        f.flush()
+        os.fsync(f.fileno())
+    _count_written(len(encoded))
+
+def query_sessions(since=None, until=None, data=None):
+    """按开始时间查询会话，最新的在前
+
+    since/until 为 ISO 格式时间字符串，范围为 [since, until)。
+    sqlite 模式下直接走 start 索引，binary 模式在开始时间列上二分查找，
+    其他模式在 data（默认重新加载）中筛选。
+    """
+    if STORAGE_MODE == "sqlite":
+        return _sqlite_query(since, until)
+
+    if data is None:
+        data = load_data()
+    sessions = data.get("sessions", [])
+    if hasattr(sessions, "range"):
+        result = sessions.range(since, until)
+        if result is not None:
+            return result
+    # ISO 格式的时间字符串按字典序比较即按时间先后比较
+    result = [s for s in sessions
+              if (since is None or s["start"] >= since)
+              and (until is None or s["start"] < until)]
+    result.sort(key=lambda x: x["start"], reverse=True)
+    return result
+
+def session_filter(category=None, q=None):
+    """返回按类别和任务名筛选会话的函数
+
+    q 为任务名中包含的文字，不区分大小写。
+    """
+    q = q.casefold() if q else None
+
+    def match(session):
+        return ((category is None or session["category"] == category)
+                and (q is None or q in session["task"].casefold()))
+    return match
+
+def page_sessions(before=None, limit=50, category=None, q=None, data=None):
+    """按 (开始时间, id) 从新到旧分页查询会话
+
+    before 为上一页最后一条的 (ISO 开始时间, id)，None 表示从最新的开始；
+    category/q 同 session_filter。返回最多 limit 条会话。
+    sqlite 模式下走 start 索引，每页只读 limit 条；其他模式在 data
+    （默认重新加载）中筛选排序，常驻进程应使用 DataStore.page_sessions。
+    """
+    if STORAGE_MODE == "sqlite":
+        return _sqlite_page(before, limit, category, q)
+
+    if data is None:
+        data = load_data()
+    match = session_filter(category, q)
+    result = sorted((s for s in data.get("sessions", []) if match(s)),
+                    key=session_key, reverse=True)
+    if before is not None:
+        key = (to_epoch(before[0]), before[1])
+        result = [s for s in result if session_key(s) < key]
+    return result[:limit]
+
+def clear_data():
+    """删除所有数据"""
+    with locked():
+        paths = [DATA_FILE, JOURNAL_FILE, BIN_FILE, CURRENT_FILE]
+        if STORAGE_MODE == "sqlite":
+            # 其他线程可能还连着数据库，清空表而不是删除文件
+            _sqlite_save(empty_data())
+        else:
+            paths += [DB_FILE, DB_FILE + "-wal", DB_FILE + "-shm"]
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+# ---- SQLite 后端 ----
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    task TEXT NOT NULL,
+    category TEXT NOT NULL,
+    start TEXT NOT NULL,
+    "end" TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_start ON sessions(start);
+CREATE INDEX IF NOT EXISTS idx_sessions_category ON sessions(category, start);
+CREATE INDEX IF NOT EXISTS idx_sessions_open ON sessions(id) WHERE "end" IS NULL;
+CREATE TABLE IF NOT EXISTS daily_stats (
+    day TEXT NOT NULL,
+    category TEXT NOT NULL,
+    minutes REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, category)
+);
+"""
+
+_local = threading.local()
+
+def _sqlite_connect():
+    """获取当前线程的数据库连接"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        import sqlite3
+        conn = sqlite3.connect(DB_FILE)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version == 0 and conn.execute("SELECT 1 FROM sessions LIMIT 1").fetchone() is None:
+            # 新建的数据库直接标为当前的每日统计格式
+            conn.execute(f"PRAGMA user_version = {STATS_FORMAT}")
+        _local.conn = conn
+    return conn
+
+def _sqlite_close():
+    """关闭当前线程的数据库连接"""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+def _row_to_session(row):
+    return Session(row["id"], row["task"], row["category"], row["start"], row["end"])
+
+def _sqlite_load():
+    conn = _sqlite_connect()
+    data = empty_data()
+    with _gc_paused():
+        data["sessions"] = [_row_to_session(row) for row in
+                            conn.execute('SELECT id, task, category, start, "end" FROM sessions ORDER BY id')]
+    for row in conn.execute("SELECT day, category, minutes FROM daily_stats"):
+        if row["day"] not in data["daily_stats"]:
+            data["daily_stats"][row["day"]] = {"study": 0, "game": 0, "other": 0}
+        data["daily_stats"][row["day"]][row["category"]] = row["minutes"]
+    # 用 AUTOINCREMENT 的计数器而不是 MAX(id)，删除最新的会话后 id 也不会被复用
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'sessions'").fetchone()
+    data["next_id"] = (row[0] if row else 0) + 1
+    # 每日统计的格式版本存在 user_version 里
+    data["stats_format"] = conn.execute("PRAGMA user_version").fetchone()[0]
+    return data
+
+def _sqlite_save(data):
+    conn = _sqlite_connect()
+    with conn:
+        conn.execute("DELETE FROM sessions")
+        conn.execute("DELETE FROM daily_stats")
+        conn.executemany(
+            'INSERT INTO sessions (id, task, category, start, "end") VALUES (?, ?, ?, ?, ?)',
+            [(s["id"], s["task"], s["category"], s["start"], s.get("end"))
+             for s in data.get("sessions", [])])
+        conn.executemany(
+            "INSERT INTO daily_stats (day, category, minutes) VALUES (?, ?, ?)",
+            [(day, category, minutes)
+             for day, stats in data.get("daily_stats", {}).items()
+             for category, minutes in stats.items()])
+        conn.execute("DELETE FROM sqlite_sequence WHERE name = 'sessions'")
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('sessions', ?)",
+                     (data.get("next_id", 1) - 1,))
+        conn.execute(f"PRAGMA user_version = {int(data.get('stats_format', 0))}")
+
+def _sqlite_record(op, session, delta):
+    conn = _sqlite_connect()
+    with conn:
+        if op in ("start", "create", "import"):
+            batch = session if op == "import" else [session]
+            conn.executemany(
+                'INSERT INTO sessions (id, task, category, start, "end") VALUES (?, ?, ?, ?, ?)',
+                [(s["id"], s["task"], s["category"], s["start"], s.get("end")) for s in batch])
+        elif op in ("stop", "edit"):
+            conn.execute(
+                'UPDATE sessions SET task = ?, category = ?, start = ?, "end" = ? WHERE id = ?',
+                (session["task"], session["category"], session["start"], session.get("end"), session["id"]))
+        elif op == "delete":
+            conn.execute("DELETE FROM sessions WHERE id = ?", (session["id"],))
+
+        conn.executemany(
+            "INSERT INTO daily_stats (day, category, minutes) VALUES (?, ?, ?) "
+            "ON CONFLICT (day, category) DO UPDATE SET minutes = minutes + excluded.minutes",
+            [(day, category, value)
+             for day, minutes in (delta or {}).items()
+             for category, value in minutes.items()])
+
+def _sqlite_query(since, until):
+    conn = _sqlite_connect()
+    sql = 'SELECT id, task, category, start, "end" FROM sessions WHERE 1 = 1'
+    params = []
+    if since is not None:
+        sql += " AND start >= ?"
+        params.append(since)
+    if until is not None:
+        sql += " AND start < ?"
+        params.append(until)
+    sql += " ORDER BY start DESC"
+    return [_row_to_session(row) for row in conn.execute(sql, params)]
+
+def _sqlite_page(before, limit, category, q):
+    conn = _sqlite_connect()
+    sql = 'SELECT id, task, category, start, "end" FROM sessions WHERE 1 = 1'
+    params = []
+    if before is not None:
+        # 单独写出 start <= ?，索引才能从游标位置开始查找
+        sql += " AND start <= ? AND (start < ? OR id < ?)"
+        params += [before[0], before[0], before[1]]
+    if category is not None:
+        sql += " AND category = ?"
+        params.append(category)
+    rows = conn.execute(sql + " ORDER BY start DESC, id DESC", params)
+    if q:
+        # LIKE 只对 ASCII 不区分大小写，任务名在 Python 中筛选
+        rows = (row for row in rows if q.casefold() in row[1].casefold())
+    return [_row_to_session(row) for row in islice(rows, limit)]
+
+def migrate_json(target="sqlite"):
+    """把 ~/.timelog.json（含未压缩的日志）一次性导入 SQLite 数据库
+    或列式快照（target 为 sqlite/binary）
+
+    返回导入的会话数。目标中已有的数据会被覆盖。
+    """
+    from timelog_columnar import write_columns
+    global STORAGE_MODE
+    mode = STORAGE_MODE
+    with locked():
+        try:
+            STORAGE_MODE = "json"
+            data = load_data()
+            STORAGE_MODE = target
+            if target == "binary":
+                # 日志已经并入导入的数据，换一个代号让它失效
+                data["journal_gen"] = data.get("journal_gen", 0) + 1
+                _atomic_write(BIN_FILE, lambda f: write_columns(f, data), binary=True)
+                _write_journal_header(data["journal_gen"])
+            else:
+                save_data(data)
+        finally:
+            STORAGE_MODE = mode
+    return len(data["sessions"])
+
+class DataStore:
+    """进程内数据缓存
+
+    只解析一次数据文件，之后仅在数据文件的修改时间、大小
+    变化时（例如命令行写入后）才重新读取。网页服务器的所有请求
+    共用同一份已解析的数据。
+    """
+
+    def __init__(self):
+        # 修改数据的请求需要持有该锁
+        self.lock = threading.RLock()
+        # 数据变化时通知等待者（网页推送用）
+        self.changed = threading.Condition(self.lock)
+        self._data = None
+        self._signature = None
+        self._current = None
+        self._by_id = None
+        self._index = None
+        self._rollup = None
+        # 每次数据变化加一，可用于判断缓存是否过期
+        self.version = 0
+        # 最近一次变化 (操作, 会话 id)，外部写入导致的重新加载记为 reload
+        self.last_change = None
+
+    def _file_signature(self):
+        return file_signature()
+
+    def _reindex(self):
+        """重建索引"""
+        sessions = self._data.get("sessions", [])
+        self._current = find_open_session(sessions)
+        # id 索引、时间索引和分层汇总在第一次用到时再建
+        self._by_id = None
+        self._index = None
+        self._rollup = None
+        self._changed("reload", None)
+
+    def _changed(self, op, session_id):
+        """版本号加一并唤醒等待者，调用方需持有锁"""
+        self.version += 1
+        self.last_change = (op, session_id)
+        self.changed.notify_all()
+
+    def get(self):
+        """获取数据，文件有变化时重新加载"""
+        with self.lock:
+            signature = self._file_signature()
+            if self._data is None or signature != self._signature:
+                self._data = load_data()
+                self._signature = signature
+                self._reindex()
+            return self._data
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """加锁的读-改-写，返回最新数据
+
+        同时持有进程内锁和跨进程文件锁，加锁后再检查一次数据文件，
+        期间命令行写入的修改不会被覆盖。修改通过 record_change 保存。
+        """
+        with self.lock, locked():
+            yield self.get()
+
+    def current_session(self):
+        """当前正在进行的会话"""
+        with self.lock:
+            self.get()
+            return self._current
+
+    def peek_current(self):
+        """当前正在进行的会话（只供读取）
+
+        缓存有效时直接返回；数据文件变了（例如命令行刚写入）时先读
+        当前会话指针，不为查看状态重新加载全部数据。
+        """
+        with self.lock:
+            if self._data is not None and self._file_signature() == self._signature:
+                return self._current
+        valid, session = _read_pointer()
+        if valid:
+            return session
+        return self.current_session()
+
+    def find_session(self, session_id):
+        """按 id 查找会话，不存在时返回 None"""
+        with self.lock:
+            data = self.get()
+            if self._by_id is None:
+                self._by_id = {session["id"]: session for session in data.get("sessions", [])}
+            return self._by_id.get(session_id)
+
+    def position(self, session):
+        """会话在列表中的位置"""
+        sessions = self.get()["sessions"]
+        for i in range(len(sessions) - 1, -1, -1):
+            if sessions[i] is session:
+                return i
+        return None
+
+    def rollup(self):
+        """每日统计的周、月、年汇总（见 timelog_engine.StatsRollup）
+
+        第一次用到时建好，之后随每次修改增量更新。调用方持有 self.lock
+        时可以安全使用返回的对象。
+        """
+        with self.lock:
+            data = self.get()
+            if self._rollup is None:
+                self._rollup = StatsRollup(data.setdefault("daily_stats", {}))
+            return self._rollup
+
+    def query_sessions(self, since=None, until=None):
+        """按开始时间查询会话（参数同 query_sessions）
+
+        非 sqlite 模式下走内存中的时间索引，不再逐条解析和排序。
+        """
+        if STORAGE_MODE == "sqlite":
+            return query_sessions(since, until)
+        with self.lock:
+            data = self.get()
+            sessions = data.get("sessions", [])
+            if hasattr(sessions, "range"):
+                # binary 模式直接在开始时间列上查找
+                result = sessions.range(since, until)
+                if result is not None:
+                    return result
+            if self._index is None:
+                self._index = SessionIndex(data.get("sessions", []))
+            return self._index.range(since, until)
+
+    def page_sessions(self, before=None, limit=50, category=None, q=None):
+        """按 (开始时间, id) 分页查询会话（参数同 page_sessions）
+
+        非 sqlite 模式下从时间索引中 before 的位置往前取，
+        翻到多深都只处理这一页附近的会话。
+        """
+        if STORAGE_MODE == "sqlite":
+            return page_sessions(before, limit, category, q)
+        with self.lock:
+            data = self.get()
+            sessions = data.get("sessions", [])
+            # binary 模式直接在快照的开始时间列上查找
+            ordered = sessions.before(before) if hasattr(sessions, "before") else None
+            if ordered is None:
+                if self._index is None:
+                    self._index = SessionIndex(sessions)
+                ordered = self._index.before(before)
+            return list(islice(filter(session_filter(category, q), ordered), limit))
+
+    def record_change(self, op, session=None, index=None, delta=None):
+        """持久化对缓存数据的修改（参数同 record_change）"""
+        with self.lock:
+            try:
+                record_change(self._data, op, session, index, delta)
+            except Exception:
+                # 内存和文件可能已经不一致，下次重新加载
+                self.invalidate()
+                raise
+            self._signature = self._file_signature()
+
+            if self._by_id is not None:
+                if op == "delete":
+                    self._by_id.pop(session["id"], None)
+                else:
+                    self._by_id[session["id"]] = session
+
+            # 增量更新时间索引（stop 不改变开始时间）
+            if self._index is not None:
+                if op in ("start", "create"):
+                    self._index.add(session)
+                elif op == "edit":
+                    self._index.replace(session)
+                elif op == "delete":
+                    self._index.remove(session["id"])
+            if self._rollup is not None:
+                self._rollup.apply(delta)
+            self._current = _next_current(self._current, op, session)
+            self._changed(op, session["id"])
+
+    def record_import(self, sessions, delta):
+        """持久化批量导入（参数同 record_import）"""
+        with self.lock:
+            try:
+                record_import(self._data, sessions, delta)
+            except Exception:
+                self.invalidate()
+                raise
+            self._signature = self._file_signature()
+
+            if self._by_id is not None:
+                for session in sessions:
+                    self._by_id[session["id"]] = session
+            # 逐个插入时间索引比重建还慢，下次用到时再建；
+            # 导入的会话都已结束，当前会话不变
+            self._index = None
+            if self._rollup is not None:
+                self._rollup.apply(delta)
+            self._changed("import", None)
+
+    def save(self):
+        """整体保存缓存中的数据（例如重建每日统计之后）"""
+        with self.lock:
+            try:
+                save_data(self._data)
+            except Exception:
+                self.invalidate()
+                raise
+            self._signature = self._file_signature()
+            # 每日统计可能被整体替换（例如重建之后）
+            self._rollup = None
+            self._changed("save", None)
+
+    def wait_for_change(self, version, timeout):
+        """等待数据版本不同于 version，返回当前版本
+
+        最多等待 timeout 秒；超时后会检查一次数据文件，
+        这样命令行或其他进程写入的变化也能被发现。
+        """
+        with self.changed:
+            self.get()
+            if self.version == version:
+                self.changed.wait(timeout)
+                self.get()
+            return self.version
+
+    def invalidate(self):
+        """丢弃缓存"""
+        with self.lock:
+            self._data = None
+            self._signature = None
+            self._current = None
+            self._by_id = None
+            self._index = None
+            self._rollup = None
+            # 等待者醒来后会重新加载数据
+            self.changed.notify_all()
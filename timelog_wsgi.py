@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+TimeLog 生产模式 Web 服务
+`timelog web --threads M --workers N` 时使用
+
+优先用 waitress（固定大小的线程池、HTTP/1.1 长连接）；没有安装时
+退回 werkzeug 服务器，同样用固定大小的线程池处理请求。
+POSIX 下 workers 大于 1 时先绑定端口，再 fork 出多个进程共用。
+收到 Ctrl+C 或 SIGTERM 后停止接受新连接，等正在处理的请求结束再退出。
+"""
+
+import importlib.util
+import os
+import signal
+import socket
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_THREADS = 8
+
+# 空闲的长连接保留这么多秒
+KEEPALIVE_SECONDS = 15
+
+def waitress_available():
+    """是否安装了 waitress"""
+    return importlib.util.find_spec("waitress") is not None
+
+def _listen(host, port):
+    """绑定监听端口（fork 前完成，子进程共用同一个套接字）"""
+    return socket.create_server((host, port), backlog=1024)
+
+def _on_stop_signal(stop):
+    """Ctrl+C 和 SIGTERM 时调用 stop()，只处理第一次"""
+    stopping = []
+
+    def handler(signum, frame):
+        if stopping:
+            return
+        stopping.append(signum)
+        stop()
+
+    signal.signal(signal.SIGINT, handler)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, handler)
+
+def _serve_waitress(app, sock, threads, on_shutdown):
+    from waitress import create_server
+
+    server = create_server(app, sockets=[sock], threads=threads, ident="TimeLog",
+                           channel_timeout=KEEPALIVE_SECONDS * 8)
+
+    def stop():
+        on_shutdown()
+        # run() 捕获 SystemExit 后等待工作线程处理完手上的请求
+        raise SystemExit
+
+    _on_stop_signal(stop)
+    server.run()
+
+def _serve_werkzeug(app, sock, threads, on_shutdown):
+    from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+    class KeepAliveHandler(WSGIRequestHandler):
+        # HTTP/1.1 才会复用连接；空闲连接超时后释放线程
+        protocol_version = "HTTP/1.1"
+        timeout = KEEPALIVE_SECONDS
+
+    class PooledServer(BaseWSGIServer):
+        """请求交给固定大小的线程池处理"""
+
+        def __init__(self):
+            host, port = sock.getsockname()[:2]
+            super().__init__(host, port, app, handler=KeepAliveHandler, fd=sock.fileno())
+            self.pool = ThreadPoolExecutor(threads, thread_name_prefix="timelog-http")
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self._process_request, request, client_address)
+
+        def _process_request(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    server = PooledServer()
+
+    def stop():
+        on_shutdown()
+        # shutdown() 会等待 serve_forever 退出，不能在它所在的线程里调用
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    _on_stop_signal(stop)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        server.pool.shutdown(wait=True)
+
+def _serve_socket(app, sock, threads, on_shutdown):
+    if waitress_available():
+        _serve_waitress(app, sock, threads, on_shutdown)
+    else:
+        _serve_werkzeug(app, sock, threads, on_shutdown)
+
+def serve(app, host="localhost", port=5000, threads=DEFAULT_THREADS, workers=1, on_shutdown=None):
+    """用生产模式服务器运行 app，直到收到停止信号
+
+    on_shutdown 在开始关闭时调用，用来结束推送等长连接。
+    """
+    if on_shutdown is None:
+        on_shutdown = lambda: None
+    if workers > 1 and not hasattr(os, "fork"):
+        print("⚠️  当前系统不支持多进程，使用单进程运行", file=sys.stderr)
+        workers = 1
+
+    sock = _listen(host, port)
+    if workers == 1:
+        _serve_socket(app, sock, threads, on_shutdown)
+        sock.close()
+        return
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _serve_socket(app, sock, threads, on_shutdown)
+            finally:
+                os._exit(0)
+        children.append(pid)
+
+    # 主进程只转发停止信号并等待子进程退出
+    def stop():
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    _on_stop_signal(stop)
+    for pid in children:
+        os.waitpid(pid, 0)
+    sock.close()
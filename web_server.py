@@ -5,90 +5,92 @@ TimeLog Web Server
 """
 
 from flask import Flask, render_template, request, jsonify, redirect, url_for, Response
-import json
+from werkzeug.http import http_date, is_resource_modified, quote_etag
 import os
-from datetime import datetime, date, timedelta
+import sys
+import base64
+import io
+import csv
+import json
+from datetime import datetime, date, timedelta, timezone
 from collections import defaultdict
 import webbrowser
 import threading
 import time
-from io import BytesIO
-
-# 复用 timelog_simple.py 中的数据处理函数
-DATA_FILE = os.path.expanduser("~/.timelog.json")
-
-def load_data():
-    """加载时间日志数据"""
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {"sessions": [], "daily_stats": {}}
-
-def save_data(data):
-    """保存时间日志数据"""
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-
-def get_current_session(data):
-    """获取当前正在进行的会话"""
-    for session in reversed(data.get("sessions", [])):
-        if session.get("end") is None:
-            return session
-    return None
-
-def calculate_duration(start_time, end_time):
-    """计算时长（分钟）"""
-    start = datetime.fromisoformat(start_time)
-    end = datetime.fromisoformat(end_time)
-    return (end - start).total_seconds() / 60
-
-def update_daily_stats(data, session):
-    """更新每日统计"""
-    if session.get("end") is None:
-        return
-    
-    session_date = datetime.fromisoformat(session["start"]).date().isoformat()
-    category = session["category"]
-    duration = calculate_duration(session["start"], session["end"])
-    
-    if "daily_stats" not in data:
-        data["daily_stats"] = {}
-    
-    if session_date not in data["daily_stats"]:
-        data["daily_stats"][session_date] = {"study": 0, "game": 0, "other": 0}
-    
-    data["daily_stats"][session_date][category] += duration
+import functools
+import hashlib
 
-def get_current_stats_with_active(data, target_date=None):
-    """获取包含当前正在进行任务的统计数据"""
-    if target_date is None:
-        target_date = date.today().isoformat()
-    
-    # 获取已完成任务的统计
-    daily_stats = data.get("daily_stats", {})
-    current_stats = daily_stats.get(target_date, {"study": 0, "game": 0, "other": 0}).copy()
-    
-    # 检查是否有正在进行的任务
-    current_session = get_current_session(data)
-    
-    # 如果有正在进行的任务，计算其到当前时间的时长
+# 数据读写和统计计算与命令行共用
+from timelog_store import DataStore, add_io_listener, data_file_size, file_signature, new_session_id, clear_data as remove_data_files
+from timelog_engine import (GROUPS, Session, add_active, apply_delta, get_current_stats_with_active, merge_delta,
+                            session_delta, diff_daily_stats, update_daily_stats)
+from timelog_analytics import rebuild_daily_stats
+from timelog_report import ReportJobs, missing_libraries, render_pdf
+from timelog_wsgi import DEFAULT_THREADS, serve, waitress_available
+from timelog_import import InvalidImport, add_sessions, decode, parse_records, validate
+from timelog_metrics import Metrics, MetricsMiddleware, ROUTE_KEY, CONTENT_TYPE as METRICS_CONTENT_TYPE, slow_ms_from_env
+
+# 进程内共享的数据缓存，文件变化时自动重新加载
+store = DataStore()
+
+# /stats 可选的统计周期（天），另外还有 today（今天）和 all（全部历史）
+STATS_PERIODS = (7, 14, 30, 90, 365)
+
+def get_range_stats(days, today, group="day"):
+    """最近 days 天按天、周、月或年汇总的 {桶: {类别: 分钟}}，包含当前正在进行的任务
+
+    由每日统计的分层汇总拼出（见 StatsRollup）：完整的周、月、年直接取
+    汇总表，两端零散的部分再拆成更小的桶，范围再长查找次数也差不多。
+    """
+    start = today - timedelta(days=days - 1)
+    with store.lock:
+        range_stats = store.rollup().grouped(start, today, group)
+        current_session = store.current_session()
+    return add_active(range_stats, start, today, group, current_session)
+
+def all_time_days(today=None):
+    """全部历史的天数：从最早的记录（或正在进行的任务的开始日期）到今天"""
+    if today is None:
+        today = date.today()
+    with store.lock:
+        first = store.rollup().first_day()
+        current_session = store.current_session()
     if current_session:
-        session_start = datetime.fromisoformat(current_session["start"])
-        session_date = session_start.date().isoformat()
-        
-        # 只有当任务是在目标日期开始的才计入该日期
-        if session_date == target_date:
-            current_duration = (datetime.now() - session_start).total_seconds() / 60
-            category = current_session["category"]
-            current_stats[category] += current_duration
-    
-    return current_stats, current_session
+        first = min(first or today, current_session.start_time.date())
+    return max(1, (today - first).days + 1) if first else 1
+
+def stats_group(days):
+    """统计周期的明细粒度：90 天以内逐日，两年以内按月，更长按年"""
+    if days <= 90:
+        return "day"
+    return "month" if days <= 730 else "year"
+
+def parse_stats_period(days_param):
+    """解析统计周期参数（today、all 或天数），返回 (天数, 页面上选中的值)
+
+    天数不是整数时抛出 ValueError。
+    """
+    if days_param == 'today':
+        return 1, 'today'
+    if days_param == 'all':
+        return all_time_days(), 'all'
+    days = int(days_param)
+    return days, days
+
+def get_period_stats(days):
+    """最近N天的统计，长周期按月或按年汇总（见 stats_group）"""
+    group = stats_group(days)
+    if group == "day":
+        return get_recent_stats(days)
+    return get_grouped_stats(days, group)
 
 def get_recent_stats(days=7):
     """获取最近N天的统计数据"""
-    data = load_data()
     today = date.today()
     
+    # 一次计算整个范围的每日统计（包含当前正在进行的任务）
+    range_stats = get_range_stats(days, today)
+    
     # 收集每日统计
     daily_data = {}
     total_study = 0
@@ -99,10 +101,7 @@ def get_recent_stats(days=7):
     
     for i in range(days-1, -1, -1):
         day = today - timedelta(days=i)
-        day_str = day.isoformat()
-        
-        # 使用包含当前任务的统计
-        day_stats, current_session = get_current_stats_with_active(data, day_str)
+        day_stats = range_stats[day.isoformat()]
         
         # 转换为小时
         study_hours = round(day_stats["study"] / 60, 1)
@@ -144,19 +143,166 @@ def get_recent_stats(days=7):
         "active_days": active_days
     }
 
+def get_grouped_stats(days, group):
+    """最近N天按周、月或年汇总的统计
+
+    结构同 get_recent_stats：daily_stats 的键为 YYYY-Www、YYYY-MM 或 YYYY，
+    max_daily_study 为单个周期的最大值，active_days 为有记录的周期数。
+    """
+    range_stats = get_range_stats(days, date.today(), group)
+    
+    daily_data = {}
+    for key, stats in range_stats.items():
+        daily_data[key] = {category: round(stats[category] / 60, 1) for category in ("study", "game", "other")}
+    
+    return {
+        "daily_stats": daily_data,
+        "total_study": sum(stats["study"] for stats in daily_data.values()),
+        "total_game": sum(stats["game"] for stats in daily_data.values()),
+        "total_other": sum(stats["other"] for stats in daily_data.values()),
+        "max_daily_study": max((stats["study"] for stats in daily_data.values()), default=0),
+        "active_days": sum(1 for stats in daily_data.values() if sum(stats.values()) > 0)
+    }
+
 # 创建 Flask 应用
-app = Flask(__name__)
+def asset_root():
+    """templates 和 static 所在的目录
+
+    打包版不把它们打进程序里（见 timelog.spec），而是放在可执行文件旁边。
+    """
+    if getattr(sys, 'frozen', False):
+        return os.path.dirname(sys.executable)
+    return os.path.dirname(os.path.abspath(__file__))
+
+app = Flask(__name__, root_path=asset_root())
 app.config['JSON_AS_ASCII'] = False
 
+# 运行指标（见 timelog_metrics），慢请求阈值可由 run_server 的 slow_ms 覆盖
+metrics = Metrics(slow_ms_from_env())
+add_io_listener(metrics.observe_io)
+app.wsgi_app = MetricsMiddleware(app.wsgi_app, metrics)
+
+@app.before_request
+def record_route():
+    """把匹配到的 URL 规则记在 environ 中，作为请求耗时的 route 标签"""
+    if request.url_rule is not None:
+        request.environ[ROUTE_KEY] = request.url_rule.rule
+
+def with_store_lock(view):
+    """修改数据的接口串行执行，并持有跨进程文件锁
+
+    避免并发修改共享缓存，也避免覆盖命令行同时写入的数据。
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with store.transaction():
+            return view(*args, **kwargs)
+    return wrapper
+
+# ---- HTTP 缓存 ----
+# 页面和读接口带 ETag / Last-Modified，数据没有变化时条件请求直接返回 304，
+# 不渲染模板、不计算统计。ETag 由数据文件签名算出：每次写入（包括命令行）
+# 都会变化，多个进程（--workers）之间也一致；store.version 只在本进程内
+# 计数，重启后从头开始，不能用作 ETag。
+
+# 启动标记，升级后重启时之前的 ETag 全部失效
+CACHE_EPOCH = f"{time.time_ns():x}"
+
+# 有正在进行的任务时，响应中的实时时长按这个间隔（秒）更新
+LIVE_CACHE_SECONDS = 60
+
+def cache_validators(live=True):
+    """当前数据的 (ETag, Last-Modified)
+
+    ETag 还包含当天日期（"今天"、最近 N 天随日期变化）。live 为真且有
+    正在进行的任务时，响应里的时长随时间变化：ETag 带上当前分钟，
+    并标为弱 ETag，也不发送 Last-Modified。
+    Last-Modified 取数据文件修改时间和今天零点中较晚的一个：过了零点
+    "今天"的内容就变了，只带 If-Modified-Since 的请求也不能再得到 304。
+    它只精确到秒，一秒内刚修改过（或刚过零点）时不发送，避免同一秒内的
+    两次修改被当作没有变化。
+    """
+    signature = file_signature()
+    today = date.today()
+    parts = [CACHE_EPOCH, repr(signature), today.isoformat()]
+    weak = live and store.peek_current() is not None
+    if weak:
+        parts.append(str(int(time.time() // LIVE_CACHE_SECONDS)))
+    etag = quote_etag(hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:20], weak)
+
+    last_modified = None
+    mtime_ns = max((entry[0] for entry in signature if entry), default=None)
+    if not weak and mtime_ns is not None:
+        midnight_ns = int(datetime.combine(today, datetime.min.time()).timestamp()) * 1_000_000_000
+        modified_ns = max(mtime_ns, midnight_ns)
+        if time.time_ns() - modified_ns >= 1_000_000_000:
+            last_modified = datetime.fromtimestamp(modified_ns // 1_000_000_000, timezone.utc)
+    return etag, last_modified
+
+def cache_headers(etag, last_modified):
+    """条件请求相关的响应头 [(名称, 值)]
+
+    no-cache 允许浏览器和反向代理保存响应，但每次使用前都要重新验证。
+    """
+    headers = [("ETag", etag), ("Cache-Control", "no-cache")]
+    if last_modified is not None:
+        headers.append(("Last-Modified", http_date(last_modified)))
+    return headers
+
+def conditional(live=True):
+    """只读页面和接口的条件 GET
+
+    请求带的 If-None-Match / If-Modified-Since 与当前数据一致时返回 304，
+    不执行视图函数。live 见 cache_validators，响应里没有实时时长的接口传 False。
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            etag, last_modified = cache_validators(live)
+            if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                response = app.response_class(status=304)
+                del response.headers['Content-Type']
+            else:
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.headers.extend(cache_headers(etag, last_modified))
+            return response
+        return wrapper
+    return decorator
+
+@app.url_defaults
+def static_version(endpoint, values):
+    """静态文件的链接带上文件修改时间（?v=），内容变化后链接随之变化"""
+    if endpoint == 'static' and 'filename' in values and 'v' not in values:
+        try:
+            values['v'] = int(os.path.getmtime(os.path.join(app.static_folder, values['filename'])))
+        except OSError:
+            pass
+
+# 带版本号的静态文件可以长期缓存
+STATIC_MAX_AGE = 365 * 24 * 3600
+
+@app.after_request
+def static_cache_headers(response):
+    """带版本号的静态文件长期缓存；不带的仍按 ETag / Last-Modified 重新验证"""
+    if request.endpoint == 'static' and 'v' in request.args and response.status_code in (200, 304):
+        response.cache_control.public = True
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = STATIC_MAX_AGE
+        response.cache_control.immutable = True
+    return response
+
 @app.route('/')
+@conditional()
 def index():
     """首页仪表板"""
-    data = load_data()
-    current_session = get_current_session(data)
+    data = store.get()
+    current_session = store.current_session()
     
     # 今日统计（包含当前正在进行的任务）
     today = date.today().isoformat()
-    today_stats_raw, _ = get_current_stats_with_active(data, today)
+    today_stats_raw, _ = get_current_stats_with_active(data, current_session, today)
     
     today_stats = {
         "study": round(today_stats_raw["study"] / 60, 1),
@@ -167,8 +313,8 @@ def index():
     # 当前会话信息
     current_info = None
     if current_session:
-        start_time = datetime.fromisoformat(current_session["start"])
-        duration = (datetime.now() - start_time).total_seconds() / 60
+        start_time = current_session.start_time
+        duration = current_session.duration()
         current_info = {
             "task": current_session["task"],
             "category": current_session["category"],
@@ -182,15 +328,15 @@ def index():
                          current_date=datetime.now().strftime("%Y年%m月%d日"))
 
 @app.route('/tasks')
+@conditional()
 def tasks():
     """任务管理页面"""
-    data = load_data()
-    current_session = get_current_session(data)
+    current_session = store.current_session()
     
     current_info = None
     if current_session:
-        start_time = datetime.fromisoformat(current_session["start"])
-        duration = (datetime.now() - start_time).total_seconds() / 60
+        start_time = current_session.start_time
+        duration = current_session.duration()
         current_info = {
             "task": current_session["task"],
             "category": current_session["category"],
@@ -201,24 +347,24 @@ def tasks():
     return render_template('tasks.html', current_session=current_info)
 
 @app.route('/stats')
+@conditional()
 def stats():
     """统计分析页面"""
     # 从URL参数获取天数，默认为今天
     days_param = request.args.get('days', 'today')
     
-    # 处理"今天"选项
-    if days_param == 'today':
-        days = 1
-        selected_days = 'today'
-    else:
-        days = int(days_param)
-        selected_days = days
-        # 限制天数范围
-        if days not in [7, 14, 30, 90]:
-            days = 7
-            selected_days = 7
-    
-    recent_stats = get_recent_stats(days)
+    try:
+        days, selected_days = parse_stats_period(days_param)
+    except ValueError:
+        days, selected_days = 7, 7
+    # 限制天数范围
+    if selected_days not in ('today', 'all') and days not in STATS_PERIODS:
+        days = 7
+        selected_days = 7
+    
+    # 一年、全部历史按月或按年汇总
+    group = stats_group(days)
+    recent_stats = get_period_stats(days)
     
     # 如果是"今天"选项，还需要获取7天的趋势数据用于图表
     trend_stats = None
@@ -228,150 +374,304 @@ def stats():
     return render_template('stats.html', 
                          recent_stats=recent_stats, 
                          selected_days=selected_days,
+                         period_days=days,
+                         group=group,
                          trend_stats=trend_stats)
 
-@app.route('/history')
-def history():
-    """历史记录页面"""
-    data = load_data()
-    sessions = data.get("sessions", [])
-    
-    # 获取最近30天的会话，同时保留原始索引
-    cutoff_date = datetime.now() - timedelta(days=30)
-    recent_sessions_with_index = []
-    
-    for i, session in enumerate(sessions):
-        if datetime.fromisoformat(session["start"]) >= cutoff_date:
-            recent_sessions_with_index.append((i, session))
-    
-    # 按时间排序（最新的在前）
-    recent_sessions_with_index.sort(key=lambda x: x[1]["start"], reverse=True)
+# 历史记录每页条数，以及 /api/sessions 的 limit 上限
+HISTORY_PAGE_SIZE = 50
+HISTORY_PAGE_MAX = 200
+
+def history_row(session):
+    """历史记录表格中的一行"""
+    start_time = session.start_time
+    duration = session.duration()
     
-    # 处理会话数据
-    processed_sessions = []
-    for original_index, session in recent_sessions_with_index:
-        start_time = datetime.fromisoformat(session["start"])
-        
-        if session.get("end"):
-            end_time = datetime.fromisoformat(session["end"])
-            duration = calculate_duration(session["start"], session["end"])
-            end_time_str = end_time.strftime("%H:%M")
-            end_date_str = end_time.strftime("%Y-%m-%d")
-            duration_hours = duration / 60.0  # 转换为小时
-        else:
-            duration = (datetime.now() - start_time).total_seconds() / 60
-            end_time_str = None
-            end_date_str = None
-            duration_hours = duration / 60.0  # 转换为小时
-        
-        processed_sessions.append({
-            "original_index": original_index,  # 保留原始索引
-            "task": session["task"],
-            "category": session["category"],
-            "date": start_time.strftime("%Y-%m-%d"),
-            "start_time": start_time.strftime("%H:%M"),
-            "end_time": end_time_str,
-            "end_date": end_date_str,
-            "duration_hours": round(duration_hours, 1) if duration_hours > 0 else None
-        })
+    if session.get("end"):
+        end_time = session.end_time
+        end_time_str = end_time.strftime("%H:%M")
+        end_date_str = end_time.strftime("%Y-%m-%d")
+    else:
+        end_time_str = None
+        end_date_str = None
+    duration_hours = duration / 60.0  # 转换为小时
     
-    return render_template('history.html', sessions=processed_sessions)
+    return {
+        "id": session["id"],
+        "task": session["task"],
+        "category": session["category"],
+        "date": start_time.strftime("%Y-%m-%d"),
+        "start_time": start_time.strftime("%H:%M"),
+        "end_time": end_time_str,
+        "end_date": end_date_str,
+        "duration_hours": round(duration_hours, 1) if duration_hours > 0 else None
+    }
 
-@app.route('/api/start_task', methods=['POST'])
-def start_task():
-    """开始任务 API"""
-    task_name = request.json.get('task')
-    category = request.json.get('category', 'study')
+def encode_cursor(session):
+    """分页游标：该会话的 (开始时间, id)，编码成不透明的字符串"""
+    raw = json.dumps([session["start"], session["id"]]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor):
+    """解析分页游标，无效时抛出 ValueError"""
+    try:
+        start, session_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        datetime.fromisoformat(start)
+    except (ValueError, TypeError):
+        raise ValueError("无效的分页游标")
+    if not isinstance(session_id, int):
+        raise ValueError("无效的分页游标")
+    return start, session_id
+
+def do_list_sessions(cursor=None, limit=None, category=None, q=None):
+    """分页的会话列表，最新的在前
+
+    按 (开始时间, id) 分页：cursor 为上一页返回的 next_cursor，没有更多时
+    next_cursor 为 null。翻页期间新增或删除会话不会导致重复或遗漏。
+    """
+    try:
+        before = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return {"success": False, "message": str(e)}
+    try:
+        limit = int(limit) if limit else HISTORY_PAGE_SIZE
+    except ValueError:
+        return {"success": False, "message": "limit 应为整数"}
+    if not 1 <= limit <= HISTORY_PAGE_MAX:
+        return {"success": False, "message": f"limit 应在 1 到 {HISTORY_PAGE_MAX} 之间"}
+    if category and category not in ["study", "game", "other"]:
+        return {"success": False, "message": "无效的任务类别"}
+    
+    # 多取一条，判断后面是否还有
+    sessions = store.page_sessions(before, limit + 1, category or None, q or None)
+    next_cursor = encode_cursor(sessions[limit - 1]) if len(sessions) > limit else None
+    return {
+        "success": True,
+        "sessions": [history_row(session) for session in sessions[:limit]],
+        "next_cursor": next_cursor
+    }
+
+@app.route('/history')
+@conditional()
+def history():
+    """历史记录页面
+
+    只渲染第一页，往下滚动时由页面通过 /api/sessions 继续加载。
+    """
+    page = do_list_sessions()
+    return render_template('history.html', sessions=page["sessions"], next_cursor=page["next_cursor"],
+                           page_size=HISTORY_PAGE_SIZE)
+
+@app.route('/api/sessions')
+@conditional()
+def list_sessions():
+    """分页获取会话列表 API
+
+    参数: cursor（上一页的 next_cursor）、limit、category、q（任务名包含的文字）
+    """
+    return jsonify(do_list_sessions(request.args.get('cursor'), request.args.get('limit'),
+                                    request.args.get('category'), request.args.get('q')))
+
+# 以下 do_* 函数是 JSON 接口的实际处理逻辑，返回要输出的 dict，
+# Flask 路由和异步接口（timelog_asgi）共用。修改数据的函数要求调用方
+# 已进入 store.transaction()。
+
+def do_start_task(payload):
+    """开始任务"""
+    task_name = payload.get('task')
+    category = payload.get('category', 'study')
     
     if not task_name:
-        return jsonify({"success": False, "message": "任务名不能为空"})
+        return {"success": False, "message": "任务名不能为空"}
     
-    data = load_data()
+    data = store.get()
     
     # 检查是否有正在进行的任务
-    current_session = get_current_session(data)
+    current_session = store.current_session()
     if current_session:
         current_session["end"] = datetime.now().isoformat()
-        update_daily_stats(data, current_session)
+        delta = update_daily_stats(data, current_session)
+        store.record_change("stop", current_session, delta=delta)
     
     # 开始新任务
-    session = {
-        "task": task_name,
-        "category": category,
-        "start": datetime.now().isoformat(),
-        "end": None
-    }
+    session = Session(new_session_id(data), task_name, category, datetime.now().isoformat())
     
     if "sessions" not in data:
         data["sessions"] = []
     
     data["sessions"].append(session)
-    save_data(data)
+    store.record_change("start", session)
     
-    return jsonify({"success": True, "message": f"已开始{category}任务: {task_name}"})
+    return {"success": True, "message": f"已开始{category}任务: {task_name}"}
 
-@app.route('/api/stop_task', methods=['POST'])
-def stop_task():
-    """停止任务 API"""
-    data = load_data()
-    current_session = get_current_session(data)
+@app.route('/api/start_task', methods=['POST'])
+@with_store_lock
+def start_task():
+    """开始任务 API"""
+    return jsonify(do_start_task(request.json))
+
+def do_stop_task():
+    """停止当前任务"""
+    data = store.get()
+    current_session = store.current_session()
     
     if not current_session:
-        return jsonify({"success": False, "message": "没有正在进行的任务"})
+        return {"success": False, "message": "没有正在进行的任务"}
     
     current_session["end"] = datetime.now().isoformat()
-    duration = calculate_duration(current_session["start"], current_session["end"])
-    update_daily_stats(data, current_session)
-    save_data(data)
+    duration = current_session.duration()
+    delta = update_daily_stats(data, current_session)
+    store.record_change("stop", current_session, delta=delta)
     
-    return jsonify({
+    return {
         "success": True, 
         "message": f"已结束任务: {current_session['task']}",
         "duration": round(duration, 1)
-    })
+    }
 
-@app.route('/api/current_status')
-def current_status():
-    """获取当前状态 API"""
-    data = load_data()
-    current_session = get_current_session(data)
+@app.route('/api/stop_task', methods=['POST'])
+@with_store_lock
+def stop_task():
+    """停止任务 API"""
+    return jsonify(do_stop_task())
+
+def current_status_info():
+    """当前状态（/api/current_status 和推送共用）
+
+    只用到当前会话指针，不加载会话列表。
+    """
+    current_session = store.peek_current()
     
     if current_session:
-        start_time = datetime.fromisoformat(current_session["start"])
-        duration = (datetime.now() - start_time).total_seconds() / 60
-        return jsonify({
+        start_time = current_session.start_time
+        duration = current_session.duration()
+        return {
             "active": True,
             "task": current_session["task"],
             "category": current_session["category"],
             "duration": round(duration, 1),
             "start_time": start_time.strftime("%H:%M")
-        })
+        }
     else:
-        return jsonify({"active": False})
+        return {"active": False}
 
-@app.route('/api/stats_data')
-def stats_data():
-    """获取统计数据 API"""
-    days_param = request.args.get('days', 'today')
+@app.route('/api/current_status')
+def current_status():
+    """获取当前状态 API"""
+    return jsonify(current_status_info())
+
+# 推送连接每隔这么多秒检查一次数据文件，发现命令行或其他进程写入的变化
+EVENTS_CHECK_SECONDS = 2
+# 推送连接无变化时每隔这么多秒发送一次心跳
+EVENTS_HEARTBEAT_SECONDS = 15
+
+# 服务器开始关闭时置位，推送连接随之结束
+shutting_down = threading.Event()
+
+# 本进程同时打开的推送连接的名额，None 表示不限（开发服务器每个连接一个线程）。
+# 生产模式下每个推送连接一直占着线程池的一个线程，名额用完后返回 503，
+# 页面改为轮询，见 limit_event_streams
+event_slots = None
+
+def limit_event_streams(limit):
+    """限制本进程同时打开的推送连接数，0 表示不提供推送"""
+    global event_slots
+    event_slots = threading.BoundedSemaphore(limit) if limit else threading.Semaphore(0)
+
+def stop_event_streams():
+    """结束所有推送连接，让工作线程尽快空出来"""
+    shutting_down.set()
+    with store.changed:
+        store.changed.notify_all()
+
+def sse_message(event, payload):
+    """格式化一条 Server-Sent Events 消息"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def iter_events():
+    """推送数据变化：连接时先发一次 status，之后每次变化发 change"""
+    # 断线后浏览器 5 秒后自动重连
+    yield "retry: 5000\n\n"
+    
+    with store.lock:
+        store.get()
+        version = store.version
+        status = current_status_info()
+    yield sse_message("status", {"version": version, "status": status})
+    
+    last_sent = time.monotonic()
+    while not shutting_down.is_set():
+        with store.lock:
+            new_version = store.wait_for_change(version, EVENTS_CHECK_SECONDS)
+            if new_version != version:
+                op, session_id = store.last_change
+                status = current_status_info()
+        if shutting_down.is_set():
+            return
+        if new_version == version:
+            if time.monotonic() - last_sent >= EVENTS_HEARTBEAT_SECONDS:
+                # 心跳注释，保持连接并及时发现客户端断开
+                yield ": ping\n\n"
+                last_sent = time.monotonic()
+            continue
+        last_sent = time.monotonic()
+        version = new_version
+        yield sse_message("change", {
+            "version": version,
+            "op": op,
+            "id": session_id,
+            "status": status
+        })
+
+@app.route('/api/events')
+def events():
+    """状态推送 API（Server-Sent Events）
+
+    推送连接数达到上限时返回 503，浏览器的 EventSource 不会重连，页面改为轮询。
+    """
+    slots = event_slots
+    if slots is not None and not slots.acquire(blocking=False):
+        return jsonify({"success": False, "message": "推送连接已满，请改用轮询"}), 503
+    response = Response(iter_events(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    if slots is not None:
+        released = threading.Event()
+
+        def release():
+            # 连接关闭（包括还没开始发送就断开）时归还名额，重复关闭只归还一次
+            if not released.is_set():
+                released.set()
+                slots.release()
+
+        response.call_on_close(release)
+    return response
+
+def do_stats_data(days_param, group):
+    """统计数据，days_param 为天数、today 或 all"""
+    days, _ = parse_stats_period(days_param)
     
-    # 处理"今天"选项
-    if days_param == 'today':
-        days = 1
-    else:
-        days = int(days_param)
+    if group not in GROUPS:
+        return {"success": False, "message": "group 只能是 day、week、month 或 year"}
     
-    stats = get_recent_stats(days)
-    return jsonify(stats)
+    if group == 'day':
+        return get_recent_stats(days)
+    return get_grouped_stats(days, group)
 
-@app.route('/api/get_session/<int:session_id>')
-def get_session(session_id):
-    """获取单个任务详情"""
-    data = load_data()
-    sessions = data.get("sessions", [])
+@app.route('/api/stats_data')
+@conditional()
+def stats_data():
+    """获取统计数据 API
+
+    days=all 为全部历史；group=week/month/year 时按周、月或年汇总，适合较长的范围。
+    """
+    return jsonify(do_stats_data(request.args.get('days', 'today'), request.args.get('group', 'day')))
+
+def do_get_session(session_id):
+    """单个任务详情"""
+    session = store.find_session(session_id)
     
-    if 0 <= session_id < len(sessions):
-        session = sessions[session_id]
-        return jsonify({
+    if session:
+        return {
             "success": True,
             "session": {
                 "id": session_id,
@@ -384,24 +684,26 @@ def get_session(session_id):
                 "end_date": session["end"][:10] if session.get("end") else "",
                 "end_time": session["end"][11:16] if session.get("end") else ""
             }
-        })
+        }
     else:
-        return jsonify({"success": False, "message": "任务不存在"})
+        return {"success": False, "message": "任务不存在"}
 
-@app.route('/api/update_session/<int:session_id>', methods=['POST'])
-def update_session(session_id):
+@app.route('/api/get_session/<int:session_id>')
+@conditional(live=False)
+def get_session(session_id):
+    """获取单个任务详情"""
+    return jsonify(do_get_session(session_id))
+
+def do_update_session(session_id, update_data):
     """更新任务信息"""
-    data = load_data()
-    sessions = data.get("sessions", [])
-    
-    if not (0 <= session_id < len(sessions)):
-        return jsonify({"success": False, "message": "任务不存在"})
+    data = store.get()
+    old_session = store.find_session(session_id)
     
-    session = sessions[session_id]
-    old_session = session.copy()
+    if not old_session:
+        return {"success": False, "message": "任务不存在"}
     
-    # 获取更新数据
-    update_data = request.json
+    # 在副本上修改，校验失败时不影响缓存中的数据
+    session = old_session.copy()
     
     try:
         # 更新任务名称
@@ -411,7 +713,7 @@ def update_session(session_id):
         # 更新类别
         if "category" in update_data:
             if update_data["category"] not in ["study", "game", "other"]:
-                return jsonify({"success": False, "message": "无效的任务类别"})
+                return {"success": False, "message": "无效的任务类别"}
             session["category"] = update_data["category"]
         
         # 更新时间
@@ -441,32 +743,18 @@ def update_session(session_id):
         
         # 验证时间逻辑
         if session.get("end"):
-            start_dt = datetime.fromisoformat(session["start"])
-            end_dt = datetime.fromisoformat(session["end"])
-            if end_dt <= start_dt:
-                return jsonify({"success": False, "message": "结束时间必须晚于开始时间"})
+            if session.end_time <= session.start_time:
+                return {"success": False, "message": "结束时间必须晚于开始时间"}
         
-        # 更新每日统计
-        # 首先移除旧的统计
-        if old_session.get("end"):
-            old_start = datetime.fromisoformat(old_session["start"])
-            old_end = datetime.fromisoformat(old_session["end"])
-            old_date = old_start.date().isoformat()
-            old_duration = (old_end - old_start).total_seconds() / 60
-            old_category = old_session["category"]
-            
-            if "daily_stats" in data and old_date in data["daily_stats"]:
-                data["daily_stats"][old_date][old_category] -= old_duration
-                if data["daily_stats"][old_date][old_category] < 0:
-                    data["daily_stats"][old_date][old_category] = 0
-        
-        # 添加新的统计
-        if session.get("end"):
-            update_daily_stats(data, session)
+        # 更新每日统计：撤销旧会话、加上新会话，只改动涉及的那几天
+        delta = merge_delta(session_delta(old_session, -1), session_delta(session))
+        apply_delta(data, delta)
         
-        save_data(data)
+        index = store.position(old_session)
+        data["sessions"][index] = session
+        store.record_change("edit", session, index=index, delta=delta)
         
-        return jsonify({
+        return {
             "success": True,
             "message": "任务更新成功",
             "session": {
@@ -476,58 +764,59 @@ def update_session(session_id):
                 "start": session["start"],
                 "end": session.get("end")
             }
-        })
+        }
         
     except ValueError as e:
-        return jsonify({"success": False, "message": f"时间格式错误: {str(e)}"})
+        return {"success": False, "message": f"时间格式错误: {str(e)}"}
     except Exception as e:
-        return jsonify({"success": False, "message": f"更新失败: {str(e)}"})
+        return {"success": False, "message": f"更新失败: {str(e)}"}
 
-@app.route('/api/delete_session/<int:session_id>', methods=['DELETE'])
-def delete_session(session_id):
+@app.route('/api/update_session/<int:session_id>', methods=['POST'])
+@with_store_lock
+def update_session(session_id):
+    """更新任务信息"""
+    return jsonify(do_update_session(session_id, request.json))
+
+def do_delete_session(session_id):
     """删除任务"""
-    data = load_data()
-    sessions = data.get("sessions", [])
+    data = store.get()
+    session = store.find_session(session_id)
     
-    if not (0 <= session_id < len(sessions)):
-        return jsonify({"success": False, "message": "任务不存在"})
-    
-    session = sessions[session_id]
+    if not session:
+        return {"success": False, "message": "任务不存在"}
     
+
     # 从每日统计中移除
-    if session.get("end"):
-        start_time = datetime.fromisoformat(session["start"])
-        session_date = start_time.date().isoformat()
-        duration = calculate_duration(session["start"], session["end"])
-        category = session["category"]
-        
-        if "daily_stats" in data and session_date in data["daily_stats"]:
-            data["daily_stats"][session_date][category] -= duration
-            if data["daily_stats"][session_date][category] < 0:
-                data["daily_stats"][session_date][category] = 0
+    delta = session_delta(session, -1)
+    apply_delta(data, delta)
     
     # 删除任务
-    sessions.pop(session_id)
-    save_data(data)
+    index = store.position(session)
+    data["sessions"].pop(index)
+    store.record_change("delete", session, index=index, delta=delta)
     
-    return jsonify({"success": True, "message": "任务删除成功"})
+    return {"success": True, "message": "任务删除成功"}
 
-@app.route('/api/create_session', methods=['POST'])
-def create_session():
+@app.route('/api/delete_session/<int:session_id>', methods=['DELETE'])
+@with_store_lock
+def delete_session(session_id):
+    """删除任务"""
+    return jsonify(do_delete_session(session_id))
+
+def do_create_session(create_data):
     """创建新任务"""
-    data = load_data()
-    create_data = request.json
+    data = store.get()
     
     try:
         # 验证必需字段
         required_fields = ["task", "category", "start_date", "start_time"]
         for field in required_fields:
             if field not in create_data or not create_data[field]:
-                return jsonify({"success": False, "message": f"缺少必需字段: {field}"})
+                return {"success": False, "message": f"缺少必需字段: {field}"}
         
         # 验证类别
         if create_data["category"] not in ["study", "game", "other"]:
-            return jsonify({"success": False, "message": "无效的任务类别"})
+            return {"success": False, "message": "无效的任务类别"}
         
         # 构建时间
         start_datetime = f"{create_data['start_date']}T{create_data['start_time']}:00"
@@ -543,17 +832,11 @@ def create_session():
         if end_datetime:
             end_dt = datetime.fromisoformat(end_datetime)
             if end_dt <= start_dt:
-                return jsonify({"success": False, "message": "结束时间必须晚于开始时间"})
+                return {"success": False, "message": "结束时间必须晚于开始时间"}
         
         # 创建新任务
-        new_session = {
-            "task": create_data["task"],
-            "category": create_data["category"],
-            "start": start_datetime
-        }
-        
-        if end_datetime:
-            new_session["end"] = end_datetime
+        new_session = Session(new_session_id(data), create_data["task"], create_data["category"],
+                              start_datetime, end_datetime)
         
         # 添加到会话列表
         if "sessions" not in data:
@@ -561,198 +844,381 @@ def create_session():
         data["sessions"].append(new_session)
         
         # 更新每日统计
+        delta = None
         if end_datetime:
-            update_daily_stats(data, new_session)
+            delta = update_daily_stats(data, new_session)
         
-        save_data(data)
+        store.record_change("create", new_session, delta=delta)
         
-        return jsonify({
+        return {
             "success": True,
             "message": "任务创建成功",
-            "session": new_session
-        })
+            "session": new_session.to_dict()
+        }
         
     except ValueError as e:
-        return jsonify({"success": False, "message": f"时间格式错误: {str(e)}"})
+        return {"success": False, "message": f"时间格式错误: {str(e)}"}
     except Exception as e:
-        return jsonify({"success": False, "message": f"创建失败: {str(e)}"})
+        return {"success": False, "message": f"创建失败: {str(e)}"}
+
+@app.route('/api/create_session', methods=['POST'])
+@with_store_lock
+def create_session():
+    """创建新任务"""
+    return jsonify(do_create_session(request.json))
+
+# 批量导入按 Content-Type 判断格式
+BULK_CONTENT_TYPES = {
+    'application/json': 'json',
+    'application/x-ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+    'text/csv': 'csv'
+}
+
+@app.route('/api/sessions/bulk', methods=['POST'])
+def bulk_create_sessions():
+    """批量创建任务 API
+
+    请求体为 JSON 数组（或带 sessions 字段的对象）、NDJSON 或 CSV，
+    格式由 format 参数或 Content-Type 决定，字段同 create_session
+    （也可直接给 start/end）。整批校验通过后一次写入，否则不导入任何记录，
+    返回 400 和出错的行号。
+    """
+    fmt = request.args.get('format') or BULK_CONTENT_TYPES.get(request.mimetype, 'json')
+    
+    # 解析和校验不需要持有锁
+    try:
+        sessions = validate(parse_records(decode(request.get_data()), fmt))
+    except InvalidImport as e:
+        return jsonify({
+            "success": False,
+            "message": str(e),
+            "error_count": e.total,
+            "errors": [{"row": row, "message": reason} for row, reason in e.errors]
+        }), 400
+    
+    with store.transaction() as data:
+        added, delta = add_sessions(data, sessions)
+        store.record_import(added, delta)
+    
+    return jsonify({
+        "success": True,
+        "message": f"已导入 {len(added)} 条任务",
+        "imported": len(added),
+        "first_id": added[0]["id"],
+        "last_id": added[-1]["id"]
+    })
 
 @app.route('/api/clear_data', methods=['POST'])
+@with_store_lock
 def clear_data():
     """清除所有数据 API"""
-    if os.path.exists(DATA_FILE):
-        os.remove(DATA_FILE)
+    remove_data_files()
+    store.invalidate()
     return jsonify({"success": True, "message": "所有数据已清除"})
 
+def check_daily_stats(repair):
+    """从任务记录重新计算每日统计并和缓存比较，repair 时覆盖保存
+
+    返回检查结果（含各阶段耗时，毫秒），最多列出 100 处不一致。
+    """
+    timings = {}
+    started = time.perf_counter()
+    data = store.get()
+    timings["load_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    
+    started = time.perf_counter()
+    expected = rebuild_daily_stats(data.get("sessions", []))
+    timings["rebuild_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    
+    started = time.perf_counter()
+    mismatches = diff_daily_stats(expected, data.get("daily_stats", {}))
+    timings["compare_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    
+    repaired = False
+    if repair:
+        started = time.perf_counter()
+        data["daily_stats"] = expected
+        store.save()
+        timings["save_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        repaired = True
+    
+    return {
+        "success": True,
+        "sessions": len(data.get("sessions", [])),
+        "days": len(expected),
+        "consistent": not mismatches,
+        "mismatch_count": len(mismatches),
+        "mismatches": [
+            {"date": day, "category": category, "expected": round(want, 3), "actual": round(have, 3)}
+            for day, category, want, have in mismatches[:100]
+        ],
+        "repaired": repaired,
+        "timings": timings
+    }
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """运行指标（Prometheus 文本格式）"""
+    gauges = [
+        ("timelog_data_file_bytes", "数据文件总大小（字节）", data_file_size()),
+        ("timelog_sessions", "会话条数", len(store.get().get("sessions", [])))
+    ]
+    return Response(metrics.render(gauges), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/api/admin/verify')
+def admin_verify():
+    """检查每日统计 API"""
+    with store.lock:
+        return jsonify(check_daily_stats(repair=False))
+
+@app.route('/api/admin/reindex', methods=['POST'])
+@with_store_lock
+def admin_reindex():
+    """重建每日统计 API"""
+    return jsonify(check_daily_stats(repair=True))
+
 def open_browser():
     """延迟打开浏览器"""
     time.sleep(1.5)
     webbrowser.open('http://localhost:5000')
 
-def run_server(port=5000, debug=False, open_browser_flag=True):
-    """运行服务器"""
-    if open_browser_flag:
-        threading.Thread(target=open_browser, daemon=True).start()
+def run_server(port=5000, debug=False, open_browser_flag=True, host='localhost', threads=None, workers=None,
+               async_mode=False, slow_ms=None):
+    """运行服务器
+
+    async_mode 时使用异步接口（见 timelog_asgi，需要 uvicorn）；指定
+    threads 或 workers 时使用生产模式服务器（见 timelog_wsgi），
+    否则使用 Flask 自带的开发服务器。slow_ms 为慢请求日志的阈值（毫秒）。
+    """
+    global report_jobs_enabled
+    production = threads is not None or workers is not None
+    if slow_ms is not None:
+        metrics.slow_ms = slow_ms
+    
+    if async_mode:
+        from timelog_asgi import AsyncAPI, serve as serve_async, uvicorn_available
+        if not uvicorn_available():
+            print("❌ 异步模式需要安装 uvicorn")
+            print("请运行: pip install uvicorn")
+            return
     
     print(f"🌐 TimeLog Web 服务器启动中...")
-    print(f"📱 访问地址: http://localhost:{port}")
+    print(f"📱 访问地址: http://{host}:{port}")
+    if async_mode:
+        threads = threads or DEFAULT_THREADS
+        if workers and workers > 1:
+            print("⚠️  异步模式只使用一个进程，忽略 --workers")
+        print(f"⚙️  异步模式: uvicorn，{threads} 个线程读取数据，修改逐个写入")
+    elif production:
+        threads = threads or DEFAULT_THREADS
+        workers = workers or 1
+        server_name = "waitress" if waitress_available() else "werkzeug"
+        print(f"⚙️  生产模式: {server_name}，{workers} 个进程 × {threads} 个线程")
+        # 推送连接最多占一半线程，其余留给普通请求
+        limit_event_streams(threads // 2)
+        report_jobs_enabled = workers == 1
+        print(f"   每个进程最多 {threads // 2} 个页面接收推送，其余页面改为轮询")
+    if metrics.slow_ms is not None:
+        print(f"🐢 慢请求日志: 超过 {metrics.slow_ms:g} ms 的请求输出到标准错误")
     print(f"⏹️  按 Ctrl+C 停止服务器")
     
-    app.run(host='localhost', port=port, debug=debug)
+    if async_mode:
+        if open_browser_flag:
+            threading.Thread(target=open_browser, daemon=True).start()
+        serve_async(AsyncAPI(app, threads, on_shutdown=report_jobs.shutdown), host=host, port=port)
+        return
+    
+    if production:
+        # fork 之后再启动线程
+        if open_browser_flag and workers == 1:
+            threading.Thread(target=open_browser, daemon=True).start()
+        serve(app, host=host, port=port, threads=threads, workers=workers, on_shutdown=stop_event_streams)
+        report_jobs.shutdown()
+        return
+    
+    if open_browser_flag:
+        threading.Thread(target=open_browser, daemon=True).start()
+    app.run(host=host, port=port, debug=debug)
+
+# 导出时每攒够这么多行输出一次
+EXPORT_CHUNK_ROWS = 500
+
+EXPORT_CATEGORY_MAP = {
+    'study': '📚 学习',
+    'game': '🎮 游戏',
+    'other': '📋 其他'
+}
+
+EXPORT_CSV_HEADER = "开始日期,开始时间,结束日期,结束时间,任务,类别,时长(小时)"
+
+def parse_export_range(args):
+    """解析导出范围参数，返回 (since, until) ISO 字符串
+
+    from/to 为 YYYY-MM-DD（包含两端）；all=1 导出全部历史；
+    都不提供时默认最近30天。
+    """
+    if args.get('all') == '1':
+        return None, None
+    
+    date_from = args.get('from')
+    date_to = args.get('to')
+    if not date_from and not date_to:
+        return (datetime.now() - timedelta(days=30)).isoformat(), None
+    
+    since = date.fromisoformat(date_from).isoformat() if date_from else None
+    until = (date.fromisoformat(date_to) + timedelta(days=1)).isoformat() if date_to else None
+    return since, until
+
+def export_csv_row(session):
+    """一条会话对应的 CSV 行"""
+    start_time = session.start_time
+    
+    if session.get("end"):
+        end_time = session.end_time
+        end_date = end_time.strftime("%Y-%m-%d")
+        end_time_str = end_time.strftime("%H:%M")
+        duration_hours = round((end_time - start_time).total_seconds() / 3600, 1)
+    else:
+        end_date = ""
+        end_time_str = ""
+        duration_hours = ""
+    
+    return [
+        start_time.strftime("%Y-%m-%d"),
+        start_time.strftime("%H:%M"),
+        end_date,
+        end_time_str,
+        session["task"],
+        EXPORT_CATEGORY_MAP.get(session["category"], session["category"]),
+        duration_hours
+    ]
+
+def iter_export_csv(sessions):
+    """逐块生成 CSV 内容"""
+    yield EXPORT_CSV_HEADER + '\n'
+    
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_ALL, lineterminator='\n')
+    for start in range(0, len(sessions), EXPORT_CHUNK_ROWS):
+        writer.writerows(export_csv_row(s) for s in sessions[start:start + EXPORT_CHUNK_ROWS])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+def iter_export_json(sessions):
+    """逐块生成 JSON 内容"""
+    yield '{"exportDate": %s, "totalRecords": %d, "sessions": [' % (
+        json.dumps(datetime.now().isoformat()), len(sessions))
+    for start in range(0, len(sessions), EXPORT_CHUNK_ROWS):
+        chunk = ', '.join(json.dumps(s.to_dict(), ensure_ascii=False)
+                          for s in sessions[start:start + EXPORT_CHUNK_ROWS])
+        yield (', ' if start else '') + chunk
+    yield ']}'
+
+def iter_export_ndjson(sessions):
+    """逐块生成 JSON Lines 内容，每行一条记录"""
+    for start in range(0, len(sessions), EXPORT_CHUNK_ROWS):
+        yield ''.join(json.dumps(s.to_dict(), ensure_ascii=False) + '\n'
+                      for s in sessions[start:start + EXPORT_CHUNK_ROWS])
+
+def encode_chunks(chunks, encoding, bom=''):
+    """把文本块编码为字节流"""
+    if bom:
+        yield bom.encode(encoding)
+    for chunk in chunks:
+        yield chunk.encode(encoding)
+
+def can_encode_gbk(sessions):
+    """检查导出内容能否用 GBK 编码"""
+    try:
+        EXPORT_CSV_HEADER.encode('gbk')
+        for session in sessions:
+            session["task"].encode('gbk')
+            EXPORT_CATEGORY_MAP.get(session["category"], session["category"]).encode('gbk')
+    except UnicodeEncodeError:
+        return False
+    return True
 
 @app.route('/api/export_data')
 def export_data():
-    """导出历史数据API"""
+    """导出历史数据API（流式输出）
+    
+    参数：format=csv/json/ndjson，encoding=utf-8/gbk（仅CSV），
+    from/to=YYYY-MM-DD 或 all=1
+    """
     format_type = request.args.get('format', 'csv')
     encoding = request.args.get('encoding', 'utf-8')
     
-    data = load_data()
-    sessions = data.get("sessions", [])
-    
-    # 获取最近30天的会话
-    cutoff_date = datetime.now() - timedelta(days=30)
-    recent_sessions = [s for s in sessions 
-                      if datetime.fromisoformat(s["start"]) >= cutoff_date]
+    try:
+        since, until = parse_export_range(request.args)
+    except ValueError:
+        return jsonify({"success": False, "message": "日期格式错误，应为 YYYY-MM-DD"})
     
-    # 按时间排序（最新的在前）
-    recent_sessions.sort(key=lambda x: x["start"], reverse=True)
+    # 查询结果只是会话引用的列表，内容在输出时逐块生成（最新的在前）
+    sessions = store.query_sessions(since=since, until=until)
+    filename_date = datetime.now().strftime("%Y%m%d")
     
     if format_type == 'json':
-        # JSON格式
-        export_data = {
-            "exportDate": datetime.now().isoformat(),
-            "totalRecords": len(recent_sessions),
-            "sessions": recent_sessions
-        }
-        
-        response = jsonify(export_data)
-        response.headers['Content-Disposition'] = f'attachment; filename=timelog_export_{datetime.now().strftime("%Y%m%d")}.json'
-        return response
-        
+        response = Response(encode_chunks(iter_export_json(sessions), 'utf-8'),
+                            mimetype='application/json')
+        filename = f'timelog_export_{filename_date}.json'
+    elif format_type == 'ndjson':
+        response = Response(encode_chunks(iter_export_ndjson(sessions), 'utf-8'),
+                            mimetype='application/x-ndjson')
+        filename = f'timelog_export_{filename_date}.ndjson'
     else:
-        # CSV格式
-        csv_lines = ["开始日期,开始时间,结束日期,结束时间,任务,类别,时长(小时)"]
-        
-        for session in recent_sessions:
-            start_time = datetime.fromisoformat(session["start"])
-            start_date = start_time.strftime("%Y-%m-%d")
-            start_time_str = start_time.strftime("%H:%M")
-            
-            if session.get("end"):
-                end_time = datetime.fromisoformat(session["end"])
-                end_date = end_time.strftime("%Y-%m-%d")
-                end_time_str = end_time.strftime("%H:%M")
-                duration = calculate_duration(session["start"], session["end"])
-                duration_hours = round(duration / 60.0, 1)
-            else:
-                end_date = ""
-                end_time_str = ""
-                duration_hours = ""
-            
-            # 处理类别显示
-            category_map = {
-                'study': '📚 学习',
-                'game': '🎮 游戏', 
-                'other': '📋 其他'
-            }
-            category_display = category_map.get(session["category"], session["category"])
-            
-            csv_line = f'"{start_date}","{start_time_str}","{end_date}","{end_time_str}","{session["task"]}","{category_display}","{duration_hours}"'
-            csv_lines.append(csv_line)
-        
-        csv_content = '\n'.join(csv_lines)
-        
-        # 根据编码创建响应
-        if encoding == 'gbk':
-            try:
-                csv_bytes = csv_content.encode('gbk')
-                response = Response(csv_bytes, mimetype='text/csv; charset=gbk')
-            except UnicodeEncodeError:
-                # 如果GBK编码失败，使用UTF-8
-                csv_bytes = ('\ufeff' + csv_content).encode('utf-8')
-                response = Response(csv_bytes, mimetype='text/csv; charset=utf-8')
+        # 根据编码创建响应，GBK 无法表示的内容退回 UTF-8
+        if encoding == 'gbk' and can_encode_gbk(sessions):
+            response = Response(encode_chunks(iter_export_csv(sessions), 'gbk'),
+                                content_type='text/csv; charset=gbk')
         else:
             # UTF-8编码，添加BOM
-            csv_bytes = ('\ufeff' + csv_content).encode('utf-8')
-            response = Response(csv_bytes, mimetype='text/csv; charset=utf-8')
-        
-        filename = f'timelog_export_{datetime.now().strftime("%Y%m%d")}.csv'
-        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
-        return response
+            response = Response(encode_chunks(iter_export_csv(sessions), 'utf-8', bom='\ufeff'),
+                                content_type='text/csv; charset=utf-8')
+        filename = f'timelog_export_{filename_date}.csv'
+    
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
 
-@app.route('/api/export_pdf')
-def export_pdf():
-    """导出统计数据为PDF"""
-    try:
-        from reportlab.lib.pagesizes import A4
-        from reportlab.lib.units import inch, mm
-        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak, Image as ReportLabImage
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.lib import colors
-        from reportlab.pdfbase import pdfmetrics
-        from reportlab.pdfbase.ttfonts import TTFont
-        from reportlab.graphics.shapes import Drawing, Circle, Rect, String
-        from reportlab.graphics.charts.piecharts import Pie
-        from reportlab.graphics.charts.barcharts import VerticalBarChart
-        from reportlab.graphics import renderPDF
-        import matplotlib
-        matplotlib.use('Agg')  # 使用非交互式后端
-        import matplotlib.pyplot as plt
-        import matplotlib.font_manager as fm
-        from io import BytesIO
-        import base64
-        
-        # 注册中文字体
-        try:
-            # Windows 系统字体路径
-            font_paths = [
-                "C:/Windows/Fonts/msyh.ttc",  # 微软雅黑
-                "C:/Windows/Fonts/simhei.ttf",  # 黑体
-                "C:/Windows/Fonts/simsun.ttc"   # 宋体
-            ]
-            
-            chinese_font = 'Helvetica'  # 默认字体
-            for font_path in font_paths:
-                if os.path.exists(font_path):
-                    try:
-                        pdfmetrics.registerFont(TTFont('ChineseFont', font_path))
-                        chinese_font = 'ChineseFont'
-                        break
-                    except:
-                        continue
-        except:
-            chinese_font = 'Helvetica'
-        
-        # 设置matplotlib中文字体
-        try:
-            plt.rcParams['font.sans-serif'] = ['Microsoft YaHei', 'SimHei', 'DejaVu Sans']
-            plt.rcParams['axes.unicode_minus'] = False
-        except:
-            pass
-        
-    except ImportError as e:
-        missing_libs = []
-        if 'reportlab' in str(e):
-            missing_libs.append('reportlab')
-        if 'matplotlib' in str(e):
-            missing_libs.append('matplotlib')
-        return jsonify({"success": False, "message": f"PDF功能需要安装库: pip install {' '.join(missing_libs)}"})
-    
-    # 获取参数
-    days_param = request.args.get('days', 'today')
+# 后台生成PDF报告的任务队列
+report_jobs = ReportJobs()
+
+# /api/export_pdf 最多等待报告生成这么多秒
+REPORT_WAIT_SECONDS = 120
+
+# 任务只保存在本进程内存中。多进程（--workers）时查询进度和下载的请求
+# 可能落到别的进程上，这时不提供后台任务，改用 /api/export_pdf 一次生成并下载
+report_jobs_enabled = True
+
+def submit_report_job(days_param):
+    """提交PDF报告任务，返回 (任务, 错误信息)"""
+    missing_libs = missing_libraries()
+    if missing_libs:
+        return None, f"PDF功能需要安装库: pip install {' '.join(missing_libs)}"
     
-    # 处理"今天"选项
-    if days_param == 'today':
-        days = 1
-        selected_days = 'today'
+    try:
+        days, selected_days = parse_stats_period(days_param)
+    except ValueError:
+        return None, "无效的统计周期"
+    if selected_days == 'today':
         period_name = "今天"
+    elif selected_days == 'all':
+        period_name = "全部历史"
     else:
-        days = int(days_param)
-        selected_days = days
         period_name = f"最近{days}天"
     
-    # 获取统计数据
-    recent_stats = get_recent_stats(days)
+    # 数据没有变化时复用之前生成的报告；有正在进行的任务时时长每分钟都在变
+    now = datetime.now()
+    current_session = store.current_session()
+    cache_key = (days_param, store.version, date.today().isoformat(),
+                 now.strftime("%H:%M") if current_session else None)
+    job = report_jobs.find(cache_key)
+    if job:
+        return job, None
+    
+    # 获取统计数据，长周期按月或按年汇总
+    recent_stats = get_period_stats(days)
     
     # 为"今天"选项单独获取7天趋势数据
     if selected_days == 'today':
@@ -760,295 +1226,99 @@ def export_pdf():
     else:
         trend_stats = recent_stats  # 其他选项使用相同数据
     
-    # 获取详细任务数据
-    data = load_data()
-    sessions = data.get("sessions", [])
-    cutoff_date = datetime.now() - timedelta(days=days if selected_days != 'today' else 1)
-    
+    # 获取详细任务数据（按时间排序，最新的在前）
     if selected_days == 'today':
         # 今天的任务
-        today_date = date.today()
-        detailed_sessions = [s for s in sessions 
-                           if datetime.fromisoformat(s["start"]).date() == today_date]
+        today = date.today()
+        detailed_sessions = store.query_sessions(since=today.isoformat(),
+                                                 until=(today + timedelta(days=1)).isoformat())
     else:
         # 指定天数内的任务
-        detailed_sessions = [s for s in sessions 
-                           if datetime.fromisoformat(s["start"]) >= cutoff_date]
-    
-    # 按时间排序
-    detailed_sessions.sort(key=lambda x: x["start"], reverse=True)
-    
-    # 创建PDF
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(
-        buffer, 
-        pagesize=A4, 
-        rightMargin=50, 
-        leftMargin=50, 
-        topMargin=50, 
-        bottomMargin=50
-    )
-    
-    # 自定义样式
-    styles = getSampleStyleSheet()
-    
-    # 标题样式
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Title'],
-        fontName=chinese_font,
-        fontSize=28,
-        spaceAfter=30,
-        alignment=1,  # 居中
-        textColor=colors.HexColor('#2C3E50'),
-        borderWidth=1,
-        borderColor=colors.HexColor('#3498DB'),
-        borderRadius=5,
-        backColor=colors.HexColor('#ECF0F1'),
-        borderPadding=20
-    )
-    
-    # 副标题样式
-    subtitle_style = ParagraphStyle(
-        'CustomSubtitle',
-        parent=styles['Normal'],
-        fontName=chinese_font,
-        fontSize=14,
-        spaceAfter=20,
-        alignment=1,
-        textColor=colors.HexColor('#7F8C8D')
-    )
-    
-    # 章节标题样式
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading1'],
-        fontName=chinese_font,
-        fontSize=18,
-        spaceAfter=15,
-        spaceBefore=20,
-        textColor=colors.HexColor('#2980B9'),
-        borderWidth=0,
-        borderColor=colors.HexColor('#3498DB'),
-        backColor=colors.HexColor('#F8F9FA'),
-        leftIndent=10,
-        borderPadding=8
-    )
-    
-    # 正文样式
-    normal_style = ParagraphStyle(
-        'CustomNormal',
-        parent=styles['Normal'],
-        fontName=chinese_font,
-        fontSize=11,
-        spaceAfter=8,
-        leading=16
-    )
-    
-    # 重点文本样式
-    highlight_style = ParagraphStyle(
-        'Highlight',
-        parent=styles['Normal'],
-        fontName=chinese_font,
-        fontSize=12,
-        textColor=colors.HexColor('#E74C3C'),
-        spaceAfter=6
-    )
-    
-    # 构建PDF内容
-    story = []
-    
-    # 封面
-    story.append(Spacer(1, 50))
-    story.append(Paragraph("TimeLog 统计报告", title_style))
-    story.append(Spacer(1, 20))
-    story.append(Paragraph(f"统计周期：{period_name} | 生成时间：{datetime.now().strftime('%Y年%m月%d日 %H:%M:%S')}", subtitle_style))
-    story.append(Spacer(1, 60))
-    
-    # 创建时间分布饼图
-    total_time = recent_stats['total_study'] + recent_stats['total_game'] + recent_stats['total_other']
-    if total_time > 0:
-        # 添加饼图标题
-        story.append(Paragraph("时间分布统计", heading_style))
-        story.append(Spacer(1, 15))
-        
-        fig, ax = plt.subplots(figsize=(10, 10))  # 增大figure尺寸
-        # 调整子图位置，为标题留更多空间
-        plt.subplots_adjust(top=0.85, bottom=0.15, left=0.15, right=0.85)
-        
-        sizes = [recent_stats['total_study'], recent_stats['total_game'], recent_stats['total_other']]
-        labels = ['学习', '游戏', '其他']
-        colors_pie = ['#3498DB', '#E74C3C', '#F39C12']
-        
-        # 只显示非零的部分
-        non_zero_data = [(size, label, color) for size, label, color in zip(sizes, labels, colors_pie) if size > 0]
-        if non_zero_data:
-            sizes_nz, labels_nz, colors_nz = zip(*non_zero_data)
-            
-            wedges, texts, autotexts = ax.pie(sizes_nz, labels=labels_nz, colors=colors_nz, 
-                                             autopct='%1.1f%%', startangle=90,
-                                             textprops={'fontsize': 28})  # 进一步增大标签字体
-            ax.set_title(f'{period_name}时间分布', fontsize=32, fontweight='bold', pad=40)  # 进一步增大标题字体
-            ax.set_aspect('equal')  # 确保饼图为正圆
-            
-            # 美化饼图 - 进一步增大所有字体
-            for text in texts:
-                text.set_fontsize(26)  # 进一步增大标签字体
-                text.set_fontweight('bold')
-                
-            for autotext in autotexts:
-                autotext.set_color('white')
-                autotext.set_fontweight('bold')
-                autotext.set_fontsize(24)  # 进一步增大百分比字体
-        
-        # 不使用tight_layout，手动控制布局
-        img_buffer = BytesIO()
-        plt.savefig(img_buffer, format='png', dpi=150, bbox_inches=None,  # 使用None而不是tight
-                   facecolor='white', edgecolor='none')  # 确保背景和边缘设置
-        img_buffer.seek(0)
-        plt.close()
-        
-        # 将图片添加到PDF，调整合适尺寸
-        img_size = 400  # 稍微缩小饼图尺寸
-        story.append(ReportLabImage(img_buffer, width=img_size, height=img_size))
-        story.append(Spacer(1, 30))
-    
-    # 每日统计图表
-    if trend_stats['daily_stats']:
-        story.append(Paragraph("每日时间趋势", heading_style))
-        story.append(Spacer(1, 15))
-        
-        # 创建每日统计柱状图
-        fig, ax = plt.subplots(figsize=(12, 8))  # 增大纵向尺寸从6到8
-        
-        # 准备数据 - 使用trend_stats
-        dates = list(trend_stats['daily_stats'].keys())
-        study_hours = [trend_stats['daily_stats'][date]['study'] for date in dates]
-        game_hours = [trend_stats['daily_stats'][date]['game'] for date in dates]
-        other_hours = [trend_stats['daily_stats'][date]['other'] for date in dates]
-        
-        # 设置柱状图
-        x = range(len(dates))
-        width = 0.6
-        
-        # 堆叠柱状图
-        bars1 = ax.bar(x, study_hours, width, label='学习', color='#3498DB', alpha=0.8)
-        bars2 = ax.bar(x, game_hours, width, bottom=study_hours, label='游戏', color='#E74C3C', alpha=0.8)
-        bars3 = ax.bar(x, other_hours, width, bottom=[i+j for i,j in zip(study_hours, game_hours)], 
-                      label='其他', color='#F39C12', alpha=0.8)
-        
-        # 设置标签和标题
-        ax.set_xlabel('日期', fontsize=18, fontweight='bold')  # 增大X轴标签字体
-        ax.set_ylabel('时间(小时)', fontsize=18, fontweight='bold')  # 增大Y轴标签字体
-        ax.set_title('每日时间分布趋势', fontsize=22, fontweight='bold', pad=25)  # 增大标题字体
-        ax.set_xticks(x)
-        ax.set_xticklabels(dates, rotation=45 if len(dates) > 7 else 0, fontsize=16)  # 增大X轴刻度字体
-        ax.legend(fontsize=16)  # 增大图例字体
-        
-        # 设置Y轴刻度字体
-        ax.tick_params(axis='y', labelsize=14)
-        
-        # 添加数值标签
-        for i, (study, game, other) in enumerate(zip(study_hours, game_hours, other_hours)):
-            total = study + game + other
-            if total > 0:
-                ax.text(i, total + 0.1, f'{total:.1f}h', ha='center', va='bottom', 
-                       fontweight='bold', fontsize=14)  # 增大数值标签字体
-        
-        # 美化图表
-        ax.grid(True, alpha=0.3, axis='y')
-        ax.set_ylim(0, max([sum([s, g, o]) for s, g, o in zip(study_hours, game_hours, other_hours)]) * 1.1)
-        
-        plt.tight_layout()
-        img_buffer = BytesIO()
-        plt.savefig(img_buffer, format='png', dpi=150, bbox_inches='tight')
-        img_buffer.seek(0)
-        plt.close()
-        
-        # 将图片添加到PDF，增大纵向尺寸
-        story.append(ReportLabImage(img_buffer, width=500, height=333))  # 增大高度，保持12:8的比例
-        story.append(Spacer(1, 20))
-    
-    # 详细任务记录
-    if detailed_sessions:
-        story.append(Paragraph("详细任务记录", heading_style))
-        story.append(Spacer(1, 15))
-        
-        task_data = [['开始时间', '结束时间', '任务名称', '类别', '时长', '状态']]
-        
-        for session in detailed_sessions[:20]:  # 只显示最近20个任务
-            start_time = datetime.fromisoformat(session["start"])
-            category_map = {'study': '学习', 'game': '游戏', 'other': '其他'}
-            category_display = category_map.get(session["category"], session["category"])
-            
-            if session.get("end"):
-                end_time = datetime.fromisoformat(session["end"])
-                duration = calculate_duration(session["start"], session["end"])
-                status = "已完成"
-                end_time_str = end_time.strftime("%H:%M")
-                duration_str = f"{duration:.0f}分钟"
-            else:
-                duration = (datetime.now() - start_time).total_seconds() / 60
-                status = "进行中"
-                end_time_str = "-"
-                duration_str = f"{duration:.0f}分钟"
-            
-            # 任务名称截取（避免过长）
-            task_name = session["task"]
-            if len(task_name) > 15:
-                task_name = task_name[:12] + "..."
-            
-            task_data.append([
-                start_time.strftime("%m-%d %H:%M"),
-                end_time_str,
-                task_name,
-                category_display,
-                duration_str,
-                status
-            ])
-        
-        task_table = Table(task_data, colWidths=[80, 70, 110, 70, 70, 80])  # 稍微增大列宽
-        task_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#D35400')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, -1), chinese_font),
-            ('FONTSIZE', (0, 0), (-1, 0), 14),  # 增大表头字体
-            ('FONTSIZE', (0, 1), (-1, -1), 12),  # 增大内容字体
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 15),  # 增大表头底部间距
-            ('TOPPADDING', (0, 0), (-1, 0), 12),  # 增加表头顶部间距
-            ('BOTTOMPADDING', (0, 1), (-1, -1), 10),  # 增加内容行底部间距
-            ('TOPPADDING', (0, 1), (-1, -1), 10),  # 增加内容行顶部间距
-            ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#FDF2E9')),
-            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#BDC3C7')),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#FDF2E9')])
-        ]))
-        
-        story.append(task_table)
-        
-        if len(detailed_sessions) > 20:
-            story.append(Spacer(1, 10))
-            story.append(Paragraph(f"... 还有 {len(detailed_sessions) - 20} 个任务记录", normal_style))
-    
-    # 页脚信息
-    story.append(Spacer(1, 30))
-    story.append(Paragraph("───────────────────────────────────────", subtitle_style))
-    story.append(Paragraph("本报告由 TimeLog 自动生成 | 持续改进，追求卓越", subtitle_style))
-    
-    # 生成PDF
-    doc.build(story)
-    buffer.seek(0)
-    
-    # 返回PDF文件
-    if selected_days == 'today':
-        filename = f'timelog_report_today_{datetime.now().strftime("%Y%m%d_%H%M")}.pdf'
+        cutoff_date = now - timedelta(days=days)
+        detailed_sessions = store.query_sessions(since=cutoff_date.isoformat())
+    # 报告只列出最近20个任务，复制一份避免后台线程读到之后的修改
+    total_sessions = len(detailed_sessions)
+    detailed_sessions = [s.copy() for s in detailed_sessions[:20]]
+    
+    if selected_days in ('today', 'all'):
+        filename = f'timelog_report_{selected_days}_{now.strftime("%Y%m%d_%H%M")}.pdf'
     else:
-        filename = f'timelog_report_{days}days_{datetime.now().strftime("%Y%m%d_%H%M")}.pdf'
+        filename = f'timelog_report_{days}days_{now.strftime("%Y%m%d_%H%M")}.pdf'
+    
+    def render(progress):
+        return render_pdf(period_name, recent_stats, trend_stats, detailed_sessions,
+                          total_sessions, progress)
     
-    response = Response(buffer.getvalue(), mimetype='application/pdf')
-    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return report_jobs.submit(cache_key, filename, render), None
+
+def report_job_info(job):
+    """任务状态（不含PDF内容）"""
+    info = {
+        "id": job["id"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "message": job["message"],
+        "filename": job["filename"]
+    }
+    if job["status"] == "done":
+        info["download_url"] = url_for('download_report', job_id=job["id"])
+    return info
+
+def pdf_response(job):
+    """返回已生成的PDF文件"""
+    response = Response(job["pdf"], mimetype='application/pdf')
+    response.headers['Content-Disposition'] = f'attachment; filename="{job["filename"]}"'
     return response
 
+@app.route('/api/reports', methods=['POST'])
+def create_report():
+    """提交PDF报告生成任务
+
+    不提供后台任务时（见 report_jobs_enabled）返回 export_url，由客户端直接下载。
+    """
+    days_param = request.args.get('days') or (request.get_json(silent=True) or {}).get('days', 'today')
+    if not report_jobs_enabled:
+        return jsonify({
+            "success": False,
+            "message": "多进程模式下不支持后台报告任务，请直接下载",
+            "export_url": url_for('export_pdf', days=days_param)
+        })
+    job, error = submit_report_job(str(days_param))
+    if error:
+        return jsonify({"success": False, "message": error})
+    return jsonify({"success": True, "job": report_job_info(job)})
+
+@app.route('/api/reports/<job_id>')
+def report_status(job_id):
+    """查询PDF报告任务进度"""
+    job = report_jobs.get(job_id)
+    if not job:
+        return jsonify({"success": False, "message": "任务不存在"})
+    return jsonify({"success": True, "job": report_job_info(job)})
+
+@app.route('/api/reports/<job_id>/download')
+def download_report(job_id):
+    """下载已生成的PDF报告"""
+    job = report_jobs.get(job_id)
+    if not job:
+        return jsonify({"success": False, "message": "任务不存在"})
+    if job["status"] != "done":
+        return jsonify({"success": False, "message": job["message"] or "报告尚未生成完成"})
+    return pdf_response(job)
+
+@app.route('/api/export_pdf')
+def export_pdf():
+    """导出统计数据为PDF（等待后台任务完成后直接返回文件）"""
+    job, error = submit_report_job(request.args.get('days', 'today'))
+    if error:
+        return jsonify({"success": False, "message": error})
+    
+    report_jobs.wait(job, REPORT_WAIT_SECONDS)
+    if not job["done"].is_set():
+        return jsonify({"success": False, "message": "生成PDF超时，请稍后重试"})
+    if job["status"] != "done":
+        return jsonify({"success": False, "message": job["message"]})
+    return pdf_response(job)
+
 if __name__ == '__main__':
     run_server()